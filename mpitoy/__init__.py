@@ -19,33 +19,45 @@ import mpitoy.simulation
 import mpitoy.particlecontainer
 
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
+# matplotlib is deliberately not imported here, see mpitoy.viz.
+
+# Precision of the arrays of Spheres for Spheres(precision=MIXED_PRECISION, vectors=True): the
+# positions stay double precision, the radii, velocities and accelerations are single precision.
+MIXED_PRECISION = {name: np.float32 for name in ('radius', 'v', 'a')}
 
 class Spheres(mpitoy.particlecontainer.ParticleContainer):
-    def __init__(self,n,name=None, id0=0):
+    def __init__(self,n,name=None, id0=0, allocator=None, precision=None, vectors=False):
         """
 
         :param n: number of particles to generate
         :param name: name of the particle container
         :param id0: number particle ids starting with id0. Allows to have distinct particle ids on different ranks.
+        :param allocator: an mpitoy.idallocator.IdAllocator. If provided, the particle ids are allocated
+            with allocator.allocate(n) (collective), and id0 is ignored.
+        :param dict precision: numpy dtype of the arrays, by name (e.g. MIXED_PRECISION). Arrays not
+            in precision are double precision. Requires vectors=True: the scalar arrays of the
+            default layout are Python lists, which cannot store single precision values.
+        :param bool vectors: store the positions, velocities and accelerations in the VectorArrays
+            r, v and a (see mpitoy.particlecontainer.VectorArray), rather than in the scalar arrays
+            rx, ry, rz, vx, ... The scalar arrays are still available, as components of the vectors.
         """
         nm = 'spheres' if name is None else name
         super().__init__(n,name=nm)
         radius = 0.5
-        self.addArray('id', 0)
-        self.addArray('radius', radius)
-        self.addArray('rx')
-        self.addArray('ry', radius)
-        self.addArray('rz', radius)
-        self.addArray('vx', 0.1)
-        self.addArray('vy', 0.0)
-        self.addArray('vz', 0.0)
-        self.addArray('ay', 0.0)
-        self.addArray('ax', 0.0)
-        self.addArray('az', 0.0)
-        for j in range(n):
-            i = self.addElement()
-            self.id[i] = id0 + i
-            self.rx[i] = (1 + 2 * i) * radius
+        precision = precision or {}
+        if precision and not vectors:
+            raise ValueError("Declaring the precision of the arrays of Spheres requires vectors=True.")
+        mpitoy.particlecontainer.IdArray(self, name='id', defaultValue=0)
+        if vectors:
+            mpitoy.particlecontainer.makeArray(self, 'radius', radius, precision=precision.get('radius'))
+            for name, defaultValue in (('r', (0.0, radius, radius)), ('v', (0.1, 0.0, 0.0)), ('a', 0.0)):
+                mpitoy.particlecontainer.VectorArray( self, name, defaultValue, precision=precision.get(name)
+                                                    , components=tuple(name + c for c in 'xyz') )
+        else:
+            for name, defaultValue in ( ('radius', radius), ('rx', None), ('ry', radius), ('rz', radius)
+                                      , ('vx', 0.1), ('vy', 0.0), ('vz', 0.0), ('ay', 0.0), ('ax', 0.0), ('az', 0.0) ):
+                mpitoy.particlecontainer.makeArray(self, name, defaultValue)
+        elements = self.addElements(n)
+        self.id.assign(elements, id0 + elements if allocator is None else allocator.allocate(n))
+        self.rx.assign(elements, (1 + 2 * elements) * radius)
 
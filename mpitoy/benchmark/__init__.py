@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module mpitoy.benchmark
+==========================
+
+A submodule for measuring the performance of mpitoy.
+
+The benchmarks are run on all ranks of a communicator, e.g.::
+
+    mpirun -np 4 python -m mpitoy.benchmark --output results.json
+
+and cover
+
+* 'particlecontainer': ParticleContainer addElement()/addElements()/kill()/grow()/clone()/packRecords()/
+  unpackRecords() throughput,
+* 'forward_euler': particle updates per second of forward_euler(),
+* 'classify': finding the leaving and the ghost particles of a BoundaryPlane (no communication),
+* 'pcsendrecv': latency and bandwidth of PcSendRecv versus the halo size (ranks 2k and 2k+1 are
+  paired, requires at least 2 ranks),
+* 'simulation': a Simulation of Spheres in ParallelSlabs with a halo exchange, with a fixed total
+  number of particles (strong scaling) and a fixed number of particles per rank (weak scaling).
+
+Every benchmark is run repeat times. Before every sample the ranks synchronize, and the time
+of a sample is the maximum over the ranks. The serial benchmarks are run on all ranks
+simultaneously, which measures them under the load of a full node.
+
+The results are a dict, which is written as JSON::
+
+    { 'meta': {'nRanks': ..., 'python': ..., 'numpy': ..., 'mpi': ..., 'host': ..., 'timestamp': ...
+              , 'repeat': ..., 'scale': ..., 'groups': [...]}
+    , 'benchmarks': { 'forward_euler[n=10000]': { 'group': 'forward_euler'
+                                                , 'params': {'n': 10000}
+                                                , 'work': 10000
+                                                , 'unit': 'particle updates'
+                                                , 'seconds': [...] # one entry per sample
+                                                }
+                    , ...
+                    }
+    }
+
+The throughput of a sample is work/seconds. Strong and weak scaling are obtained by comparing
+the 'simulation' results of runs with different numbers of ranks.
+"""
+
+import datetime
+import fnmatch
+import json
+import pickle
+import platform
+import time
+
+import numpy as np
+from mpi4py import MPI
+
+import mpitoy
+from mpitoy import Spheres
+from mpitoy.domaindecomposition import BoundaryPlane, ParallelSlabs, PcSendRecv
+from mpitoy.packing import cubicLattice, addSpheres
+from mpitoy.simulation import Simulation, forward_euler
+
+
+GROUPS = ('particlecontainer', 'forward_euler', 'classify', 'pcsendrecv', 'simulation')
+
+
+def measure(fn, comm, repeat, setup=None):
+    """Time fn repeat times on all ranks of comm (collective).
+
+    :param fn: callable, called with the return value of setup, if provided.
+    :param setup: callable preparing a sample, not timed.
+    :return: list with the time of every sample, the maximum over the ranks.
+    """
+    samples = []
+    for r in range(repeat):
+        args = (setup(),) if setup else ()
+        comm.Barrier()
+        t0 = time.perf_counter()
+        fn(*args)
+        seconds = time.perf_counter() - t0
+        samples.append(comm.allreduce(seconds, op=MPI.MAX))
+    return samples
+
+
+def _entry(group, params, work, unit, seconds):
+    name = f"{group}.{params.pop('kind')}" if 'kind' in params else group
+    name += '[' + ','.join(f'{k}={v}' for k, v in params.items()) + ']'
+    return name, {'group': group, 'params': params, 'work': work, 'unit': unit, 'seconds': seconds}
+
+
+def _spheres(n, name):
+    """Spheres on a line along x, one diameter apart."""
+    return Spheres(n, name=name)
+
+
+def benchmarkParticleContainer(comm, repeat, sizes):
+    results = {}
+    for n in sizes:
+        def addElement(pc):
+            for i in range(n):
+                pc.addElement()
+        results.update([_entry('particlecontainer', {'kind': 'addElement', 'n': n}, n, 'elements'
+                              , measure(addElement, comm, repeat, setup=lambda: _spheres(0, 'bench')))])
+        results.update([_entry('particlecontainer', {'kind': 'addElements', 'n': n}, n, 'elements'
+                              , measure(lambda pc: pc.addElements(n), comm, repeat, setup=lambda: _spheres(0, 'bench')))])
+        results.update([_entry('particlecontainer', {'kind': 'kill', 'n': n}, n, 'elements'
+                              , measure(lambda pc: pc.kill(list(range(n))), comm, repeat, setup=lambda: _spheres(n, 'bench')))])
+        def grow(pc):
+            while pc.capacity < n:
+                pc.grow()
+        results.update([_entry('particlecontainer', {'kind': 'grow', 'n': n}, n, 'elements'
+                              , measure(grow, comm, repeat, setup=lambda: _spheres(0, 'bench')))])
+        # clone 10% of the particles, as for the particles leaving a domain
+        elements = list(range(0, n, 10))
+        results.update([_entry('particlecontainer', {'kind': 'clone', 'n': n}, len(elements), 'elements'
+                              , measure(lambda pc: pc.clone(elements=elements), comm, repeat, setup=lambda: _spheres(n, 'bench')))])
+        results.update([_entry('particlecontainer', {'kind': 'packRecords', 'n': n}, len(elements), 'elements'
+                              , measure(lambda pc: pc.packRecords(elements), comm, repeat, setup=lambda: _spheres(n, 'bench')))])
+        records = _spheres(n, 'bench').packRecords(elements)
+        results.update([_entry('particlecontainer', {'kind': 'unpackRecords', 'n': n}, len(elements), 'elements'
+                              , measure(lambda pc: pc.unpackRecords(records), comm, repeat, setup=lambda: _spheres(0, 'bench')))])
+    return results
+
+
+def benchmarkForwardEuler(comm, repeat, sizes, nTimesteps=1):
+    results = {}
+    for n in sizes:
+        pc = _spheres(n, 'bench')
+        results.update([_entry('forward_euler', {'n': n}, n * nTimesteps, 'particle updates'
+                              , measure(lambda: forward_euler(pc, dt=0.01, nTimesteps=nTimesteps), comm, repeat))])
+    return results
+
+
+def benchmarkClassify(comm, repeat, sizes):
+    results = {}
+    for n in sizes:
+        pc = _spheres(n, 'bench')
+        bp = BoundaryPlane([n / 2, 0, 0], [1, 0, 0]) # half of the particles are outside
+        results.update([_entry('classify', {'kind': 'leaving', 'n': n}, n, 'particles'
+                              , measure(lambda: bp.findLeavingParticles(pc), comm, repeat))])
+        results.update([_entry('classify', {'kind': 'ghosts', 'n': n}, n, 'particles'
+                              , measure(lambda: bp.findGhostParticles(pc, ghostWidth=n / 4), comm, repeat))])
+    return results
+
+
+def benchmarkPcSendRecv(comm, repeat, haloSizes, nMessages=10):
+    """Exchange halos of haloSizes particles between ranks 2k and 2k+1 with PcSendRecv.
+
+    With an odd number of ranks, the last rank is idle. The 'bytes' field of an entry is the size
+    of the pickled arrays sent by one rank in one exchange. It is not a param, so that the name of
+    the benchmark does not change with the pickle format.
+    """
+    results = {}
+    if comm.size < 2:
+        return results
+    partner = comm.rank ^ 1
+    for h in haloSizes:
+        pc = _spheres(h, f'halo{h}')
+        nbytes = sum(len(pickle.dumps(array.packMessage(range(h)), protocol=pickle.HIGHEST_PROTOCOL)) for array in pc.arrays.values())
+        if partner < comm.size:
+            bp = BoundaryPlane([0, 0, 0], [1, 0, 0] if comm.rank % 2 else [-1, 0, 0])
+            bp.myRank, bp.nbRank, bp.comm = comm.rank, partner, comm
+            psr = PcSendRecv(pc, bp, elements=list(range(h)))
+            psr() # the first exchange adds the received elements to pc
+            def exchange():
+                for m in range(nMessages):
+                    psr()
+        else:
+            def exchange():
+                pass
+        name, entry = _entry('pcsendrecv', {'halo': h}, nMessages, 'exchanges', measure(exchange, comm, repeat))
+        entry['bytes'] = nbytes
+        results[name] = entry
+    return results
+
+
+def _slabSimulation(comm, nx, ny=4, nz=4, skin=0.5, cutoff=1.0):
+    """Set up a Simulation of a cubic lattice of nx*ny*nz Spheres with diameter 1 in the box
+    [0,nx)x[0,ny)x[0,nz), decomposed in equal slabs along x, with a halo exchange.
+    The particles move along x, in alternating directions.
+
+    :return: (sim, domain)
+    """
+    points = [[nx * r / comm.size, 0, 0] for r in range(1, comm.size)]
+    slabs = ParallelSlabs(points=points, n=[1, 0, 0])
+    boundaryPlanes = slabs.decompose(comm) if points else []
+    spheres = Spheres(0, name='bench_slabs')
+    positions, ids = cubicLattice(1.0, [0, 0, 0], [nx, ny, nz], boundaryPlanes=boundaryPlanes)
+    velocity = np.zeros((len(ids), 3))
+    velocity[:, 0] = 0.1 * (1 - 2 * (ids % 2))
+    addSpheres(spheres, positions, ids=ids, radius=0.5, velocity=velocity)
+    domain = slabs.constructDomain(comm, [spheres])
+    sim = Simulation(spheres, comm=comm)
+    sim.setHaloExchange(domain, cutoff=cutoff, skin=skin)
+    return sim, domain
+
+
+def benchmarkSimulation(comm, repeat, strong, weak, nTimesteps=10, ny=4, nz=4):
+    """Strong scaling with about strong particles in total, and weak scaling with about weak
+    particles per rank. The number of particles is rounded down to a multiple of ny*nz.
+    """
+    results = {}
+    for kind, n in [('strong', n) for n in strong] + [('weak', n) for n in weak]:
+        nx = max(1, (n if kind == 'strong' else n * comm.size) // (ny * nz))
+        sim, domain = _slabSimulation(comm, nx, ny, nz)
+        params = {'kind': kind, 'nTotal': nx * ny * nz} if kind == 'strong' else {'kind': kind, 'nPerRank': nx * ny * nz // comm.size}
+        results.update([_entry('simulation', params, nx * ny * nz * nTimesteps, 'particle updates'
+                              , measure(lambda: sim.move(dt=0.1, nTimesteps=nTimesteps), comm, repeat))])
+        domain.free()
+    return results
+
+
+def meta(comm, **settings):
+    """Describe the environment of a benchmark run, and its settings (e.g. repeat, scale and groups)."""
+    return { 'nRanks': comm.size
+           , 'mpitoy': mpitoy.__version__
+           , 'python': platform.python_version()
+           , 'numpy': np.__version__
+           , 'mpi': MPI.Get_library_version().splitlines()[0].strip('\x00 ')
+           , 'host': platform.node()
+           , 'timestamp': datetime.datetime.now().isoformat(timespec='seconds')
+           , **settings
+           }
+
+
+def run(comm=MPI.COMM_WORLD, repeat=5, scale=1.0, groups=None):
+    """Run the benchmarks (collective).
+
+    :param int repeat: number of samples of every benchmark.
+    :param float scale: factor applied to all problem sizes (e.g. 0.01 for a quick check).
+    :param groups: list of (fnmatch) patterns selecting the groups to run, default all GROUPS.
+    :return: results dict, see the module documentation. The results are the same on all ranks.
+    """
+    def sizes(*ns):
+        return [max(1, int(n * scale)) for n in ns]
+
+    selected = [g for g in GROUPS if groups is None or any(fnmatch.fnmatch(g, pattern) for pattern in groups)]
+    benchmarks = {}
+    if 'particlecontainer' in selected:
+        benchmarks.update(benchmarkParticleContainer(comm, repeat, sizes(1000, 10000)))
+    if 'forward_euler' in selected:
+        benchmarks.update(benchmarkForwardEuler(comm, repeat, sizes(1000, 10000)))
+    if 'classify' in selected:
+        benchmarks.update(benchmarkClassify(comm, repeat, sizes(1000, 10000)))
+    if 'pcsendrecv' in selected:
+        benchmarks.update(benchmarkPcSendRecv(comm, repeat, sizes(1, 10, 100, 1000)))
+    if 'simulation' in selected:
+        benchmarks.update(benchmarkSimulation(comm, repeat, strong=sizes(4096), weak=sizes(1024)))
+    return {'meta': meta(comm, repeat=repeat, scale=scale, groups=selected), 'benchmarks': benchmarks}
+
+
+def save(results, filename, comm=MPI.COMM_WORLD):
+    """Write results as JSON (on rank 0 of comm)."""
+    if comm.rank == 0:
+        with open(filename, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+def load(filename):
+    """Read results written by save()."""
+    with open(filename) as f:
+        return json.load(f)
+
+
+def formatResults(results):
+    """Format results as a table with the median time and throughput of every benchmark."""
+    lines = [f"{'benchmark':<48} {'median [s]':>12} {'throughput':>14}  unit/s"]
+    for name, entry in results['benchmarks'].items():
+        median = float(np.median(entry['seconds']))
+        rate = entry['work'] / median if median > 0 else float('inf')
+        lines.append(f"{name:<48} {median:12.6f} {rate:14.1f}  {entry['unit']}/s")
+    return '\n'.join(lines)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+"""
+Run the mpitoy benchmarks::
+
+    mpirun -np 4 python -m mpitoy.benchmark --output results.json
+"""
+
+import argparse
+
+from mpi4py import MPI
+
+from mpitoy.benchmark import GROUPS, run, save, formatResults
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m mpitoy.benchmark', description='Run the mpitoy benchmarks.')
+    parser.add_argument('-o', '--output', help='JSON file for the results')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='number of samples per benchmark (default 5)')
+    parser.add_argument('-s', '--scale', type=float, default=1.0, help='factor applied to all problem sizes (default 1.0)')
+    parser.add_argument('-g', '--groups', nargs='+', help=f'groups to run (fnmatch patterns), default all of {GROUPS}')
+    args = parser.parse_args(argv)
+
+    comm = MPI.COMM_WORLD
+    results = run(comm, repeat=args.repeat, scale=args.scale, groups=args.groups)
+    if args.output:
+        save(results, args.output, comm)
+    if comm.rank == 0:
+        print(formatResults(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module mpitoy.checkpoint
+==========================
+
+A submodule for parallel checkpoint/restart of a Simulation.
+
+All ranks write the live particles of every particle container of a Simulation into one shared
+file, using MPI-IO collective writes. The file layout is::
+
+    magic (8 bytes) | header length (uint64) | header (json) | container 0 | container 1 | ...
+
+The header describes the file: the simulation time, and for every particle container its name,
+the numpy structured dtype of its records (see ParticleContainer.packRecords()), the number of
+records and the offset of its data. It also records the BoundaryPlanes of every rank at the time of writing.
+The records of each container are written contiguously, rank after rank, at offsets computed
+with a prefix sum (Exscan) over the number of live particles of the ranks.
+
+On restart, every rank reads an equal share of the records of each container, and the records
+are redistributed to the rank that owns their position in the (possibly different) decomposition.
+The particle containers are compacted, i.e. they are restored without free elements.
+"""
+
+import json
+
+import numpy as np
+from mpi4py import MPI
+
+MAGIC = b'MPITOYCP'
+VERSION = 1
+
+
+def _describePlane(bp):
+    return { 'p': bp.p.tolist(), 'n': bp.n.tolist()
+           , 'myRank': bp.myRank, 'nbRank': bp.nbRank, 'kind': bp.kind
+           , 'shift': None if bp.shift is None else bp.shift.tolist() }
+
+
+def writeCheckpoint(filename, sim, comm=MPI.COMM_WORLD, boundaryPlanes=None):
+    """Write a checkpoint of Simulation sim to filename.
+
+    This is a collective operation.
+
+    :param str filename: name of the checkpoint file (overwritten if it exists).
+    :param sim: a Simulation object. Its particle containers must be the same (same names and
+        arrays, in the same order) on all ranks.
+    :param comm: MPI communicator
+    :param boundaryPlanes: the BoundaryPlanes of this rank, stored in the header for reference.
+        Defaults to sim.domainBoundaries.
+    """
+    if boundaryPlanes is None:
+        boundaryPlanes = sim.domainBoundaries if sim.domainBoundaries else []
+
+    error = None
+    try:
+        allRecords = [pc.packRecords(np.flatnonzero(pc.alive)) for pc in sim.pcs]
+    except ValueError as e:
+        error = e
+    if comm.allreduce(error is not None, op=MPI.LOR):
+        raise error if error is not None else RuntimeError("Writing the checkpoint failed on another rank.")
+    counts = np.array([len(records) for records in allRecords], dtype=np.int64)
+    totals = np.empty_like(counts)
+    comm.Allreduce(counts, totals, op=MPI.SUM)
+    before = np.zeros_like(counts)
+    comm.Exscan(counts, before, op=MPI.SUM)
+    if comm.rank == 0:
+        before[:] = 0 # Exscan leaves the receive buffer of rank 0 undefined
+    planes = comm.gather([_describePlane(bp) for bp in boundaryPlanes], root=0)
+    capacities = comm.gather([pc.capacity for pc in sim.pcs], root=0)
+
+    # The header is composed on rank 0, the other ranks only need its length.
+    header = b''
+    if comm.rank == 0:
+        containers = []
+        offset = 0
+        for ipc, (pc, records) in enumerate(zip(sim.pcs, allRecords)):
+            containers.append({ 'name': pc.name
+                              , 'dtype': records.dtype.descr
+                              , 'count': int(totals[ipc])
+                              , 'offset': offset # relative to the end of the header
+                              , 'growthFactor': pc.growthFactor
+                              , 'capacities': [c[ipc] for c in capacities]
+                              })
+            offset += int(totals[ipc]) * records.dtype.itemsize
+        header = json.dumps({ 'version': VERSION, 't': float(sim.t), 'nRanks': comm.size
+                            , 'containers': containers, 'boundaryPlanes': planes }).encode()
+    headerLength = comm.bcast(len(header), root=0)
+    dataStart = len(MAGIC) + 8 + headerLength
+
+    fh = MPI.File.Open(comm, filename, MPI.MODE_WRONLY | MPI.MODE_CREATE)
+    fh.Set_size(0)
+    if comm.rank == 0:
+        prefix = np.frombuffer(MAGIC + np.uint64(headerLength).tobytes() + header, dtype=np.uint8)
+    else:
+        prefix = np.empty(0, dtype=np.uint8)
+    fh.Write_at_all(0, prefix)
+
+    offset = dataStart
+    for ipc, records in enumerate(allRecords):
+        itemsize = records.dtype.itemsize
+        fh.Write_at_all(offset + int(before[ipc]) * itemsize, records.view(np.uint8))
+        offset += int(totals[ipc]) * itemsize
+    fh.Close()
+
+
+def readHeader(filename, comm=MPI.COMM_WORLD):
+    """Read the header of a checkpoint file (collective).
+
+    :return: (dict, int) the header and the offset of the data.
+    :raises RuntimeError: on all ranks, if the file cannot be read or is not a checkpoint file.
+    """
+    header = None
+    if comm.rank == 0:
+        # errors are broadcast, so that all ranks raise rather than wait for the header
+        try:
+            with open(filename, 'rb') as f:
+                magic = f.read(len(MAGIC))
+                if magic != MAGIC:
+                    raise RuntimeError(f"'{filename}' is not an mpitoy checkpoint file.")
+                headerLength = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+                header = (json.loads(f.read(headerLength).decode()), len(MAGIC) + 8 + headerLength)
+        except (OSError, ValueError, RuntimeError) as error:
+            header = error
+    header = comm.bcast(header, root=0)
+    if isinstance(header, Exception):
+        raise RuntimeError(f"Reading the header of checkpoint '{filename}' failed: {header}")
+    return header
+
+
+def readCheckpoint(filename, sim, comm=MPI.COMM_WORLD, decomposition=None):
+    """Restore Simulation sim from a checkpoint file.
+
+    This is a collective operation. The checkpoint may have been written by a different number of
+    ranks. The particles are added to the particle containers of sim with the same name, which are
+    typically empty. sim.t is restored.
+
+    :param str filename: name of the checkpoint file.
+    :param sim: a Simulation object.
+    :param comm: MPI communicator
+    :param decomposition: an object with an ownerRank(points, size) method, typically a
+        ParallelSlabs object, used to send every particle to the rank owning its position.
+        If None, every rank keeps the records it read.
+    """
+    header, dataStart = readHeader(filename, comm)
+    pcs = {pc.name: pc for pc in sim.pcs}
+
+    fh = MPI.File.Open(comm, filename, MPI.MODE_RDONLY)
+    for container in header['containers']:
+        dtype = np.dtype([tuple(field) for field in container['dtype']])
+        count = container['count']
+        # read an equal share of the records
+        begin = count * comm.rank // comm.size
+        end = count * (comm.rank + 1) // comm.size
+        records = np.empty(end - begin, dtype=dtype)
+        fh.Read_at_all(dataStart + container['offset'] + begin * dtype.itemsize, records.view(np.uint8))
+
+        if decomposition is not None and comm.size > 1:
+            records = _redistribute(records, decomposition, comm)
+
+        pc = pcs[container['name']]
+        pc.growthFactor = container['growthFactor']
+        pc.unpackRecords(records)
+    fh.Close()
+    sim.t = header['t']
+    return header
+
+
+def _redistribute(records, decomposition, comm):
+    """Send every record to the rank owning its position (collective)."""
+    if 'r' in records.dtype.names:
+        positions = records['r']
+    else:
+        positions = np.stack([records['rx'], records['ry'], records['rz']], axis=-1)
+    owners = decomposition.ownerRank(positions, comm.size)
+    order = np.argsort(owners, kind='stable')
+    records = records[order]
+    sendcounts = np.bincount(owners, minlength=comm.size).astype(np.int64)
+    recvcounts = np.empty_like(sendcounts)
+    comm.Alltoall(sendcounts, recvcounts)
+
+    itemsize = records.dtype.itemsize
+    received = np.empty(int(recvcounts.sum()), dtype=records.dtype)
+    sendbytes = sendcounts * itemsize
+    recvbytes = recvcounts * itemsize
+    comm.Alltoallv( [records.view(np.uint8), (sendbytes, np.cumsum(sendbytes) - sendbytes), MPI.BYTE]
+                  , [received.view(np.uint8), (recvbytes, np.cumsum(recvbytes) - recvbytes), MPI.BYTE] )
+    return received
@@ -8,58 +8,60 @@ A submodule for ...
 
 """
 
+import pickle
+import zlib
+
 import numpy as np
 from copy import copy
+from mpi4py import MPI
 from mpitoy.mprint import mprint
+from mpitoy.particlecontainer import VectorArray
+from mpitoy.profiler import profiler
+from mpitoy.query import CellIndex, Box, Sphere, Slab, Nearest, intersects
 
 
-class TagComposer:
-    """Class TagComposer composes a unique int from a list of ints.
+MESSAGE_KINDS = ('leaving', 'ghosts', 'slot', 'positions', 'array', 'query')
+N_TAG_KEYS = 2048
 
-    """
-    def __init__(self, digits=[]):
-        """
 
-        :param digits: list of number of digits per item in the list, specified from left to right
-            digits[0] is not used.
-        """
-        if not digits:
-            raise ValueError("you must specify digits")
-        if sum(digits) > 16:
-            raise ValueError(f"sun(digits)={sum(digits)} cannot exceed 16.")
-        self.digits = digits
-        self.maxval = [10**d for d in digits]
+def positionArray(pc):
+    """The VectorArray 'r' with the positions of pc, or None if the positions are stored in the
+    scalar arrays rx, ry and rz."""
+    r = pc.arrays.get('r')
+    return r if isinstance(r, VectorArray) and r.shape == (3,) else None
 
-    @property
-    def n(self):
-        return len(self.digits)
 
+def particlePositions(pc, elements):
+    """Return a contiguous (len(elements),3) float64 array with the positions of elements of pc.
 
-    def __call__(self, *args):
-        """Compose the tag from args.
-        :param args: specified from left to right
-        :return:
-        """
-        tag = args[0]
-        for i in range(1, self.n):
-            if args[i] > self.maxval[i]:
-                raise ValueError(f'{i}-th parameter (={args[i]}) exceeds maximum (={self.maxval[i]}')
-            tag *= self.maxval[i]
-            tag += args[i]
-        return tag
-
-    def decompose(self,tag):
-        s = str(tag)+' '
-        iend = -1
-        args = []
-        for i in range(self.n-1, -1, -1):
-            if i == 0:
-                si = s[:iend]
-            else:
-                si = s[iend - self.digits[i] : iend]
-            args.insert(0, int(si))
-            iend -= self.digits[i]
-        return args
+    With a VectorArray 'r' this is a single fancy indexing operation.
+    """
+    r = positionArray(pc)
+    if r is not None:
+        return r.data[np.asarray(elements, dtype=np.int64)].astype(np.float64, copy=False)
+    positions = np.empty((len(elements), 3), dtype=np.float64)
+    for j, i in enumerate(elements):
+        positions[j] = (pc.rx[i], pc.ry[i], pc.rz[i])
+    return positions
+
+
+def messageTag(key, kind, direction):
+    """Compose the tag of a message from the name of what is sent, the kind of the message, and
+    its direction.
+
+    The ranks are not part of the tag, as MPI already matches messages on the source rank. The
+    tag is deterministic, so that no handshake is needed, and smaller than 2**15, the smallest
+    MPI.TAG_UB the MPI standard allows, whatever the number of ranks. Different keys may hash to
+    the same tag, which is harmless as long as both neighbours send and receive the messages in
+    the same order, as MPI does not let messages with the same source and tag overtake each other.
+
+    :param str key: name of what is sent, e.g. the name of a particle container. It must be the
+        same on all ranks.
+    :param str kind: one of MESSAGE_KINDS.
+    :param int direction: 0 or 1, see BoundaryPlane.direction.
+    :return: int in [0, 2**15)
+    """
+    return ((zlib.crc32(key.encode()) % N_TAG_KEYS) * 8 + MESSAGE_KINDS.index(kind)) * 2 + direction
 
 
 class BoundaryPlane:
@@ -86,45 +88,78 @@ class BoundaryPlane:
         nbRank |---> myrank
                |
 
+    A BoundaryPlane can also be a physical wall at the edge of the simulation domain, without a
+    neighbour (see applyWall()). The kind of wall is one of
 
+    * 'reflective': particles touching the wall bounce back (the normal velocity is mirrored),
+    * 'absorbing': particles crossing the wall are removed,
+    * 'inflow': particles are injected at a given rate (and otherwise behaves as 'absorbing').
     """
-    def __init__(self, p, n=None):
+    WALLS = ('reflective', 'absorbing', 'inflow')
+
+    def __init__(self, p, n=None, kind=None, rate=0.0, velocity=None, positions=None, id0=None, allocator=None):
         """
         :param p: point p in the plane
         :param n: normal vector of the plane
+        :param str kind: None for a boundary between two domains, or one of BoundaryPlane.WALLS
+        :param float rate: number of particles injected per unit of time (kind='inflow' only)
+        :param velocity: velocity of the injected particles (kind='inflow' only)
+        :param positions: callable returning a (k,3) array with the positions of k particles to be
+            injected (kind='inflow' only). By default, the particles injected in one timestep are
+            stacked along the normal, starting at p at one particle radius from the plane, one
+            particle diameter apart.
+        :param int id0: id of the first particle injected (kind='inflow' only). It is required
+            without allocator, and must not collide with the ids of the other particles.
+        :param allocator: an mpitoy.idallocator.IdAllocator. If provided, the ids of the injected
+            particles are obtained from allocator.allocateLocal(), and id0 is ignored (kind='inflow' only).
         """
+        if not kind in (None,) + BoundaryPlane.WALLS:
+            raise ValueError(f"Unknown kind of BoundaryPlane '{kind}', expecting one of {BoundaryPlane.WALLS}.")
+        if kind == 'inflow' and id0 is None and allocator is None:
+            raise ValueError("An inflow BoundaryPlane requires either id0 or allocator.")
         self.p = np.array(p)
         self.n = n / np.sqrt(np.dot(n, n)) # normalize
+        self.kind = kind
+        self.rate = rate
+        self.velocity = np.zeros(3) if velocity is None else np.array(velocity, dtype=float)
+        self.positions = positions
+        self.nextId = id0
+        self.allocator = allocator
+        self.credit = 0.0 # fractional number of particles to be injected
 
         # These are the ranks of the processes that correspond a positive location(), resp. a negative location()
         # These must be initiolized by the domain composition
         self.myRank = None # the rank responsible for points inside the domain (positive location)
         self.nbRank = None # the rank responsible for points crossing this domain boundary (negative location)
         self.ghostPCs = {}
-        self.tagger = TagComposer(digits=[2,2,3,3])
+        self.ghostElements = {} # the indices of the particles of each pc that are ghosted in the neighbouring domain
+        self.shift = None # translation of the particles crossing this plane (wrap planes of periodic domains)
 
-    def send_tag(self, pc_id, caller_id, msg=''):
-        """Compose a tag from the sender and the receiver rank. If you send with tag=send_tag() you must
-        receive with tag=recv_tag().
+    @property
+    def direction(self):
+        """0 if the first nonzero component of the normal is positive, 1 otherwise.
 
-        :return: int
-        :raises: TypeError if self.me or self.nb are None. (which means that there is no MPI context.
+        The BoundaryPlanes of two neighbouring domains on the same plane have opposite normals,
+        hence opposite directions. This distinguishes the messages across the two planes between
+        the same two ranks (e.g. a periodic decomposition over two ranks).
         """
-        tag = self.tagger(pc_id, caller_id, self.myRank, self.nbRank)
-        if msg:
-            print(f'{msg} send_tag:{tag}')
-        return tag
+        nonzero = self.n[np.flatnonzero(self.n)]
+        return 0 if nonzero[0] > 0 else 1
 
-    def recv_tag(self, pc_id, caller_id, msg=''):
-        """
-        :return: int, a tag that is composed for
-        :raises: TypeError if self.me or self.nb are None. (which means that there is no MPI context.
+    def send_tag(self, kind, key=''):
+        """Tag for sending a message of kind about key to the neighbour. If you send with
+        tag=send_tag(), the neighbour must receive with tag=recv_tag(), see messageTag().
+
+        :return: int
         """
-        tag = self.tagger(pc_id, caller_id, self.nbRank, self.myRank)
-        if msg:
-            print(f'{msg} recv_tag:{tag}')
-        return tag
+        return messageTag(key, kind, self.direction)
 
+    def recv_tag(self, kind, key=''):
+        """Tag for receiving a message of kind about key from the neighbour, see send_tag().
+
+        :return: int
+        """
+        return messageTag(key, kind, 1 - self.direction)
 
     def __str__(self):
         return f"{self.myRank}-|>{self.nbRank}"
@@ -137,6 +172,150 @@ class BoundaryPlane:
         """
         print(f"{comm.rank}: p={self.p}, n={self.n}, me={self.myRank}, nb={self.nbRank}")
 
+    @property
+    def isWall(self):
+        return self.kind is not None
+
+    def applyWall(self, pc, dt=0.0):
+        """Apply the wall boundary condition to particle container pc, after a timestep dt.
+
+        All particles are treated in a single vectorized pass:
+
+        * reflective: particles overlapping the wall are mirrored about the wall, and their
+          normal velocity is reversed if they move towards the wall.
+        * absorbing, inflow: particles whose centre crossed the wall are removed.
+        * inflow: rate*dt particles are added (fractions are carried over to the next timestep).
+
+        :return: list of the indices of the particles that were reflected, removed, or added.
+        """
+        elements = np.flatnonzero(pc.alive)
+        affected = []
+        if len(elements):
+            r = np.array([pc.rx, pc.ry, pc.rz])[:, elements].T
+            d = (r - self.p) @ self.n
+            if self.kind == 'reflective':
+                radius = np.array(pc.radius)[elements]
+                hit = np.flatnonzero(d < radius)
+                if len(hit):
+                    v = np.array([pc.vx, pc.vy, pc.vz])[:, elements[hit]].T
+                    r = r[hit] + np.outer(2 * (radius[hit] - d[hit]), self.n)
+                    vn = v @ self.n
+                    v -= np.outer(np.where(vn < 0, 2 * vn, 0.0), self.n)
+                    for j, i in enumerate(elements[hit].tolist()):
+                        pc.rx[i], pc.ry[i], pc.rz[i] = r[j].tolist()
+                        pc.vx[i], pc.vy[i], pc.vz[i] = v[j].tolist()
+                    affected = elements[hit].tolist()
+            else:
+                affected = elements[d < 0].tolist()
+                pc.kill(affected)
+
+        if self.kind == 'inflow':
+            self.credit += self.rate * dt
+            k = int(self.credit)
+            self.credit -= k
+            if k:
+                if self.positions is None:
+                    radius = pc.radius.defaultValue
+                    r = self.p + np.outer(radius * (1 + 2 * np.arange(k)), self.n)
+                else:
+                    r = np.asarray(self.positions(k))
+                if self.allocator is None:
+                    ids = self.nextId + np.arange(k, dtype=np.int64)
+                    self.nextId += k
+                else:
+                    ids = self.allocator.allocateLocal(k)
+                added = pc.addElements(k)
+                pc.id.assign(added, ids)
+                for name, values in zip(('rx', 'ry', 'rz'), r.T):
+                    pc.array(name).assign(added, values)
+                for name, value in zip(('vx', 'vy', 'vz'), self.velocity.tolist()):
+                    pc.array(name).assign(added, value)
+                affected.extend(added.tolist())
+
+        return affected
+
+    def applyShift(self, pc):
+        """Translate the positions of all particles in pc by self.shift (if any).
+
+        This is applied to the particles that cross the wrap plane of a periodic domain.
+        """
+        if self.shift is None:
+            return
+        r = positionArray(pc)
+        if r is not None:
+            r.data[np.flatnonzero(pc.alive)] += self.shift
+            return
+        sx, sy, sz = self.shift
+        for i in range(pc.capacity):
+            if pc.alive[i]:
+                pc.rx[i] += sx
+                pc.ry[i] += sy
+                pc.rz[i] += sz
+
+    def packParticles(self, pc, elements, move=False):
+        """Pack the particles elements of pc to be sent across this plane, translated by
+        self.shift (if any).
+
+        The particles are packed as records (see ParticleContainer.packRecords()), which are
+        pickled as a single raw buffer. If the arrays of pc cannot be represented as records,
+        they are packed in a clone of pc.
+
+        :param bool move: remove the particles from pc.
+        :return: numpy structured array, or ParticleContainer.
+        """
+        try:
+            records = pc.packRecords(elements)
+        except ValueError:
+            clone = pc.clone(elements=elements, move=move)
+            self.applyShift(clone)
+            return clone
+        if move:
+            pc.kill(list(elements))
+        if self.shift is not None:
+            if positionArray(pc) is not None:
+                records['r'] += self.shift
+            else:
+                for name, s in zip(('rx', 'ry', 'rz'), self.shift):
+                    records[name] += s
+        return records
+
+    @staticmethod
+    def unpackParticles(packed, pc):
+        """Add the particles packed by packParticles() to pc."""
+        if isinstance(packed, np.ndarray):
+            pc.unpackRecords(packed)
+        else:
+            packed.copyto(pc)
+
+    @staticmethod
+    def packedIds(packed):
+        """The ids of the particles packed by packParticles() (for verbose output)."""
+        if isinstance(packed, np.ndarray):
+            return packed['id'].tolist()
+        return [packed.id[i] for i in range(packed.capacity) if packed.alive[i]]
+
+    def counterName(self, pc, kind):
+        """Name of the profiler counter of the messages of kind for pc across this plane."""
+        return f'{kind}:{pc.name}:{self.myRank}->{self.nbRank}'
+
+    def sendrecvPacked(self, comm, pc, kind, packed):
+        """Send packed, the particles packed by packParticles() (or None), to the neighbouring
+        domain and return the particles packed by the neighbour.
+
+        The payload is pickled and unpickled explicitly, in the 'pack' and 'unpack' timers, so
+        that the 'wait' timer measures only the communication.
+        """
+        with profiler.timer('pack'):
+            payload = pickle.dumps(packed, protocol=pickle.HIGHEST_PROTOCOL)
+        profiler.count(self.counterName(pc, kind), nbytes=len(payload))
+        # Waiting for the send to complete before posting the receive deadlocks if the messages
+        # are too large to be buffered, hence sendrecv.
+        with profiler.timer('wait'):
+            payload = comm.sendrecv( payload, dest=self.nbRank, sendtag=self.send_tag(kind, pc.name)
+                                   , source=self.nbRank, recvtag=self.recv_tag(kind, pc.name) )
+        with profiler.timer('unpack'):
+            return pickle.loads(payload)
+
     def distance(self, q):
         """Compute the signed distance of point q to this BoundaryPlane.
         A positive (negative) distance indicates that q is inside (outside) the domain.
@@ -144,9 +323,17 @@ class BoundaryPlane:
         :param np.ndarray q: a point in space.
         :return: float.
         """
-        print(f'{self} {q-self.p}dot{self.n} = {np.dot(q-self.p,self.n)}')
         return np.dot(q-self.p,self.n)
 
+    def distances(self, pc):
+        """Compute the signed distances of all live particles in pc to this BoundaryPlane.
+
+        :return: (elements, d), the int64 array of the live elements, in increasing order, and the
+            array of their signed distances (see distance()), computed as a single matrix product.
+        """
+        elements = np.flatnonzero(pc.alive)
+        return elements, (particlePositions(pc, elements) - self.p) @ self.n
+
     def findLeavingParticles(self, pc, comm=None, verbose=False):
         """Find the particles in particle container pc that are outside the domain.
 
@@ -156,21 +343,19 @@ class BoundaryPlane:
 
         If a communicator is provided, this function must be called on all ranks.
         """
-        outgoing = []
         if verbose:
             print(f"{comm.rank} findLeavingParticles({str(self)}) : pc initially contains {[pc.id[i] for i in range(pc.capacity) if pc.alive[i]]}")
-        for i in range(pc.capacity):
-            if pc.alive[i]:
-                pi = np.array([pc.rx[i],pc.ry[i],pc.rz[i]])
-                di = self.distance(pi)
-                if di < 0:
-                    outgoing.append(i)
-                    if verbose:
-                        print(f'{comm.rank} findLeavingParticles({str(self)}) : outgoing.append({pc.id[i]=}), {pc.rx[i]=}, {di=}')
+        with profiler.timer('classify'):
+            elements, d = self.distances(pc)
+            outgoing = elements[d < 0].tolist()
+        if verbose:
+            for i, di in zip(outgoing, d[d < 0].tolist()):
+                print(f'{comm.rank} findLeavingParticles({str(self)}) : outgoing.append({pc.id[i]=}), {pc.rx[i]=}, {di=}')
         if comm:
             if outgoing:
-                # make a clone with the outgoing particles, moving them from the pc to its clone:
-                pc_outgoing = pc.clone(elements=outgoing, move=True)
+                # pack the outgoing particles, removing them from pc:
+                with profiler.timer('pack'):
+                    pc_outgoing = self.packParticles(pc, outgoing, move=True)
                 if verbose:
                     outgoing_elements = [pc.id[i] for i in outgoing]
                     print(f"{comm.rank} findLeavingParticles({str(self)}) : sending particles {outgoing_elements}")
@@ -179,18 +364,15 @@ class BoundaryPlane:
                 if verbose:
                     print(f"{comm.rank} findLeavingParticles({str(self)}) : sending None")
 
-            #send the clone to the neighbouring domain:
-            req_outgoing = comm.isend(pc_outgoing, dest=self.nbRank, tag=self.send_tag(1, pc.ID, msg=f'{comm.rank} findLeavingParticles'))
-            req_outgoing.wait()
-            # Receive leaving particles from the neighbouring domain
-            req_incoming = comm.irecv(source=self.nbRank, tag=self.recv_tag(1, pc.ID, msg=f'{comm.rank} findLeavingParticles'))
-            pc_incoming = req_incoming.wait()
+            #send the particles to the neighbouring domain, and receive the leaving particles from
+            # the neighbouring domain:
+            pc_incoming = self.sendrecvPacked(comm, pc, 'leaving', pc_outgoing)
             if not pc_incoming is None:
                 if verbose:
-                    incoming_elements = [pc_incoming.id[i] for i in range(pc_incoming.capacity) if pc_incoming.alive[i]]
-                    print(f"{comm.rank} findLeavingParticles({str(self)}) receiving particles {incoming_elements}")
+                    print(f"{comm.rank} findLeavingParticles({str(self)}) receiving particles {self.packedIds(pc_incoming)}")
                 # Copy the incoming particles
-                pc_incoming.copyto(pc)
+                with profiler.timer('unpack'):
+                    self.unpackParticles(pc_incoming, pc)
                 if verbose:
                     print(f"{comm.rank} findLeavingParticles({str(self)}) pc contains {[pc.id[i] for i in range(pc.capacity) if pc.alive[i]]}")
             else:
@@ -219,18 +401,18 @@ class BoundaryPlane:
             if verbose:
                 print(f"{comm.rank} findGhostParticles: pc '{pc.name}' is empty. Ghost particles not needed.")
 
-        toBeGhosted = []
-        for i in range(pc.capacity):
-            if pc.alive[i]:
-                pi = np.array([pc.rx[i],pc.ry[i],pc.rz[i]])
-                di = self.distance(pi)
-                if 0 <= di < ghostWidth:
-                    toBeGhosted.append(i)
+        with profiler.timer('classify'):
+            elements, d = self.distances(pc)
+            toBeGhosted = elements[(0 <= d) & (d < ghostWidth)].tolist()
 
         if comm:
+            # Remember which particles are ghosted, so that their positions can be refreshed
+            # without rebuilding the ghost particle container (see Domain.refreshGhostPositions).
+            self.ghostElements[pc.name] = toBeGhosted
             if toBeGhosted:
-                # Copy the particles to be ghosted to a clone
-                pc_toBeGhosted = pc.clone(elements=toBeGhosted)
+                # Pack the particles to be ghosted
+                with profiler.timer('pack'):
+                    pc_toBeGhosted = self.packParticles(pc, toBeGhosted)
                 if verbose:
                     toBeGhosted_elements = [pc.id[i] for i in toBeGhosted]
                     print(f"{comm.rank} findGhostParticles sending ghost particles {toBeGhosted_elements}")
@@ -238,32 +420,35 @@ class BoundaryPlane:
             else:
                 pc_toBeGhosted = None
 
-            #send the ghost clone to the neighbouring domain:
-            req_toBeGhosted = comm.isend(pc_toBeGhosted, dest=self.nbRank, tag=self.send_tag(2, pc.ID, msg=f'{comm.rank} findGhostParticles'))
-            req_toBeGhosted.wait()
-            #  req_outgoing = comm.isend(pc_outgoing   , dest=self.nbRank, tag=self.send_tag(1, pc.ID, msg=f'{comm.rank} findLeavingParticles'))
-            # req_outgoing.wait()
-
-            # Receive the ghost clone from the neighbouring domain
-            req_toBeGhosted = comm.irecv(source=self.nbRank, tag=self.recv_tag(2, pc.ID, msg=f'{comm.rank} findGhostParticles'))
-            pc_toBeGhosted = req_toBeGhosted.wait()
-            # req_incoming  = comm.irecv(source=self.nbRank, tag=self.recv_tag(1, pc.ID, msg=f'{comm.rank} findLeavingParticles'))
-            # pc_incoming = req_incoming.wait()
-            # Store the Ghost PC:
-            self.ghostPCs[pc.name] = pc_toBeGhosted
+            #send the ghost particles to the neighbouring domain, and receive the ghost particles
+            # from the neighbouring domain:
+            pc_toBeGhosted = self.sendrecvPacked(comm, pc, 'ghosts', pc_toBeGhosted)
             if not pc_toBeGhosted is None:
                 if verbose:
-                    toBeGhosted_elements = [pc_toBeGhosted.id[i] for i in range(pc_toBeGhosted.capacity) if pc_toBeGhosted.alive[i]]
-                    print(f"{comm.rank} findGhostParticles, receiving ghost particles {toBeGhosted_elements}")
+                    print(f"{comm.rank} findGhostParticles, receiving ghost particles {self.packedIds(pc_toBeGhosted)}")
+                if isinstance(pc_toBeGhosted, np.ndarray):
+                    # the ghost particle container is a clone of pc, with the received particles
+                    with profiler.timer('unpack'):
+                        ghosts = pc.clone()
+                        ghosts.unpackRecords(pc_toBeGhosted)
+                    pc_toBeGhosted = ghosts
+            # Store the Ghost PC:
+            self.ghostPCs[pc.name] = pc_toBeGhosted
 
         return toBeGhosted
 
 class ParallelSlabs:
     """"""
-    def __init__(self,points,n):
+    def __init__(self, points, n, period=None, lowerWall=None, upperWall=None):
         """
         :param points: list of successive points located on the respective boundary planes.
         :param n: normal vector of all planes.
+        :param float period: if not None, the decomposition is periodic in the direction of n, with
+            period as the box length. The first and the last rank are then neighbours across the
+            wrap plane, see decompose().
+        :param BoundaryPlane lowerWall: wall (BoundaryPlane with a kind) at the lower end of rank 0.
+            Its normal is reoriented to point inward.
+        :param BoundaryPlane upperWall: wall at the upper end of the last rank.
 
         Currently, it is expected that the points are ordered correctly, i.e. the dot product of
         point[i]-point[0] with n should be increasing with i. It might be useful to enforce the
@@ -281,6 +466,33 @@ class ParallelSlabs:
         if dot_sorted != dot:
             raise RuntimeError(f"Points must be sorted: {points}.")
         self.boundaries = boundaries
+        self.n = boundaries[0].n if boundaries else None
+        self.period = period
+        if period is not None and (lowerWall or upperWall):
+            raise ValueError("A periodic decomposition cannot have walls.")
+        for wall in (lowerWall, upperWall):
+            if wall and not wall.isWall:
+                raise ValueError("lowerWall and upperWall must be BoundaryPlanes with a kind.")
+        self.lowerWall = lowerWall
+        self.upperWall = upperWall
+
+
+    def _boundaryPlane(self, i, rank, nbRank, flip=False, shift=0.0):
+        """Create the BoundaryPlane of rank through the i-th point, with neighbour nbRank.
+
+        :param bool flip: if True, flip the normal so that it points inward.
+        :param float shift: translation of the particles crossing the plane, along the normal of
+            the slabs (for the wrap plane of periodic decompositions).
+        """
+        p = self.boundaries[i].p
+        if shift > 0:
+            p = p - shift * self.n # the image of the wrap plane at the lower end of the box
+        b = BoundaryPlane(p, -self.n if flip else self.n)
+        b.myRank = rank
+        b.nbRank = nbRank
+        if shift:
+            b.shift = shift * self.n
+        return b
 
 
     def decompose(self,comm):
@@ -294,74 +506,89 @@ class ParallelSlabs:
 
         If there are more BoundaryPlanes than ranks, they are not used.
         If there are too little, you get IndexError.
+
+        If the decomposition is periodic, BPn is the wrap plane, located at the upper end of
+        rank n. Its image, BPn - period*n, is the lower end of rank 0. Particles crossing the
+        wrap plane are shifted by the period, in the appropriate direction::
+
+            BPn-period | rank 0 | rank 1 |  ...  | rank n | BPn
+                     BP0      BP1      BPn-1
+
+        The BoundaryPlanes are always ordered by the index of the point through which they pass,
+        with the wrap plane last, so that neighbouring ranks process their common boundaries in
+        the same order. Walls, if any, come after the boundaries with neighbours.
         """
         myBoundaryPlanes = []
         if comm.size <= 0:
             return myBoundaryPlanes
 
         rank = comm.rank
-        if rank == 0:
-            # Domain 0, has only boundary with higher rank
-            b = copy(self.boundaries[rank])
-            b.myRank = rank
-            b.nbRank = rank + 1
-            b.n *= -1 # have normal point inward
-            myBoundaryPlanes.append(b)
-
-        elif rank == comm.size - 1:
-            # Last domain, has only boundary with lower rank
-            b = copy(self.boundaries[rank-1])
-            b.myRank = rank
-            b.nbRank = rank - 1
-            myBoundaryPlanes.append(b)
-
-        else:
-            # Interior domains have two boundaries, with higher and lower rank
-            # lower rank:
-            b = copy(self.boundaries[rank-1])
-            b.myRank = rank
-            b.nbRank = rank - 1
-            myBoundaryPlanes.append(b)
-            # higher rank
-            b = copy(self.boundaries[rank])
-            b.myRank = rank
-            b.nbRank = rank + 1
-            b.n *= -1 # have normal point inward
-            myBoundaryPlanes.append(b)
+        last = comm.size - 1
+        if rank > 0:
+            # boundary with lower rank:
+            myBoundaryPlanes.append(self._boundaryPlane(rank-1, rank, rank-1))
+        if rank < last:
+            # boundary with higher rank, have normal point inward
+            myBoundaryPlanes.append(self._boundaryPlane(rank, rank, rank+1, flip=True))
+
+        if self.period is not None:
+            if rank == last:
+                # wrap plane, with the first rank (normal pointing inward)
+                myBoundaryPlanes.append(self._boundaryPlane(last, rank, 0, flip=True, shift=-self.period))
+            if rank == 0:
+                # image of the wrap plane, with the last rank
+                myBoundaryPlanes.append(self._boundaryPlane(last, rank, last, shift=self.period))
+
+        # walls, with their normal pointing inward
+        if rank == 0 and self.lowerWall:
+            wall = copy(self.lowerWall)
+            wall.n = self.n.copy()
+            wall.myRank = rank
+            myBoundaryPlanes.append(wall)
+        if rank == last and self.upperWall:
+            wall = copy(self.upperWall)
+            wall.n = -self.n
+            wall.myRank = rank
+            myBoundaryPlanes.append(wall)
 
         for b in myBoundaryPlanes:
             b.comm = comm
 
         return myBoundaryPlanes
 
-    def constructDomain(self, comm, particleContainers):
+    def ownerRank(self, points, size):
+        """Return the ranks owning points, for a decomposition over size ranks.
+
+        :param points: (n,3) array of positions.
+        :return: integer array of length n.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        offsets = np.array([np.dot(b.p - self.boundaries[0].p, self.n) for b in self.boundaries])
+        s = (points - self.boundaries[0].p) @ self.n
+        if self.period is not None:
+            # map s to [wrap - period, wrap)
+            wrap = offsets[size-1]
+            s = wrap - self.period + np.mod(s - wrap + self.period, self.period)
+        return np.searchsorted(offsets[:size-1], s, side='right')
+
+    def constructDomain(self, comm, particleContainers, exchangeMode='p2p', sync='fence'):
         """Construct a Domain object.
 
         :param comm: a communicator, usually MPI.COMM_WORLD
+        :param particleContainers: list of the particle containers in this domain.
+        :param str exchangeMode: 'p2p' or 'rma', see Domain.
+        :param str sync: 'fence' or 'pscw', see Domain.
         :return: a Domain object
         """
         boundaryPlanes = self.decompose(comm)
-        domain = Domain(boundaryPlanes=boundaryPlanes, particleContainers=particleContainers)
+        domain = Domain( boundaryPlanes=boundaryPlanes, particleContainers=particleContainers, comm=comm
+                       , exchangeMode=exchangeMode, sync=sync )
+        return domain
 
     @property
     def size(self):
         return len(self.boundaries)
 
-class TagStore:
-    def __init__(self):
-        self.last_tag = -1
-
-    def getTag(self, n=1):
-        """get n tags that have not been used before.
-
-        Tags are successive, e.g. if getTag(3) returns 5, you can use the tags 3, 4 and 5.
-        """
-        self.last_tag += n
-        return self.last_tag
-
-
-tagStore = TagStore()
-
 class ArraySendRecv:
     """
     Send/receive array elements to/from a neighbour.
@@ -384,46 +611,31 @@ class ArraySendRecv:
         # self.dtype = type(self.array.dtype)
         self.sendbuffer = []
         self.recvbuffer = []
-        if self.bp.nbRank > self.bp.myRank:
-            # send tag
-            self.sendtag = tagStore.getTag(n=2)
-            self.recvtag = self.sendtag - 1
-            if verbose:
-                mprint(bp, 'send tag ...')
-            bp.comm.send(self.sendtag, bp.nbRank)
-            if verbose:
-                mprint(bp, f'send tag finished: {self.sendtag=}, {self.recvtag=}')
-        else:
-            # receive tag
-            if verbose:
-                mprint(bp, 'recv tag ...')
-            self.recvtag = bp.comm.recv(source=self.bp.nbRank)
-            self.sendtag = self.recvtag - 1
-            if verbose:
-                mprint(bp, f'recv tag finished: {self.sendtag=}, {self.recvtag=}')
+        # The tags follow from the array and the plane, no handshake with the neighbour is needed.
+        self.sendtag = bp.send_tag('array', array.fullName())
+        self.recvtag = bp.recv_tag('array', array.fullName())
+        if verbose:
+            mprint(bp, f'{self.sendtag=}, {self.recvtag=}')
 
         self.parent = None
 
     def __call__(self, verbose=False):
-        # write the sendbuffer
-        self.sendbuffer = []
-        for ie in self.elements_send:
-            self.sendbuffer.append(self.array[ie])
-
-        reqsend = self.bp.comm.isend(self.sendbuffer, dest=self.bp.nbRank, tag=self.sendtag)
-        reqsend.wait()
-        reqrecv = self.bp.comm.irecv(source=self.bp.nbRank, tag=self.recvtag)
-        self.recvbuffer = reqrecv.wait()
+        # the sendbuffer holds the values as sent: packed with the dtype of the array if that
+        # makes the message smaller (see ParticleArray.packMessage()), otherwise as a list
+        self.sendbuffer = self.array.packMessage(self.elements_send)
+        received = self.bp.comm.sendrecv( self.sendbuffer, dest=self.bp.nbRank, sendtag=self.sendtag
+                                        , source=self.bp.nbRank, recvtag=self.recvtag )
+        self.recvbuffer = received
         if verbose:
             mprint(f'{self.bp}; {self.array.name}, {self.sendbuffer=}, {self.recvbuffer=}')
 
-        if self.recvbuffer:
+        if len(self.recvbuffer):
             # not empty
             # copy the contents of the recvbuffer to the array
             if self.parent and self.parent.elements_recv:
                 elements_recv = self.parent.elements_recv
-                if not len(elements_recv) == len(self.sendbuffer):
-                    raise RuntimeError(f"recvbuffer for array '{self.array.py}.{self.array.name}'")
+                if not len(elements_recv) == len(self.recvbuffer):
+                    raise RuntimeError(f"recvbuffer for array '{self.array.fullName()}' does not match the receiving elements.")
             else:
                 # find locations for the new elements
                 elements_recv = []
@@ -439,11 +651,14 @@ class ArraySendRecv:
                     self.parent.elements_recv = elements_recv
                 # else: only a single array was sent.
 
-            # mprint(f'{self.array}')
-            for i, element in enumerate(elements_recv):
-                # mprint(f'{i=}, {element=}, {self.array.name}, {self.array[element]}, {self.recvbuffer[i]}')
-                self.array[element] = self.recvbuffer[i]
-            mprint(f'{self.array}')
+            if isinstance(self.recvbuffer, np.ndarray):
+                # a single copy for a VectorArray, a slice assignment for contiguous elements
+                self.array.assign(elements_recv, self.recvbuffer)
+            else:
+                for i, element in enumerate(elements_recv):
+                    self.array[element] = self.recvbuffer[i]
+            if verbose:
+                mprint(f'{self.array}')
 
 class PcSendRecv:
     """
@@ -455,17 +670,20 @@ class PcSendRecv:
     domoin i+1 sends a message to doain i and domain i receives this message. Both messages
     correspond to the same array, instantiated in both domains.
 
-    Each domain needs as many Arraycommunicator objects as it has boundary planes.
-    It is unclear whether the definition of a neighbourhood communicator would be important.
-    let's studuy a bit
+    Each domain needs as many PcSendRecv objects as it has boundary planes. Domain.addChannel()
+    and Domain.setupChannels() create them for all planes and containers at once.
     """
-    def __init__(self, pc, bp, elements=[], verbose=False):
+    def __init__(self, pc, bp, elements=[], arrays=None, verbose=False):
+        """
+        :param arrays: names of the arrays to send, default all arrays of pc. Components of
+            VectorArrays, e.g. 'vx', can be sent separately.
+        """
         self.pc = pc
         self.bp = bp
         self.elements_send = elements # the indices of the elements that must be sent
         self.elements_recv = []
         self.asrs = []
-        for array in pc.arrays.values():
+        for array in (pc.arrays.values() if arrays is None else [pc.array(name) for name in arrays]):
             asr = ArraySendRecv(array, bp, elements=elements, verbose=verbose )
             asr.parent = self
             self.asrs.append(asr)
@@ -476,24 +694,441 @@ class PcSendRecv:
             asr(verbose=verbose)
 
 
+class GhostWindow:
+    """One-sided (RMA) communication of the positions of the ghost particles of a particle container.
+
+    Every rank exposes an MPI window over a preallocated buffer with a slot for each of its boundary
+    planes. The owner of the ghosted particles puts their positions directly into the slot of the
+    neighbour's window. The buffer has room for ``ghostCapacity`` ghost particles per slot and is
+    reallocated (collectively) by Domain.exchange() when the ghost particle containers outgrow it,
+    never during a refresh.
+
+    Objects of this class are constructed by Domain, and must be constructed on all ranks of the
+    communicator in the same order.
+    """
+    def __init__(self, pc, domain, sync='fence'):
+        """
+        :param pc: the particle container whose ghost positions are communicated.
+        :param domain: the Domain object.
+        :param str sync: synchronization of the access epochs: 'fence' (MPI_Win_fence), or 'pscw'
+            (post-start-complete-wait, which only synchronizes with the neighbours).
+        """
+        if not sync in ('fence', 'pscw'):
+            raise ValueError(f"Unknown synchronization mode '{sync}', expecting 'fence' or 'pscw'.")
+        self.pc = pc
+        self.domain = domain
+        self.sync = sync
+        self.ghostCapacity = 0
+        self.buffer = None
+        self.win = None
+        nbRanks = sorted(set(bp.nbRank for bp in domain.boundaryPlanes if not bp.isWall))
+        self.group = domain.comm.group.Incl(nbRanks)
+
+    def resize(self):
+        """(Re)allocate the window if the ghost particle containers do not fit anymore.
+
+        This is a collective operation.
+        """
+        nGhosts = max([len(bp.ghostElements.get(self.pc.name, [])) for bp in self.domain.boundaryPlanes], default=0)
+        nGhosts = self.domain.comm.allreduce(nGhosts, op=MPI.MAX)
+        if nGhosts <= self.ghostCapacity and self.win is not None:
+            return
+        self.free()
+        self.ghostCapacity = max(10, int(round(1.2 * nGhosts)))
+        nSlots = max(1, len(self.domain.boundaryPlanes))
+        self.buffer = np.zeros((nSlots, self.ghostCapacity, 3), dtype=np.float64)
+        self.win = MPI.Win.Create(self.buffer, disp_unit=self.buffer.itemsize, comm=self.domain.comm)
+
+    def free(self):
+        """Free the MPI window (collective)."""
+        if self.win is not None:
+            self.win.Free()
+            self.win = None
+
+    def __call__(self):
+        """Put the positions of the ghosted particles in the neighbours' windows, and copy the
+        positions received in the own window to the ghost particle containers.
+
+        This is a collective operation. The window must have been sized for the current ghost
+        particles by resize(), which Domain.exchange() does whenever the ghost particles are
+        rebuilt, so that a refresh involves no collective beyond the synchronization of the epochs.
+        """
+        if self.win is None:
+            raise RuntimeError(f"The ghost window of '{self.pc.name}' is not allocated, call Domain.exchange() first.")
+        domain = self.domain
+        with profiler.timer('wait'):
+            if self.sync == 'fence':
+                self.win.Fence()
+            else:
+                self.win.Post(self.group)
+                self.win.Start(self.group)
+
+        for ibp, bp in enumerate(domain.boundaryPlanes):
+            elements = bp.ghostElements.get(self.pc.name, [])
+            if elements:
+                positions = domain.ghostPositions(self.pc, elements, shift=bp.shift)
+                disp = domain.remoteSlots[ibp] * self.ghostCapacity * 3
+                profiler.count(bp.counterName(self.pc, 'ghostPositions'), nbytes=positions.nbytes)
+                self.win.Put(positions, bp.nbRank, target=(disp, positions.size, MPI.DOUBLE))
+
+        with profiler.timer('wait'):
+            if self.sync == 'fence':
+                self.win.Fence()
+            else:
+                self.win.Complete()
+                self.win.Wait()
+
+        for ibp, bp in enumerate(domain.boundaryPlanes):
+            ghosts = bp.ghostPCs.get(self.pc.name)
+            if ghosts is not None:
+                domain.setGhostPositions(ghosts, self.buffer[ibp, :ghosts.size])
+
+
 class Domain:
     """
     Domain objects are responsible for communication between neighbours
+
+    Between two rebuilds of the ghost particles (see exchange()), only the positions of the ghost
+    particles change. They are refreshed with refreshGhostPositions(), which can use two different
+    communication mechanisms, selected by exchangeMode:
+
+    * 'p2p': two-sided communication, every boundary plane sends the positions of its ghosted
+      particles to the neighbour and receives the positions of the neighbour's.
+    * 'rma': one-sided communication, the owner puts the positions of its ghosted particles in
+      an MPI window of the neighbour (see GhostWindow).
     """
-    def __init__(self, boundaryPlanes, particleContainers):
+    def __init__(self, boundaryPlanes, particleContainers, comm=None, exchangeMode='p2p', sync='fence'):
+        """
+        :param boundaryPlanes: the BoundaryPlanes of this domain, as returned by ParallelSlabs.decompose().
+        :param particleContainers: list of particle containers in this domain.
+        :param comm: MPI communicator, usually MPI.COMM_WORLD
+        :param str exchangeMode: 'p2p' or 'rma'.
+        :param str sync: synchronization mode of the RMA epochs, 'fence' or 'pscw', (only used if
+            exchangeMode=='rma').
+        """
+        if not exchangeMode in ('p2p', 'rma'):
+            raise ValueError(f"Unknown exchangeMode '{exchangeMode}', expecting 'p2p' or 'rma'.")
         self.boundaryPlanes = boundaryPlanes
         self.particleContainers = particleContainers
+        self.comm = MPI.COMM_WORLD if comm is None else comm
+        self.exchangeMode = exchangeMode
+
+        # The neighbourhood communicator, see neighbourExchange(). Tell each neighbour at which
+        # slot of our ghost windows it must put the positions of its ghosts.
+        planes = self.neighbourPlanes
+        self.sendOrder = sorted(range(len(planes)), key=lambda i: (planes[i].nbRank, planes[i].direction))
+        self.recvOrder = sorted(range(len(planes)), key=lambda i: (planes[i].nbRank, 1 - planes[i].direction))
+        self.neighbourComm = self.comm.Create_dist_graph_adjacent( sources=[planes[i].nbRank for i in self.recvOrder]
+                                                                 , destinations=[planes[i].nbRank for i in self.sendOrder]
+                                                                 , reorder=False )
+        slots = iter(self.neighbourExchange([ibp for ibp, bp in enumerate(self.boundaryPlanes) if not bp.isWall]))
+        self.remoteSlots = [None if bp.isWall else next(slots) for bp in self.boundaryPlanes]
+        self.channelRequests = [] # see addChannel()
+
+        # For the spatial queries (see query()): the boundary planes of all ranks, and the
+        # translations of the periodic images of a query.
+        self.regions = self.comm.allgather([(bp.p, bp.n) for bp in self.boundaryPlanes])
+        shifts = {}
+        for rankShifts in self.comm.allgather([bp.shift for bp in self.boundaryPlanes if bp.shift is not None]):
+            for shift in rankShifts:
+                for s in (shift, -shift):
+                    shifts.setdefault(tuple(np.round(s, 12)), s)
+        self.imageShifts = [np.zeros(3)] + list(shifts.values())
+
+        self.ghostWindows = {}
+        if exchangeMode == 'rma':
+            for pc in particleContainers:
+                self.ghostWindows[pc.name] = GhostWindow(pc, self, sync=sync)
+
+    @property
+    def neighbourPlanes(self):
+        """The BoundaryPlanes with a neighbouring domain, i.e. all but the walls."""
+        return [bp for bp in self.boundaryPlanes if not bp.isWall]
+
+    @property
+    def walls(self):
+        return [bp for bp in self.boundaryPlanes if bp.isWall]
+
+    def neighbourExchange(self, objects):
+        """Send objects[i] to the neighbour across the i-th plane of neighbourPlanes, and receive an
+        object from every neighbour, in a single neighbourhood collective (collective).
+
+        The messages are paired by plane: what a rank sends across a plane is received across
+        the same plane by the neighbour, also when two ranks share two planes (a periodic
+        decomposition over two ranks). This works because the edges of the neighbourhood
+        communicator are ordered by neighbour rank and plane direction.
+
+        :param list objects: a picklable object per neighbour plane.
+        :return: list with the object received across every neighbour plane.
+        """
+        received = self.neighbourComm.neighbor_alltoall([objects[i] for i in self.sendOrder])
+        result = len(objects) * [None]
+        for j, i in enumerate(self.recvOrder):
+            result[i] = received[j]
+        return result
+
+    def addChannel(self, pc, elements, arrays=None):
+        """Register a channel sending elements of particle container pc to the neighbours.
 
-        self.communications = []
-        for pc in particleContainers:
-            # attach an empty ghostParticleContainer
-            pc.ghostParticles = pc.clone(name='ghostParticles')
+        This is local. The channels are created by setupChannels().
 
-            for array in pc.arrays.values():
-                for bp in self.boundaryPlanes:
-                    asr = ArraySendRecv(bp,array)
-                    self.communications.append(sender)
-                    recver = ArrayReceiver(bp,array)
-                    self.communications.append(recver)
+        :param pc: a particle container.
+        :param elements: list with, for every plane of neighbourPlanes, the list of elements to send across it.
+        :param arrays: names of the arrays to send, default all arrays of pc. Components of
+            VectorArrays, e.g. 'vx', can be sent separately.
+        """
+        if len(elements) != len(self.neighbourPlanes):
+            raise ValueError(f"Expecting a list of elements for each of the {len(self.neighbourPlanes)} neighbour planes.")
+        self.channelRequests.append((pc, elements, arrays))
+
+    def setupChannels(self, verbose=False):
+        """Create the channels registered by addChannel() (collective).
 
+        The ranks resolve their channels in a single neighbourhood exchange. Every rank tells each
+        neighbour which channels it registered and how many elements it will send, instead of
+        a handshake per array and plane. The elements receiving the neighbour's particles are
+        allocated in bulk, so the channels are ready for use.
 
+        Neighbouring ranks must register the same containers and arrays in the same order.
+
+        :return: list with, for every registered channel, a list of PcSendRecv, one per neighbour plane.
+        :raises RuntimeError: if the channels registered by neighbouring ranks do not match.
+        """
+        requests, self.channelRequests = self.channelRequests, []
+        planes = self.neighbourPlanes
+        def describe(ibp):
+            return [ (pc.name, tuple(pc.arrays) if arrays is None else tuple(arrays), len(elements[ibp]))
+                     for pc, elements, arrays in requests ]
+        mine = [describe(ibp) for ibp in range(len(planes))]
+        theirs = self.neighbourExchange(mine)
+        for bp, m, t in zip(planes, mine, theirs):
+            if [c[:2] for c in m] != [c[:2] for c in t]:
+                raise RuntimeError(f"Channels of rank {bp.myRank} {[c[:2] for c in m]} and its neighbour rank {bp.nbRank} {[c[:2] for c in t]} do not match.")
+        channels = []
+        for k, (pc, elements, arrays) in enumerate(requests):
+            pcChannels = []
+            for ibp, bp in enumerate(planes):
+                psr = PcSendRecv(pc, bp, elements=elements[ibp], arrays=arrays, verbose=verbose)
+                psr.elements_recv = pc.addElements(theirs[ibp][k][2]).tolist()
+                pcChannels.append(psr)
+            channels.append(pcChannels)
+        return channels
+
+    def exchange(self, ghostWidth, verbose=False):
+        """Move the particles that left the domain to the neighbouring domains, and rebuild the
+        ghost particles.
+
+        This is a collective operation.
+        """
+        with profiler.timer('exchange'):
+            for bp in self.neighbourPlanes:
+                for pc in self.particleContainers:
+                    bp.findLeavingParticles(pc, comm=self.comm, verbose=verbose)
+            for bp in self.neighbourPlanes:
+                for pc in self.particleContainers:
+                    bp.findGhostParticles(pc, ghostWidth=ghostWidth, comm=self.comm, verbose=verbose)
+        for window in self.ghostWindows.values():
+            window.resize()
+
+    def refreshGhostPositions(self):
+        """Update the positions of the ghost particles, without changing the set of ghost particles.
+
+        This is a collective operation.
+        """
+        if self.exchangeMode == 'rma':
+            for window in self.ghostWindows.values():
+                window()
+        else:
+            for bp in self.neighbourPlanes:
+                for pc in self.particleContainers:
+                    elements = bp.ghostElements.get(pc.name, [])
+                    positions = self.ghostPositions(pc, elements, shift=bp.shift)
+                    profiler.count(bp.counterName(pc, 'ghostPositions'), nbytes=positions.nbytes)
+                    with profiler.timer('wait'):
+                        received = self.comm.sendrecv( positions, dest=bp.nbRank, sendtag=bp.send_tag('positions', pc.name)
+                                                     , source=bp.nbRank, recvtag=bp.recv_tag('positions', pc.name) )
+                    ghosts = bp.ghostPCs.get(pc.name)
+                    if ghosts is not None:
+                        self.setGhostPositions(ghosts, received)
+
+    def ghostPositions(self, pc, elements, shift=None):
+        """Return a contiguous (len(elements),3) array with the positions of elements in pc,
+        translated by shift, if not None.
+        """
+        positions = particlePositions(pc, elements)
+        if shift is not None:
+            positions += shift
+        return positions
+
+    def setGhostPositions(self, ghosts, positions):
+        """Copy positions to the ghost particle container ghosts.
+
+        The ghost particles occupy the first ghosts.size elements, in the order in which
+        they were ghosted.
+        """
+        n = ghosts.size
+        r = positionArray(ghosts)
+        if r is not None:
+            r.data[:n] = positions[:n]
+            return
+        ghosts.rx[:n] = positions[:n, 0].tolist()
+        ghosts.ry[:n] = positions[:n, 1].tolist()
+        ghosts.rz[:n] = positions[:n, 2].tolist()
+
+    def spatialIndex(self, pc, cellSize=None):
+        """A CellIndex of the positions of the live particles of pc (local)."""
+        elements = np.flatnonzero(pc.alive)
+        return CellIndex(particlePositions(pc, elements), elements, cellSize=cellSize)
+
+    def query(self, pc, queries, arrays=None, cellSize=None):
+        """Find the particles of pc matching queries on all ranks (collective).
+
+        Every rank passes its own list of queries (see mpitoy.query), possibly empty. A query is
+        sent only to the ranks whose domain it may intersect, including its periodic images.
+        These ranks answer it with a spatialIndex() of their particles (the ghost particles are
+        not searched), and send back the records of the matching particles.
+
+        A Nearest query takes two rounds. The ranks whose domain contains the centre, or one of its
+        periodic images, return their k nearest particles to those images, and the distance of the
+        k-th nearest of those is the radius of a Sphere query. The Sphere is sent to every rank
+        and image that was not searched in the first round, which includes the other images of the
+        centre on the ranks of the first round. A particle found by both rounds is returned once.
+
+        :param arrays: names of the arrays in the records, default all.
+        :param float cellSize: cell size of the spatial indices, see CellIndex.
+        :return: list with a dict for every query, with the 'records' of the particles found (see
+            ParticleContainer.packRecords()), the 'ranks' owning them, and the 'distances' to the
+            centre, or None for queries without a centre. Sphere and Nearest results are sorted
+            by distance.
+        """
+        with profiler.timer('query'):
+            found = [[] for query in queries]
+            index = {} # built on first use
+            contacted = self._queryRound(pc, list(enumerate(queries)), found, arrays, cellSize, index)
+            second = []
+            for j, query in enumerate(queries):
+                if isinstance(query, Nearest):
+                    d = np.sort(np.concatenate([[]] + [distances for rank, elements, records, distances in found[j]]))
+                    second.append((j, Sphere(query.center, d[query.k - 1] if len(d) >= query.k else np.inf)))
+            self._queryRound(pc, second, found, arrays, cellSize, index, exclude=contacted)
+            return [self._queryResult(pc, query, found[j], arrays) for j, query in enumerate(queries)]
+
+    def queryBox(self, pc, lo=None, hi=None, arrays=None):
+        """Find the particles of pc in the box [lo, hi], see query(). Ranks without a query pass
+        lo=None, and get None."""
+        return self._querySingle(pc, None if lo is None else Box(lo, hi), arrays)
+
+    def querySphere(self, pc, center=None, radius=None, arrays=None):
+        """Find the particles of pc within radius of center, see query()."""
+        return self._querySingle(pc, None if center is None else Sphere(center, radius), arrays)
+
+    def querySlab(self, pc, p=None, n=None, halfWidth=None, arrays=None):
+        """Find the particles of pc within halfWidth of the plane through p with normal n, see query()."""
+        return self._querySingle(pc, None if p is None else Slab(p, n, halfWidth), arrays)
+
+    def queryNearest(self, pc, center=None, k=None, arrays=None):
+        """Find the k particles of pc nearest to center, see query()."""
+        return self._querySingle(pc, None if center is None else Nearest(center, k), arrays)
+
+    def _querySingle(self, pc, query, arrays):
+        results = self.query(pc, [] if query is None else [query], arrays=arrays)
+        return results[0] if results else None
+
+    def _queryRound(self, pc, queries, found, arrays, cellSize, index, exclude=None):
+        """Send the queries [(j, query), ...] to the ranks they may intersect, answer the queries
+        received, and append the answers to found[j] (collective).
+
+        :param exclude: dict j -> set of (rank, shift) pairs not to send query j to, e.g. the
+            return value of a previous round.
+        :return: dict j -> set of the (rank, shift) pairs query j was sent to, shift as a tuple.
+        """
+        outgoing, contacted = {}, {}
+        for j, query in queries:
+            bound = query.bound()
+            excluded = exclude.get(j, ()) if exclude else ()
+            for rank, region in enumerate(self.regions):
+                shifts = [ shift for shift in self.imageShifts
+                           if not (rank, tuple(shift)) in excluded and intersects(bound.translated(shift), region) ]
+                if shifts:
+                    outgoing.setdefault(rank, []).append((j, query, shifts))
+                    contacted.setdefault(j, set()).update((rank, tuple(shift)) for shift in shifts)
+
+        tag = messageTag(pc.name, 'query', 0)
+        counts = np.zeros(self.comm.size, dtype=np.int64)
+        counts[list(outgoing)] = 1
+        sources = np.empty_like(counts)
+        self.comm.Alltoall(counts, sources)
+        requests = self._pointToPoint(pc, outgoing, np.flatnonzero(sources).tolist(), tag)
+
+        replies = {}
+        for rank, items in requests.items():
+            if not index:
+                index['index'] = self.spatialIndex(pc, cellSize)
+            replies[rank] = [(j,) + self._search(pc, index['index'], query, shifts, arrays) for j, query, shifts in items]
+        answers = self._pointToPoint(pc, replies, list(outgoing), messageTag(pc.name, 'query', 1))
+        for rank, items in answers.items():
+            for j, elements, records, distances in items:
+                found[j].append((rank, elements, records, distances))
+        return contacted
+
+    def _pointToPoint(self, pc, outgoing, sources, tag):
+        """Send outgoing[rank] to every rank, and receive a message from every rank in sources.
+
+        :return: dict rank -> received object.
+        """
+        rank = self.comm.rank
+        requests = []
+        for dest, obj in outgoing.items():
+            if dest != rank:
+                profiler.countObject(f'query:{pc.name}:{rank}->{dest}', obj)
+                requests.append(self.comm.isend(obj, dest=dest, tag=tag))
+        received = {source: outgoing[rank] if source == rank else self.comm.recv(source=source, tag=tag) for source in sources}
+        with profiler.timer('wait'):
+            MPI.Request.waitall(requests)
+        return received
+
+    @staticmethod
+    def _search(pc, index, query, shifts, arrays):
+        """Answer query and its images translated by shifts with index.
+
+        :return: (elements, records, distances), distances is None for queries without a centre.
+        """
+        elements, distances = zip(*[query.translated(shift).search(index) for shift in shifts])
+        elements = np.concatenate(elements)
+        if distances[0] is None:
+            elements = np.unique(elements)
+            return elements, pc.packRecords(elements, arrays=arrays), None
+        # a particle matching several images is returned once, with the smallest distance
+        distances = np.concatenate(distances)
+        order = np.argsort(distances, kind='stable')
+        elements, first = np.unique(elements[order], return_index=True)
+        distances = distances[order][first]
+        order = np.argsort(distances, kind='stable')
+        if isinstance(query, Nearest):
+            order = order[:query.k]
+        return elements[order], pc.packRecords(elements[order], arrays=arrays), distances[order]
+
+    @staticmethod
+    def _queryResult(pc, query, found, arrays):
+        """Combine the answers [(rank, elements, records, distances), ...] to query."""
+        records = np.concatenate([pc.packRecords([], arrays=arrays)] + [r for rank, e, r, d in found])
+        ranks = np.concatenate([np.empty(0, dtype=np.int64)] + [np.full(len(r), rank, dtype=np.int64) for rank, e, r, d in found])
+        if not isinstance(query, (Sphere, Nearest)):
+            return {'records': records, 'ranks': ranks, 'distances': None}
+        distances = np.concatenate([np.empty(0)] + [d for rank, e, r, d in found])
+        order = np.argsort(distances, kind='stable')
+        if isinstance(query, Nearest):
+            # both rounds may find a particle, through different images: keep the nearest
+            elements = np.concatenate([np.empty(0, dtype=np.int64)] + [e for rank, e, r, d in found])
+            pairs = np.stack([ranks, elements], axis=1)[order]
+            first = np.unique(pairs, axis=0, return_index=True)[1]
+            order = order[np.sort(first)][:query.k]
+        return {'records': records[order], 'ranks': ranks[order], 'distances': distances[order]}
+
+    def free(self):
+        """Free the MPI windows, if any, and the neighbourhood communicator (collective)."""
+        for window in self.ghostWindows.values():
+            window.free()
+        if self.neighbourComm is not None:
+            self.neighbourComm.Free()
+            self.neighbourComm = None
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module mpitoy.idallocator
+==========================
+
+A submodule for allocating globally unique particle ids.
+
+Ids are 64-bit integers. The allocator keeps the next free id (self.next), which is the same on
+all ranks. There are two ways to obtain ids:
+
+* allocate(n) is collective. Every rank obtains a contiguous range of n ids. The ranges are
+  computed with a prefix sum (Exscan) over the local counts, so they follow the rank order.
+* allocateLocal(n) is not collective, and is meant for particles that are injected mid-run
+  by a single rank (e.g. by an inflow wall). Rank r of size ranks draws the ids
+  next + r, next + r + size, next + r + 2*size, ... so that the ranks never draw the same id.
+  The next collective allocate() skips all ids drawn locally since the previous one.
+"""
+
+import numpy as np
+from mpi4py import MPI
+
+
+class IdAllocator:
+    """Allocate globally unique 64-bit particle ids."""
+    def __init__(self, comm=MPI.COMM_WORLD, next=0):
+        """
+        :param comm: MPI communicator
+        :param int next: the first id to allocate, must be the same on all ranks. When
+            restarting, use the maximum id in use + 1 (see maxId()), not the number of particles:
+            ids are sparse after allocateLocal(), absorbing walls and kills.
+        """
+        self.comm = comm
+        self.next = np.int64(next) # next free id, the same on all ranks
+        self.nLocal = 0            # number of ids drawn by allocateLocal() since self.next
+
+    def allocate(self, n):
+        """Allocate n ids on this rank (collective).
+
+        :return: int64 array with n contiguous ids.
+        """
+        count = np.array([n], dtype=np.int64)
+        before = np.zeros(1, dtype=np.int64)
+        self.comm.Exscan(count, before, op=MPI.SUM)
+        if self.comm.rank == 0:
+            before[0] = 0 # Exscan leaves the receive buffer of rank 0 undefined
+        # The maximum of the inclusive prefix sum is the total count. The ids drawn locally since
+        # the last collective allocation are skipped.
+        local = np.array([before[0] + n, self.nLocal], dtype=np.int64)
+        maxima = np.empty_like(local)
+        self.comm.Allreduce(local, maxima, op=MPI.MAX)
+        first = self.next + maxima[1] * self.comm.size
+        ids = first + before[0] + np.arange(n, dtype=np.int64)
+        self.next = first + maxima[0]
+        self.nLocal = 0
+        return ids
+
+    @staticmethod
+    def maxId(pcs, comm=MPI.COMM_WORLD):
+        """Return the maximum id of the live particles in the particle containers pcs over all
+        ranks, or -1 if there are none (collective).
+        """
+        local = max((max((pc.id[i] for i in range(pc.capacity) if pc.alive[i]), default=-1) for pc in pcs), default=-1)
+        return comm.allreduce(local, op=MPI.MAX)
+
+    def allocateLocal(self, n):
+        """Allocate n ids on this rank, without communication.
+
+        :return: int64 array with n ids (not contiguous).
+        """
+        k = self.nLocal + np.arange(n, dtype=np.int64)
+        self.nLocal += n
+        return self.next + k * self.comm.size + self.comm.rank
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module mpitoy.memory
+==========================
+
+A submodule for accounting the memory of the particle containers, and limiting it.
+
+ParticleContainer.grow() increases the capacity, and nothing shrinks it, so a rank that
+briefly received a burst of particles keeps the memory. memoryReport() reports, per container
+and per array, the bytes used versus reserved, the live fraction and the peak capacity, reduced
+over the ranks. A memory budget compacts the containers (see ParticleContainer.compact()) when
+the memory reserved by them exceeds a limit::
+
+    from mpitoy import memory
+    memory.setBudget(2**30, callback=lambda pcs, before, after: print(f'compacted {before} -> {after} bytes'))
+
+Simulation checks the budget at the points where compaction is safe: before the halo is
+rebuilt, or, without halo exchange, at the start of move().
+
+The bytes are estimates, see ParticleArray.itemsize().
+"""
+
+import numpy as np
+from mpi4py import MPI
+
+
+def reservedBytes(pcs):
+    """Total number of bytes reserved by the particle containers pcs (local)."""
+    return sum(pc.memory()['reserved'] for pc in pcs)
+
+
+def memoryReport(pcs, comm=MPI.COMM_WORLD):
+    """Reduce the memory footprint of the particle containers pcs across the ranks of comm (collective).
+
+    Containers with the same name on a rank (e.g. the ghost containers of several boundary
+    planes) are added. Ranks without a container contribute zero.
+
+    :return: dict with keys 'containers', 'arrays' and 'total'. 'containers' maps every container
+        name to a dict with the 'capacity', 'size', 'peakCapacity', 'liveFraction', 'reserved'
+        and 'used' bytes, each a dict with the 'min', 'mean', 'max' and 'sum' over the ranks.
+        'arrays' maps 'container.array' to the 'reserved' and 'used' bytes, and 'total' has the
+        'reserved' and 'used' bytes of all containers.
+    """
+    containerFields = ('capacity', 'size', 'peakCapacity', 'liveFraction', 'reserved', 'used')
+    arrayFields = ('reserved', 'used')
+    containers, arrays = {}, {}
+    for pc in pcs:
+        memory = pc.memory()
+        entry = containers.setdefault(pc.name, dict.fromkeys(containerFields, 0))
+        for field in containerFields:
+            if field != 'liveFraction':
+                entry[field] += memory[field]
+        entry['liveFraction'] = entry['size'] / entry['capacity']
+        for name, m in memory['arrays'].items():
+            entry = arrays.setdefault(f'{pc.name}.{name}', dict.fromkeys(arrayFields, 0))
+            for field in arrayFields:
+                entry[field] += m[field]
+    total = {field: sum(entry[field] for entry in containers.values()) for field in arrayFields}
+
+    result = {}
+    for kind, table, fields in (('containers', containers, containerFields), ('arrays', arrays, arrayFields), ('total', {'total': total}, arrayFields)):
+        names = sorted(set().union(*comm.allgather(list(table.keys()))))
+        zeros = dict.fromkeys(fields, 0)
+        local = np.array([[table.get(name, zeros)[field] for field in fields] for name in names], dtype=np.float64).reshape(len(names), len(fields))
+        reduced = {}
+        for op, key in ((MPI.MIN, 'min'), (MPI.MAX, 'max'), (MPI.SUM, 'sum')):
+            reduced[key] = np.empty_like(local)
+            comm.Allreduce(local, reduced[key], op=op)
+        entries = {}
+        for j, name in enumerate(names):
+            entries[name] = { field: { 'min': reduced['min'][j, k], 'mean': reduced['sum'][j, k] / comm.size
+                                     , 'max': reduced['max'][j, k], 'sum': reduced['sum'][j, k] }
+                              for k, field in enumerate(fields) }
+        result[kind] = entries
+    result['total'] = result['total']['total']
+    return result
+
+
+def formatReport(report):
+    """Format a report (see memoryReport()) as a table."""
+    lines = [f"{'container':<32} {'live':>6} {'peak':>10} {'min [B]':>12} {'max [B]':>12} {'sum [B]':>12}  (reserved)"]
+    for name, entry in report['containers'].items():
+        r = entry['reserved']
+        lines.append( f"{name:<32} {entry['liveFraction']['min']:6.2f} {int(entry['peakCapacity']['max']):10d}"
+                      f" {int(r['min']):12d} {int(r['max']):12d} {int(r['sum']):12d}" )
+    r, u = report['total']['reserved'], report['total']['used']
+    lines.append(f"{'total reserved':<32} {'':>6} {'':>10} {int(r['min']):12d} {int(r['max']):12d} {int(r['sum']):12d}")
+    lines.append(f"{'total used':<32} {'':>6} {'':>10} {int(u['min']):12d} {int(u['max']):12d} {int(u['sum']):12d}")
+    return '\n'.join(lines)
+
+
+class MemoryBudget:
+    """Compact particle containers when the memory they reserve exceeds a limit."""
+    def __init__(self, limit, callback=None):
+        """
+        :param int limit: maximum number of bytes reserved by the containers on a rank.
+        :param callback: called as callback(pcs, before, after) after a compaction, with the
+            reserved bytes before and after.
+        """
+        self.limit = limit
+        self.callback = callback
+        self.nCompactions = 0
+
+    def __call__(self, pcs):
+        """Compact the particle containers pcs if they reserve more than self.limit bytes (local).
+
+        :return: True if the containers were compacted.
+        """
+        before = reservedBytes(pcs)
+        if before <= self.limit:
+            return False
+        for pc in pcs:
+            pc.compact()
+        self.nCompactions += 1
+        if self.callback:
+            self.callback(pcs, before, reservedBytes(pcs))
+        return True
+
+
+budget = None
+
+
+def setBudget(limit, callback=None):
+    """Set the global memory budget (see MemoryBudget), or remove it if limit is None."""
+    global budget
+    budget = None if limit is None else MemoryBudget(limit, callback=callback)
+    return budget
+
+
+def checkBudget(pcs):
+    """Apply the global memory budget, if any, to the particle containers pcs (local).
+
+    Compaction invalidates element indices held outside the containers, so call this only where
+    there are none.
+
+    :return: True if the containers were compacted.
+    """
+    return budget(pcs) if budget is not None else False
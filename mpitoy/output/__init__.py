@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module mpitoy.output
+==========================
+
+A submodule for asynchronous simulation output.
+
+The simulation hands a snapshot (a copy of the live particle arrays, see snapshot()) and a
+writer function to an OutputPipeline. A background thread calls the writer, so
+that the timestep loop only pays for copying the arrays. The queue between the simulation and
+the background worker is bounded. When it is full, the pipeline either blocks until there is
+room again (policy='block'), or drops the output (policy='drop').
+
+For parallel runs, a FrameWriter gathers the particles of all ranks to a writer rank, which renders
+one global frame, with the domain boundaries overlaid, into a frame directory. The frames are
+assembled into an animation with mpitoy.viz.makeMovie().
+
+This module does not import matplotlib, the rendering is done by mpitoy.viz, which is only imported
+by the ranks that render.
+"""
+
+import os
+import queue
+import threading
+
+import numpy as np
+from mpi4py import MPI
+
+
+def snapshot(sim, arrays=None):
+    """Copy the live particles of Simulation sim.
+
+    :param arrays: names of the arrays to copy, or None for all arrays.
+    :return: dict with keys 't', 'name' and 'pcs'. The latter is a dict with a dict of numpy arrays
+        for every particle container.
+    """
+    pcs = {}
+    for pc in sim.pcs:
+        elements = [i for i in range(pc.capacity) if pc.alive[i]]
+        names = pc.arrays.keys() if arrays is None else arrays
+        pcs[pc.name] = { name: np.array([pc.array(name)[i] for i in elements], dtype=pc.array(name).dtype())
+                         for name in names }
+    return {'t': sim.t, 'name': sim.name, 'pcs': pcs}
+
+
+def _work(q, stats):
+    """Body of the background worker.
+
+    An exception raised by a writer is recorded in stats['error'], and the remaining tasks are
+    skipped (but still taken from the queue), so that the simulation never blocks on a dead
+    worker. The error is raised again by OutputPipeline.submit(), join() or close().
+    """
+    while True:
+        item = q.get()
+        try:
+            if item is None:
+                break
+            if stats['error'] is None:
+                writer, args = item
+                writer(*args)
+                stats['written'] += 1
+            else:
+                stats['skipped'] += 1
+        except Exception as error:
+            stats['error'] = error
+        finally:
+            q.task_done()
+
+
+class OutputPipeline:
+    """Bounded queue of output tasks, executed by a background thread.
+
+    Background processes are deliberately not supported: forking an MPI rank is unsafe with most
+    MPI implementations.
+    """
+    POLICIES = ('block', 'drop')
+
+    def __init__(self, maxsize=4, policy='block'):
+        """
+        :param int maxsize: maximum number of pending output tasks.
+        :param str policy: what to do when the queue is full: 'block' (wait until the worker has
+            room) or 'drop' (discard the output).
+        """
+        if not policy in OutputPipeline.POLICIES:
+            raise ValueError(f"Unknown policy '{policy}', expecting one of {OutputPipeline.POLICIES}.")
+        self.policy = policy
+        self.nSubmitted = 0
+        self.nDropped = 0
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.stats = {'written': 0, 'skipped': 0, 'error': None}
+        self.worker = threading.Thread(target=_work, args=(self.queue, self.stats), daemon=True)
+        self.worker.start()
+
+    def _raise(self):
+        error = self.stats['error']
+        if error is not None:
+            raise RuntimeError(f"Output task failed: {error!r}.") from error
+
+    def submit(self, writer, *args):
+        """Schedule writer(*args) for execution in the background.
+
+        :return: True if the task was queued, False if it was dropped.
+        :raises RuntimeError: if a previous task failed.
+        """
+        self._raise()
+        if not self.worker.is_alive():
+            raise RuntimeError("The OutputPipeline is closed.")
+        if self.policy == 'block':
+            self.queue.put((writer, args))
+        else:
+            try:
+                self.queue.put_nowait((writer, args))
+            except queue.Full:
+                self.nDropped += 1
+                return False
+        self.nSubmitted += 1
+        return True
+
+    def join(self):
+        """Wait until all queued tasks are executed.
+
+        :raises RuntimeError: if a task failed.
+        """
+        self.queue.join()
+        self._raise()
+
+    def close(self):
+        """Execute the remaining tasks and stop the worker.
+
+        :raises RuntimeError: if a task failed.
+        """
+        if self.worker.is_alive():
+            self.queue.put(None) # the worker keeps draining the queue, so this does not block forever
+            self.worker.join()
+        self._raise()
+
+    @property
+    def nWritten(self):
+        """Number of tasks executed successfully."""
+        return self.stats['written']
+
+
+FRAME_DTYPE = np.dtype([('id', np.int64), ('rx', np.float64), ('ry', np.float64), ('radius', np.float64)])
+
+
+class FrameWriter:
+    """Render global frames of a parallel Simulation into a frame directory.
+
+    write() gathers the live particles of all ranks (Gatherv) to a writer rank, which renders the
+    frame in the background with mpitoy.viz.savePlot(). Non-writer ranks only take part in the
+    gather. For large runs, several writer ranks can be used: frames are assigned to them round
+    robin, so that rendering is spread over the writer ranks.
+    """
+    def __init__(self, directory, comm=MPI.COMM_WORLD, nWriters=1, boundaryPlanes=None, colors=None, xbound=None, ybound=None):
+        """
+        :param str directory: directory for the frames (created if necessary). Frame k is
+            saved as 'frame_<k>.png'.
+        :param comm: MPI communicator. The constructor and all methods are collective.
+        :param int nWriters: number of writer ranks, spread evenly over the ranks of comm.
+        :param boundaryPlanes: BoundaryPlanes of this rank, overlaid on the frames.
+        :param colors: colour table indexed by particle id, defaults to mpitoy.simulation.colors()
+            at the time of writing. If there is no table, the colours are computed from the ids,
+            see mpitoy.viz.idColors().
+        """
+        self.directory = directory
+        self.comm = comm
+        nWriters = max(1, min(nWriters, comm.size))
+        self.writers = [i * comm.size // nWriters for i in range(nWriters)]
+        self.colors = colors
+        self.xbound = xbound
+        self.ybound = ybound
+        # the boundary planes do not change, so they are collected once.
+        planes = {}
+        for rankPlanes in comm.allgather([(tuple(bp.p.tolist()), tuple(bp.n.tolist())) for bp in boundaryPlanes or []]):
+            for p, n in rankPlanes:
+                # a plane and its flipped copy on the neighbouring rank have the same trace
+                key = (tuple(np.round(p, 12)), tuple(np.round(np.abs(n), 12)))
+                planes.setdefault(key, (p, n))
+        self.planes = list(planes.values())
+        self.nFrames = 0
+        self.pipeline = None
+        if comm.rank in self.writers:
+            os.makedirs(directory, exist_ok=True)
+            self.pipeline = OutputPipeline(policy='block')
+
+    def frameFilename(self, k):
+        return os.path.join(self.directory, f'frame_{k:05d}.png')
+
+    def gather(self, sim, root):
+        """Gather the live particles of all ranks to rank root (collective).
+
+        :return: a structured array with dtype FRAME_DTYPE on rank root, None elsewhere.
+        """
+        snap = snapshot(sim, arrays=FRAME_DTYPE.names)
+        records = np.empty(sum(len(arrays['id']) for arrays in snap['pcs'].values()), dtype=FRAME_DTYPE)
+        for name in FRAME_DTYPE.names:
+            records[name] = np.concatenate([arrays[name] for arrays in snap['pcs'].values()]) if snap['pcs'] else []
+        counts = self.comm.gather(len(records), root=root)
+        if self.comm.rank != root:
+            self.comm.Gatherv(records.view(np.uint8), None, root=root)
+            return None
+        counts = np.array(counts, dtype=np.int64)
+        received = np.empty(int(counts.sum()), dtype=FRAME_DTYPE)
+        nbytes = counts * FRAME_DTYPE.itemsize
+        self.comm.Gatherv(records.view(np.uint8), [received.view(np.uint8), (nbytes, np.cumsum(nbytes) - nbytes), MPI.BYTE], root=root)
+        return received
+
+    def write(self, sim, title=None):
+        """Gather and render a frame of Simulation sim (collective).
+
+        The rendering is done by a background thread of the writer rank.
+        """
+        k = self.nFrames
+        self.nFrames += 1
+        root = self.writers[k % len(self.writers)]
+        records = self.gather(sim, root)
+        if records is not None:
+            from mpitoy import viz
+            colors = self.colors
+            if colors is None:
+                import mpitoy.simulation
+                colors = mpitoy.simulation.colors()
+            snap = {'t': sim.t, 'name': sim.name, 'pcs': {'frame': {name: records[name] for name in FRAME_DTYPE.names}}}
+            if title is None:
+                title = (sim.name + ', ' if sim.name else '') + f't={round(sim.t,2)}'
+            self.pipeline.submit(viz.savePlot, snap, self.frameFilename(k), colors, self.xbound, self.ybound, title, self.planes)
+
+    def close(self):
+        """Finish rendering the frames (collective).
+
+        When close() returns, all frames are on disk.
+
+        :raises RuntimeError: on all ranks, if rendering failed on any writer rank.
+        """
+        error = None
+        if self.pipeline is not None:
+            try:
+                self.pipeline.close()
+            except RuntimeError as e:
+                error = e
+            self.pipeline = None
+        # all ranks fail if a writer rank failed, rather than waiting in a barrier
+        failed = self.comm.allreduce(error is not None, op=MPI.LOR)
+        if error is not None:
+            raise error
+        if failed:
+            raise RuntimeError("Rendering frames failed on a writer rank.")
+
+    def movie(self, filename, fps=10):
+        """Assemble the frames into an animation on the first writer rank (collective, after close())."""
+        if self.comm.rank == self.writers[0]:
+            from mpitoy import viz
+            viz.makeMovie([self.frameFilename(k) for k in range(self.nFrames)], filename, fps=fps)
+        self.comm.Barrier()
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module mpitoy.packing
+==========================
+
+A submodule for generating initial particle configurations in bulk.
+
+The generators compute the particle positions with numpy, for all particles at once, and
+addSpheres() adds them to a particle container with ParticleContainer.addElements() and
+ParticleArray.assign(), rather than element by element.
+
+All generators fill the box [lower, upper) with whole spheres, and return a (positions, ids)
+tuple. The ids are the indices of the particles in the global lattice (or cell grid), so they
+are unique and do not depend on the decomposition. If the BoundaryPlanes of a rank are passed,
+only the particles inside the domain of that rank are generated, so that no rank builds the
+full system. A particle on a boundary plane shared by two ranks belongs to exactly one of them.
+"""
+
+import numpy as np
+
+
+def inside(positions, boundaryPlanes):
+    """Return a boolean mask selecting the positions inside the domain bounded by boundaryPlanes.
+
+    Positions on a plane are inside if the first nonzero component of the plane's normal is
+    positive, so that the two ranks sharing a plane do not both own them.
+    """
+    mask = np.ones(len(positions), dtype=bool)
+    for bp in boundaryPlanes or []:
+        d = (positions - bp.p) @ bp.n
+        nonzero = bp.n[np.flatnonzero(bp.n)]
+        mask &= (d >= 0) if nonzero[0] > 0 else (d > 0)
+    return mask
+
+
+def domainBox(lower, upper, boundaryPlanes=None):
+    """Clip the box [lower, upper) to the axis aligned planes in boundaryPlanes.
+
+    :return: (lower, upper) of the clipped box, which contains the part of the domain inside the box.
+    """
+    lower = np.array(lower, dtype=float)
+    upper = np.array(upper, dtype=float)
+    for bp in boundaryPlanes or []:
+        axes = np.flatnonzero(bp.n)
+        if len(axes) == 1:
+            k = axes[0]
+            if bp.n[k] > 0:
+                lower[k] = max(lower[k], bp.p[k])
+            else:
+                upper[k] = min(upper[k], bp.p[k])
+    return lower, upper
+
+
+def _range(origin, spacing, lo, hi, nMax):
+    """Indices i in [0, nMax) such that origin + i*spacing may lie in [lo, hi]."""
+    i0 = max(0, int(np.floor((lo - origin) / spacing)) - 1)
+    i1 = min(nMax, int(np.ceil((hi - origin) / spacing)) + 2)
+    return np.arange(i0, max(i0, i1), dtype=np.int64)
+
+
+def _lattice(origin, spacing, counts, lower, upper, boundaryPlanes):
+    """Return the indices (n,3) and positions (n,3) of the points of a rectangular lattice that
+    lie in the domain of boundaryPlanes. Only the part of the lattice in the clipped box is built.
+    """
+    lo, hi = domainBox(lower, upper, boundaryPlanes)
+    ranges = [_range(origin[k], spacing[k], lo[k], hi[k], counts[k]) for k in range(3)]
+    ijk = np.stack([a.ravel() for a in np.meshgrid(*ranges, indexing='ij')], axis=-1)
+    positions = origin + ijk * spacing
+    mask = inside(positions, boundaryPlanes)
+    return ijk[mask], positions[mask]
+
+
+def _flatIndex(ijk, counts):
+    return (ijk[:, 0] * counts[1] + ijk[:, 1]) * counts[2] + ijk[:, 2]
+
+
+def cubicLattice(spacing, lower, upper, boundaryPlanes=None):
+    """Simple cubic lattice of spheres with diameter spacing.
+
+    :param float spacing: distance between neighbouring lattice points.
+    :param lower: lower corner of the box.
+    :param upper: upper corner of the box.
+    :param boundaryPlanes: BoundaryPlanes of this rank, or None for the whole box.
+    :return: (positions, ids).
+    """
+    lower = np.array(lower, dtype=float)
+    upper = np.array(upper, dtype=float)
+    spacing = np.full(3, spacing, dtype=float)
+    counts = np.floor((upper - lower) / spacing + 1e-9).astype(np.int64)
+    ijk, positions = _lattice(lower + spacing / 2, spacing, counts, lower, upper, boundaryPlanes)
+    return positions, _flatIndex(ijk, counts)
+
+
+def hexagonalLattice(radius, lower, upper, boundaryPlanes=None):
+    """Hexagonal close packing of touching spheres with radius radius.
+
+    The layers are perpendicular to z, and stacked ABAB.
+
+    :return: (positions, ids).
+    """
+    lower = np.array(lower, dtype=float)
+    upper = np.array(upper, dtype=float)
+    # the hcp lattice is built from a rectangular lattice of (i, j, k), with offsets depending on
+    # the parity of j and k.
+    spacing = np.array([2.0, np.sqrt(3.0), 2.0 * np.sqrt(6.0) / 3.0]) * radius
+    origin = lower + radius
+    counts = np.floor((upper - lower - 2 * radius) / spacing + 1e-9).astype(np.int64) + 1
+    counts = np.maximum(counts, 0)
+    lo, hi = domainBox(lower, upper, boundaryPlanes)
+    ranges = [_range(origin[k], spacing[k], lo[k], hi[k], counts[k]) for k in range(3)]
+    ijk = np.stack([a.ravel() for a in np.meshgrid(*ranges, indexing='ij')], axis=-1)
+    i, j, k = ijk[:, 0], ijk[:, 1], ijk[:, 2]
+    positions = np.empty((len(ijk), 3))
+    positions[:, 0] = origin[0] + (2 * i + (j + k) % 2) * radius
+    positions[:, 1] = origin[1] + np.sqrt(3.0) * (j + (k % 2) / 3.0) * radius
+    positions[:, 2] = origin[2] + k * spacing[2]
+    mask = np.all(positions + radius <= upper + 1e-9, axis=-1) & inside(positions, boundaryPlanes)
+    return positions[mask], _flatIndex(ijk[mask], counts)
+
+
+def _uniform(seed, keys, stream):
+    """Uniform random numbers in [0,1), as a function of (seed, key, stream) (splitmix64).
+
+    Counter based, so that the same cell gets the same numbers on whatever rank it is generated.
+    """
+    x = keys.astype(np.uint64) * np.uint64(8) + np.uint64(stream)
+    x ^= np.uint64((seed * 0x9E3779B97F4A7C15) % 2**64)
+    x += np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
+def randomPacking(radius, lower, upper, fraction=1.0, spacing=None, seed=0, boundaryPlanes=None):
+    """Random packing of non-overlapping spheres with radius radius, built on a cubic cell grid.
+
+    Every cell holds at most one sphere. A cell is occupied with probability fraction, and its
+    sphere is displaced randomly from the cell centre by at most (spacing - 2*radius)/2 along
+    every axis, so that spheres in neighbouring cells never overlap. The result only depends on
+    seed, not on the number of ranks.
+
+    :param float fraction: probability that a cell is occupied.
+    :param float spacing: cell size (>= 2*radius), defaults to 2.5*radius.
+    :return: (positions, ids).
+    """
+    if spacing is None:
+        spacing = 2.5 * radius
+    if spacing < 2 * radius:
+        raise ValueError(f"The cell size ({spacing}) must be at least the sphere diameter ({2*radius}).")
+    lower = np.array(lower, dtype=float)
+    upper = np.array(upper, dtype=float)
+    cell = np.full(3, spacing, dtype=float)
+    counts = np.floor((upper - lower) / cell + 1e-9).astype(np.int64)
+    # A sphere may be displaced out of the domain of its cell, or into it from a neighbouring cell.
+    # Hence, all cells within one cell size of the domain are generated and displaced, and the
+    # domain is only applied to the displaced positions.
+    lo, hi = domainBox(lower, upper, boundaryPlanes)
+    ijk, positions = _lattice(lower + cell / 2, cell, counts, lo - cell, hi + cell, None)
+    ids = _flatIndex(ijk, counts)
+    occupied = _uniform(seed, ids, 0) < fraction
+    positions, ids = positions[occupied], ids[occupied]
+    jitter = (spacing - 2 * radius) / 2
+    for k in range(3):
+        positions[:, k] += jitter * (2 * _uniform(seed, ids, k + 1) - 1)
+    mask = inside(positions, boundaryPlanes)
+    return positions[mask], ids[mask]
+
+
+def addSpheres(pc, positions, ids=None, radius=None, velocity=None, id0=0):
+    """Add particles with the given positions to particle container pc (e.g. Spheres), in bulk.
+
+    :param positions: (n,3) array.
+    :param ids: particle ids, defaults to id0, id0+1, ...
+    :param radius: single radius or array of radii. If None, the radius array is not set.
+    :param velocity: single velocity (3,) or (n,3) array. If None, the velocity arrays are not set.
+    :return: the indices of the new elements.
+    """
+    positions = np.asarray(positions, dtype=float)
+    n = len(positions)
+    elements = pc.addElements(n)
+    if ids is None:
+        ids = id0 + np.arange(n, dtype=np.int64)
+    pc.id.assign(elements, ids)
+    pc.rx.assign(elements, positions[:, 0])
+    pc.ry.assign(elements, positions[:, 1])
+    pc.rz.assign(elements, positions[:, 2])
+    if radius is not None:
+        pc.radius.assign(elements, radius)
+    if velocity is not None:
+        velocity = np.broadcast_to(np.asarray(velocity, dtype=float), (n, 3))
+        pc.vx.assign(elements, velocity[:, 0])
+        pc.vy.assign(elements, velocity[:, 1])
+        pc.vz.assign(elements, velocity[:, 2])
+    return elements
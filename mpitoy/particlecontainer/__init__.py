@@ -6,7 +6,24 @@ Module mpitoy.particlecontainer
 
 A submodule for the ParticleContainer class
 """
+import sys
 from copy import copy
+import numpy as np
+
+
+# Smallest number of elements of a float ParticleArray that is sent packed in a numpy array, see
+# ParticleArray.packMessage().
+PACKED_MESSAGE_MIN = 256
+
+
+def _checkName(pc, name):
+    """Verify that name can be used for a new array of pc."""
+    if not name:
+        raise RuntimeError("Parameter 'name' is required.")
+    if name in pc.arrays or name in pc.components:
+        raise RuntimeError(f"Name '{name}' is already useed for another ParticleArray of ParticleContainer '{pc.name}'.")
+    if hasattr(pc, name):
+        raise RuntimeError(f"Name '{name}' is already used for an attribute of ParticleContainer '{pc.name}'.")
 
 
 class ParticleArray(list):
@@ -15,14 +32,17 @@ class ParticleArray(list):
         * the name of the particle array,
         * a reference to the particle container to which the particle array belongs,
         * the default value of the particle array
+
+    The values are Python objects, double precision for floats. Arrays with a declared precision
+    are stored in numpy arrays instead, see makeArray().
+
+    When pickled (e.g. in the particle containers sent to neighbouring domains), large float
+    arrays are stored as a numpy array with dtype(), see packMessage().
     """
+    shape = () # the shape of an element, see VectorArray
+
     def __init__(self, pc, name=None, defaultValue=None):
-        if not name:
-            raise RuntimeError("Parameter 'name' is required.")
-        if name in pc.arrays:
-            raise RuntimeError(f"Name '{name}' is already useed for another ParticleArray of ParticleContainer '{pc.name}'.")
-        if hasattr(pc, name):
-            raise RuntimeError(f"Name '{name}' is already used for an attribute of ParticleContainer '{pc.name}'.")
+        _checkName(pc, name)
         self.name = name
         self.defaultValue = defaultValue
         self.pc = pc
@@ -54,6 +74,26 @@ class ParticleArray(list):
         """
         self.extend(n*[copy(self.defaultValue)])
 
+    def compact_(self, live, capacity):
+        """Move the elements live to the front, and truncate or extend the array to capacity elements.
+
+        This method is only to be used by ParticleContainer.compact()
+        """
+        values = [self[i] for i in live]
+        values.extend((capacity - len(values)) * [copy(self.defaultValue)])
+        list.__setitem__(self, slice(None), values) # bypass the element wise bookkeeping of subclasses
+
+    def itemsize(self):
+        """Estimated number of bytes per element.
+
+        An element is a pointer (8 bytes) in the list, to a Python object. Booleans and None are
+        shared objects, other values are assumed to be separate objects of the type of the default
+        value (float if there is none).
+        """
+        if self.defaultValue is None or isinstance(self.defaultValue, bool):
+            return 8 if isinstance(self.defaultValue, bool) else 8 + sys.getsizeof(0.0)
+        return 8 + sys.getsizeof(self.defaultValue)
+
     def detach(self):
         """Detach this ParticleArray from its ParticleContainer.
 
@@ -66,12 +106,287 @@ class ParticleArray(list):
     def __str__(self):
         return f"{self.pc.name}.{self.name} = {list([self[i] for i in range(self.pc.capacity) if self.pc.alive[i]])}"
 
+    def assign(self, elements, values):
+        """Assign values to elements in bulk.
+
+        :param elements: list or numpy array of element indices, e.g. as returned by
+            ParticleContainer.addElements().
+        :param values: sequence of the same length as elements, or a single value for all elements.
+        """
+        elements = np.asarray(elements, dtype=np.int64)
+        if np.ndim(values) == 0:
+            values = len(elements) * [values.item() if isinstance(values, np.generic) else values]
+        else:
+            values = values.tolist() if isinstance(values, np.ndarray) else list(values)
+        if len(elements) and elements[-1] - elements[0] + 1 == len(elements) and np.all(np.diff(elements) == 1):
+            # contiguous elements: slice assignment
+            self[int(elements[0]):int(elements[-1]) + 1] = values
+        else:
+            for i, value in zip(elements.tolist(), values):
+                self[i] = value
+
+    def fullName(self):
+        return f'{self.pc.name}.{self.name}'
+
+    def declaration(self):
+        """The keyword arguments to create an empty array like this one (see ParticleContainer.clone())."""
+        return {'defaultValue': self.defaultValue}
+
+    def dtype(self):
+        """The numpy dtype of the array elements, as inferred from the default value.
+
+        Arrays without default value are assumed to contain floats. Note that an integer default
+        value (e.g. 1 rather than 1.0) gives an integer dtype.
+        """
+        if self.defaultValue is None:
+            return np.dtype(np.float64)
+        return np.asarray(self.defaultValue).dtype
+
+    def pack(self, elements):
+        """Return the values of elements as a numpy array with dtype(), the compact form in which
+        they are sent, or as a list if they cannot be represented exactly with dtype().
+        """
+        values = [self[i] for i in elements]
+        try:
+            packed = np.array(values, dtype=self.dtype())
+        except (TypeError, ValueError):
+            return values
+        return packed if packed.tolist() == values else values
+
+    def packMessage(self, elements):
+        """Return the values of elements as sent to another rank: packed (see pack()) if that
+        makes the pickled message smaller, otherwise as a list.
+
+        A pickled numpy array has a header of about 130 bytes, and a pickled Python float takes 9
+        bytes, a float64 8. Only float arrays of at least PACKED_MESSAGE_MIN elements are packed.
+        """
+        if len(elements) < PACKED_MESSAGE_MIN or self.dtype().kind != 'f':
+            return [self[i] for i in elements]
+        return self.pack(elements)
+
+    def __reduce_ex__(self, protocol):
+        packed = self.packMessage(range(len(self)))
+        if isinstance(packed, list):
+            return super().__reduce_ex__(protocol)
+        return (_unpickleArray, (type(self), packed), self.__dict__)
+
+
+def _unpickleArray(cls, values):
+    array = list.__new__(cls)
+    list.extend(array, values.tolist())
+    return array
+
+
+class VectorArray:
+    """Particle array whose elements have a fixed shape, e.g. (3,) for positions, velocities and
+    accelerations. The elements are stored in a contiguous numpy array self.data of shape
+    (capacity,) + shape, so that operations on all particles are numpy operations, e.g. the signed
+    distances to a plane are (pc.r.data - p) @ n, and the values of a set of elements are
+    gathered with a single fancy indexing operation, pc.r.data[elements].
+
+    Indexing returns copies, as numpy arrays: pc.r[i] is an array of shape shape. The components
+    can be accessed as scalar arrays (see ComponentArray), e.g. with components=('rx', 'ry', 'rz'),
+    pc.rx[i] is pc.r.data[i, 0]. Unlike a ParticleArray, a VectorArray has no None values: dead
+    and new elements hold the default value.
+
+    With shape (), a VectorArray is a scalar array stored in numpy, e.g. for a declared precision
+    (see makeArray()).
+    """
+    def __init__(self, pc, name=None, defaultValue=None, precision=None, shape=(3,), components=()):
+        """
+        :param pc: the particle container.
+        :param str name: name of the array.
+        :param defaultValue: the default value of an element, broadcast to shape (default zeros).
+        :param precision: numpy dtype of the elements, default float64.
+        :param tuple shape: shape of an element.
+        :param components: names of the scalar arrays accessing the components (only for 1D
+            shapes), or () for none.
+        """
+        _checkName(pc, name)
+        self.shape = tuple(shape)
+        if components and (len(self.shape) != 1 or len(components) != self.shape[0]):
+            raise ValueError(f"Components {components} do not match the shape {self.shape} of VectorArray '{name}'.")
+        self.name = name
+        self.precision = np.dtype(np.float64 if precision is None else precision)
+        self.defaultValue = np.zeros(self.shape, dtype=self.precision) if defaultValue is None else \
+                            np.broadcast_to(np.asarray(defaultValue, dtype=self.precision), self.shape).copy()
+        self.pc = pc
+        setattr(pc, name, self)
+        pc.arrays[name] = self
+        self.data = np.empty((pc.capacity,) + self.shape, dtype=self.precision)
+        self.data[:] = self.defaultValue
+        self.components = tuple(components)
+        for k, component in enumerate(self.components):
+            ComponentArray(self, component, k)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        return self.data[i].copy()
+
+    def __setitem__(self, i, value):
+        self.data[i] = value
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self.data, dtype=dtype)
+
+    def reset(self, i='all'):
+        """Reset a single element, all elements (i='all') or a list of elements to the default value."""
+        self.data[slice(None) if isinstance(i, str) and i == 'all' else i] = self.defaultValue
+
+    def grow_(self, n):
+        """Grow the array by n elements.
+
+        This method is only to be used by ParticleContainer.grow()
+        """
+        self.data = np.concatenate([self.data, np.broadcast_to(self.defaultValue, (n,) + self.shape)])
+
+    def compact_(self, live, capacity):
+        """Move the elements live to the front, and truncate or extend the array to capacity elements.
+
+        This method is only to be used by ParticleContainer.compact()
+        """
+        data = np.empty((capacity,) + self.shape, dtype=self.precision)
+        data[:len(live)] = self.data[live]
+        data[len(live):] = self.defaultValue
+        self.data = data
+
+    def assign(self, elements, values):
+        """Assign values to elements in bulk.
+
+        :param elements: list or numpy array of element indices.
+        :param values: array of shape (len(elements),) + shape, or a single value for all elements.
+        """
+        self.data[np.asarray(elements, dtype=np.int64)] = values
+
+    def itemsize(self):
+        """Number of bytes per element."""
+        return self.precision.itemsize * int(np.prod(self.shape))
+
+    def detach(self):
+        """Detach this VectorArray, and its components, from its ParticleContainer."""
+        for component in self.components:
+            delattr(self.pc, component)
+            del self.pc.components[component]
+        delattr(self.pc, self.name)
+        del self.pc.arrays[self.name]
+        self.pc = None
+
+    def __str__(self):
+        return f"{self.pc.name}.{self.name} = {self.data[np.flatnonzero(self.pc.alive)].tolist()}"
+
     def fullName(self):
-        return f'{self.pc}.{self.name}'
+        return f'{self.pc.name}.{self.name}'
+
+    def declaration(self):
+        """The keyword arguments to create an empty array like this one (see ParticleContainer.clone())."""
+        return {'defaultValue': self.defaultValue, 'precision': self.precision, 'shape': self.shape, 'components': self.components}
+
+    def dtype(self):
+        """The numpy dtype of the components of an element."""
+        return self.precision
+
+    def pack(self, elements):
+        """Return the values of elements as a numpy array of shape (len(elements),) + shape."""
+        return self.data[np.asarray(elements, dtype=np.int64)]
+
+    packMessage = pack # the values are always sent packed
+
+
+class ComponentArray:
+    """A scalar view of component k of a VectorArray, e.g. pc.rx of pc.r.
+
+    It supports indexing (with Python floats as values), slice assignment, assign() and conversion
+    with np.asarray(), so that code written for scalar ParticleArrays works unchanged. Components
+    are not in pc.arrays, but in pc.components: their values are stored, sent and written with the
+    VectorArray.
+    """
+    def __init__(self, vector, name, k):
+        _checkName(vector.pc, name)
+        self.vector = vector
+        self.name = name
+        self.k = k
+        setattr(vector.pc, name, self)
+        vector.pc.components[name] = self
+
+    @property
+    def pc(self):
+        return self.vector.pc
+
+    @property
+    def defaultValue(self):
+        return self.vector.defaultValue[self.k].item()
+
+    def __len__(self):
+        return len(self.vector.data)
+
+    def __getitem__(self, i):
+        return self.vector.data[i, self.k].tolist()
+
+    def __setitem__(self, i, value):
+        self.vector.data[i, self.k] = value
+
+    def __iter__(self):
+        return iter(self.vector.data[:, self.k].tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self.vector.data[:, self.k], dtype=dtype)
+
+    def assign(self, elements, values):
+        """Assign values to elements in bulk, see ParticleArray.assign()."""
+        self.vector.data[np.asarray(elements, dtype=np.int64), self.k] = values
+
+    def fullName(self):
+        return f'{self.pc.name}.{self.name}'
+
+    def dtype(self):
+        return self.vector.dtype()
+
+    def pack(self, elements):
+        return self.vector.data[np.asarray(elements, dtype=np.int64), self.k]
+
+    packMessage = pack
+
+
+def makeArray(pc, name, defaultValue=None, precision=None):
+    """Create a scalar array of pc with the given precision (a numpy dtype, or None).
+
+    Without precision, this is a ParticleArray. With a precision, it is a VectorArray with shape
+    (), because only a numpy array stores the values with that precision: a list holds Python
+    floats, whatever the precision, and rounding every stored value only makes it slower.
+    """
+    if precision is None:
+        return ParticleArray(pc, name=name, defaultValue=defaultValue)
+    return VectorArray(pc, name, defaultValue, precision=precision, shape=())
+
+
+class IdArray(ParticleArray):
+    """ParticleArray for particle ids, which keeps the id index of its ParticleContainer up to date
+    (see ParticleContainer.indexIds()).
+
+    Every assignment updates the index, so that the index follows the particles through
+    addElement(), kill(), clone() and the exchanges between domains. Assignments to dead elements
+    are not indexed. If the index is not enabled, the overhead is a single attribute test.
+    """
+    def __setitem__(self, i, value):
+        index = self.pc.idIndex
+        if index is not None:
+            alive = self.pc.alive
+            if isinstance(i, slice):
+                elements = range(*i.indices(len(self)))
+                values = list(value)
+            else:
+                elements = (i,)
+                values = (value,)
+            for j, v in zip(elements, values):
+                if alive[j]:
+                    old = self[j]
+                    if index.get(old) == j:
+                        del index[old]
+                    index[v] = j
+        super().__setitem__(i, value)
 
-    def tag(self):
-        """Generate a tag that is unique for the array, but identical on all ranks."""
-        return int.from_bytes(self.fullName().encode(), 'little')
 
 class ParticleContainer:
     """Base class for particle containers"""
@@ -84,33 +399,146 @@ class ParticleContainer:
         self.growthFactor = 1.2         # if needed increase the capacity to growthFactor * capacity
         self.size = 0                   # actual number of particles
         self.arrays = {}                # dict of arrays in containeer
+        self.components = {}            # dict of the ComponentArrays of the VectorArrays in arrays
         ParticleArray(self, name='alive', defaultValue=False)
                                         # only particles for which alive[i]==True exist
         self.free = []                  # list of free elements. if empty the next free element is given by self.size
+        self.idIndex = None             # dict id -> element, if enabled by indexIds()
+        self.peakCapacity = self.capacity # largest capacity ever reached, see memory()
         ParticleContainer.ID += 1
-        self.ID = ParticleContainer.ID # used for tagging MPI messages. id is unique on a rank, but it is intended that
-            # the same parrticle containers have the same id across ranks. The current implementation guarantees that
-            # provided that all particle container are constructed on each rank in the same order.
+        self.ID = ParticleContainer.ID # unique on a rank. MPI messages are tagged with the name of the container
+            # instead (see mpitoy.domaindecomposition.messageTag), which is the same on all ranks.
 
     def addArray(self, name: str, defaultValue=None): # deprecated, use ParticleArray.__init__() instead.
         """Add an array to the particle container."""
         ParticleArray(self, name=name, defaultValue=defaultValue)
 
 
+    def recordDtype(self, arrays=None):
+        """A numpy structured dtype with a field for every array (in the order of self.arrays), or
+        for the arrays with names in arrays."""
+        names = self.arrays if arrays is None else arrays
+        return np.dtype([(name, self.arrays[name].dtype(), self.arrays[name].shape) for name in names])
+
+    def packRecords(self, elements, arrays=None):
+        """Gather the values of elements of all arrays into records: a numpy structured array with
+        dtype recordDtype(), i.e. one record per particle.
+
+        The arrays of a particle then travel together, e.g. in a single message when particles
+        migrate to another domain (see BoundaryPlane.findLeavingParticles()), or in a checkpoint.
+        For a VectorArray the field is gathered with a single fancy indexing operation.
+
+        :param arrays: names of the arrays to pack, default all.
+        :raises ValueError: if the values of an array cannot be represented exactly with its dtype,
+            e.g. floats in an array with an integer default value.
+        """
+        elements = np.asarray(elements, dtype=np.int64)
+        records = np.empty(len(elements), dtype=self.recordDtype(arrays))
+        for name in records.dtype.names:
+            array = self.arrays[name]
+            values = array.pack(elements)
+            if isinstance(values, list):
+                raise ValueError(f"ParticleArray '{array.fullName()}' holds values that cannot be represented with its dtype "
+                                 f"{array.dtype()} (default value {array.defaultValue!r}). Use a float default value.")
+            records[name] = values
+        return records
+
+    def unpackRecords(self, records):
+        """Add a particle for every record in records (see packRecords()), and scatter the fields
+        of the records to the arrays with the same name.
+
+        :return: numpy array with the elements of the new particles.
+        """
+        elements = self.addElements(len(records))
+        for name in records.dtype.names:
+            self.arrays[name].assign(elements, records[name])
+        return elements
+
+    def array(self, name):
+        """Return the array name, which is either in self.arrays, or a component of a VectorArray."""
+        array = self.arrays.get(name)
+        return array if array is not None else self.components[name]
+
+
+    def indexIds(self):
+        """Enable the id index: a dict mapping the id of every live particle to its element.
+
+        The index is built once, and from then on maintained incrementally, by the IdArray 'id'
+        (every assignment of an id) and by kill(). Ids must be unique within the container.
+        """
+        if not isinstance(self.arrays.get('id'), IdArray):
+            raise RuntimeError(f"ParticleContainer '{self.name}' has no IdArray 'id'.")
+        self.idIndex = {self.id[i]: i for i in range(self.capacity) if self.alive[i]}
+
+    def lookup(self, ids):
+        """Return the elements of the particles with ids ids, or -1 for ids that are not present.
+
+        :param ids: a single id, or a sequence of ids (bulk lookup).
+        :return: int or numpy array of ints.
+        """
+        if self.idIndex is None:
+            raise RuntimeError(f"The id index of ParticleContainer '{self.name}' is not enabled, see indexIds().")
+        if np.ndim(ids) == 0:
+            return self.idIndex.get(int(ids), -1)
+        get = self.idIndex.get
+        return np.fromiter((get(id, -1) for id in np.asarray(ids).tolist()), dtype=np.int64, count=len(ids))
+
     def removeArray(self,name):
         """remove an array from the particle container."""
         self.arrays[name].detach()
 
-    def grow(self):
-        """Increase capacity"""
+    def grow(self, minimum=0):
+        """Increase capacity, by at least minimum elements."""
         n = int(round( self.capacity * (self.growthFactor - 1), 0 ) )
         if n==0:
             n = self.capacity
+        n = max(n, minimum)
 
         self.alive.grow_(n) # alive is not in self.arrays
         for array in self.arrays.values():
             array.grow_(n)
         self.capacity += n
+        self.peakCapacity = max(self.peakCapacity, self.capacity)
+
+    def compact(self, capacity=None):
+        """Move the live particles to the elements 0, ..., size-1, and shrink the capacity.
+
+        This invalidates all element indices held outside the container (e.g. the ghosted
+        elements of the BoundaryPlanes), so only compact where there are none. The id index, if
+        enabled, is rebuilt.
+
+        :param int capacity: the new capacity, at least size, default size (and at least 10).
+        :return: int64 array with the new element of every old element, -1 for the dead ones.
+        """
+        live = [i for i in range(self.capacity) if self.alive[i]]
+        capacity = max(10, self.size, 0 if capacity is None else capacity)
+        for array in [self.alive] + list(self.arrays.values()):
+            array.compact_(live, capacity)
+        moved = np.full(self.capacity, -1, dtype=np.int64)
+        moved[live] = np.arange(len(live), dtype=np.int64)
+        self.capacity = capacity
+        self.free = []
+        if self.idIndex is not None:
+            self.indexIds()
+        return moved
+
+    def memory(self):
+        """Memory footprint of this container (estimated, see ParticleArray.itemsize()).
+
+        :return: dict with the 'capacity', 'size', 'peakCapacity', the 'liveFraction' (size/capacity),
+            the bytes 'reserved' (for capacity elements) and 'used' (for the live elements), and
+            'arrays', a dict with the 'reserved' and 'used' bytes of every array (including 'alive').
+        """
+        arrays = { array.name: {'reserved': self.capacity * array.itemsize(), 'used': self.size * array.itemsize()}
+                   for array in [self.alive] + list(self.arrays.values()) }
+        return { 'capacity': self.capacity
+               , 'size': self.size
+               , 'peakCapacity': self.peakCapacity
+               , 'liveFraction': self.size / self.capacity
+               , 'reserved': sum(a['reserved'] for a in arrays.values())
+               , 'used': sum(a['used'] for a in arrays.values())
+               , 'arrays': arrays
+               }
 
     def kill(self, i, reset=False):
         """Remove particle i. If reset is True, reset the i-th element of all arrays to its default value.
@@ -123,6 +551,8 @@ class ParticleContainer:
                raise RuntimeError(f"Particle {i} is already removed.")
             self.alive[i] = False
             self.free.append(i)
+            if self.idIndex is not None and self.idIndex.get(self.id[i]) == i:
+                del self.idIndex[self.id[i]]
             self.size -= 1
             if reset:
                 for array in self.arrays.values():
@@ -143,6 +573,26 @@ class ParticleContainer:
         self.size += 1
         return i
 
+    def addElements(self, n):
+        """Add n particles and return their indices, as a numpy array.
+
+        This is the bulk version of addElement(). Free elements are reused first (in the same order
+        as addElement() would), the remaining elements are contiguous, and the container grows at
+        most once.
+        """
+        used = self.size + len(self.free) # elements beyond used have never been used
+        nReused = min(n, len(self.free))
+        reused = self.free[len(self.free) - nReused:][::-1]
+        del self.free[len(self.free) - nReused:]
+        nNew = n - nReused
+        if used + nNew > self.capacity:
+            self.grow(minimum=used + nNew - self.capacity)
+        for i in reused:
+            self.alive[i] = True
+        self.alive[used:used + nNew] = nNew * [True]
+        self.size += n
+        return np.concatenate([np.array(reused, dtype=np.int64), np.arange(used, used + nNew, dtype=np.int64)])
+
     # def array2str(self, array_name, rnd=2, id=False):
     #     """For pretty printing.
     #     """
@@ -164,7 +614,7 @@ class ParticleContainer:
         cloned = ParticleContainer(name=nm)
         for array in self.arrays.values():
 
-            ParticleArray(cloned, name=array.name, defaultValue=array.defaultValue)
+            type(array)(cloned, name=array.name, **array.declaration())
 
         for i in (range(self.capacity) if elements=='all' else elements):
             if self.alive[i]:
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module mpitoy.profiler
+==========================
+
+A submodule for timing the phases of a simulation and counting the MPI messages.
+
+mpitoy is instrumented with the module level Profiler object ``profiler``, which is disabled by
+default. When disabled, a timer is a shared no-op context manager, and counting returns
+immediately, so the overhead is a method call per instrumented phase.
+
+Usage::
+
+    from mpitoy.profiler import profiler
+    profiler.enable()
+    for it in range(nSteps):
+        sim.move(dt)
+        profiler.tick(comm, every=100)   # print a report every 100 steps (collective)
+    print(profiler.formatReport(profiler.report(comm)))
+
+Timers are named after the phase they measure, e.g. 'forward_euler', 'classify' (finding the
+particles that leave or must be ghosted), 'pack' and 'unpack' (packing and pickling the particles
+before a message, unpickling and adding them after it), 'wait' (time blocked in the
+communication). Counters are named after the boundary plane and the particle container,
+and count the messages and bytes sent.
+"""
+
+import pickle
+import time
+
+import numpy as np
+from mpi4py import MPI
+
+
+class _NullTimer:
+    """Timer of a disabled Profiler."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, times, name):
+        self.times = times
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        entry = self.times.get(self.name)
+        if entry is None:
+            entry = self.times[self.name] = [0.0, 0]
+        entry[0] += time.perf_counter() - self.t0
+        entry[1] += 1
+        return False
+
+
+class Profiler:
+    """Named timers and message counters."""
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.times = {}    # name -> [seconds, number of calls]
+        self.counters = {} # name -> [messages, bytes]
+        self.nTicks = 0
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """Clear all timers and counters."""
+        self.times = {}
+        self.counters = {}
+        self.nTicks = 0
+
+    def timer(self, name):
+        """Return a context manager adding the time spent in its body to timer name."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self.times, name)
+
+    def count(self, name, nbytes=0, messages=1):
+        """Add messages and nbytes to counter name."""
+        if not self.enabled:
+            return
+        entry = self.counters.get(name)
+        if entry is None:
+            entry = self.counters[name] = [0, 0]
+        entry[0] += messages
+        entry[1] += nbytes
+
+    def countObject(self, name, obj):
+        """Count a message with the pickled object obj, as sent by the lower case mpi4py methods.
+
+        The object is pickled to measure its size, so this doubles the pickling cost (only when
+        the profiler is enabled).
+        """
+        if not self.enabled:
+            return
+        self.count(name, nbytes=len(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def report(self, comm=MPI.COMM_WORLD):
+        """Reduce the timers and counters across the ranks of comm (collective).
+
+        Ranks that did not use a timer or counter contribute zero.
+
+        :return: dict with keys 'times' and 'counters'. 'times' maps every timer name to a dict with
+            the 'min', 'mean' and 'max' over the ranks of the seconds and the number of calls
+            ('calls'). 'counters' maps every counter name to a dict with the 'min', 'mean' and
+            'max' of the number of messages and bytes, and their 'sum'.
+        """
+        result = {}
+        for kind, table, fields in (('times', self.times, ('seconds', 'calls')), ('counters', self.counters, ('messages', 'bytes'))):
+            names = sorted(set().union(*comm.allgather(list(table.keys()))))
+            local = np.array([table.get(name, [0, 0]) for name in names], dtype=np.float64).reshape(len(names), 2)
+            reduced = {}
+            for op, key in ((MPI.MIN, 'min'), (MPI.MAX, 'max'), (MPI.SUM, 'sum')):
+                reduced[key] = np.empty_like(local)
+                comm.Allreduce(local, reduced[key], op=op)
+            entries = {}
+            for j, name in enumerate(names):
+                entry = {}
+                for k, field in enumerate(fields):
+                    entry[field] = { 'min': reduced['min'][j, k], 'mean': reduced['sum'][j, k] / comm.size
+                                   , 'max': reduced['max'][j, k], 'sum': reduced['sum'][j, k] }
+                entries[name] = entry
+            result[kind] = entries
+        return result
+
+    @staticmethod
+    def formatReport(report):
+        """Format a report (see report()) as a table."""
+        lines = [f"{'timer':<32} {'min [s]':>12} {'mean [s]':>12} {'max [s]':>12} {'calls':>10}"]
+        for name, entry in report['times'].items():
+            s = entry['seconds']
+            lines.append(f"{name:<32} {s['min']:12.6f} {s['mean']:12.6f} {s['max']:12.6f} {int(entry['calls']['max']):10d}")
+        lines.append(f"{'counter':<32} {'messages':>12} {'min [B]':>12} {'mean [B]':>12} {'max [B]':>12}")
+        for name, entry in report['counters'].items():
+            b = entry['bytes']
+            lines.append(f"{name:<32} {int(entry['messages']['sum']):12d} {int(b['min']):12d} {b['mean']:12.1f} {int(b['max']):12d}")
+        return '\n'.join(lines)
+
+    def tick(self, comm=MPI.COMM_WORLD, every=None):
+        """Count a timestep, and print a report on rank 0 every every timesteps.
+
+        This is collective on the timesteps where a report is made, and does nothing when the
+        profiler is disabled.
+        """
+        if not self.enabled:
+            return
+        self.nTicks += 1
+        if every and self.nTicks % every == 0:
+            report = self.report(comm)
+            if comm.rank == 0:
+                print(f"profile after {self.nTicks} timesteps:\n{self.formatReport(report)}")
+
+
+profiler = Profiler()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module mpitoy.query
+==========================
+
+A submodule for spatial queries: finding the particles in a region, or near a point.
+
+The regions are described by query objects:
+
+* Box(lo, hi): the axis aligned box [lo, hi],
+* Sphere(center, radius): the points within radius of center,
+* Slab(p, n, halfWidth): the points within halfWidth of the plane through p with normal n,
+* Nearest(center, k): the k points nearest to center.
+
+Locally, the queries are answered with a CellIndex, a uniform grid of cells over the particle
+positions. Across the ranks of a decomposition they are answered by Domain.query(), which sends a
+query only to the ranks whose domain it may intersect::
+
+    result = domain.query(spheres, [Sphere([1.0, 2.0, 2.0], 1.5), Nearest([5.0, 2.0, 2.0], k=3)])
+
+Every query object can tell whether it may intersect the domain of a rank, the intersection of the
+half spaces {x: (x - p).n >= 0} of the rank's BoundaryPlanes (see intersects()). The test is exact
+for the slabs of ParallelSlabs, and conservative otherwise.
+"""
+
+import numpy as np
+
+
+class CellIndex:
+    """Uniform grid of cubic cells over the bounding box of a set of points.
+
+    The points are sorted by cell, so that the points of a cell are found with a binary search.
+    """
+    def __init__(self, positions, elements=None, cellSize=None):
+        """
+        :param positions: (m,3) array of points.
+        :param elements: labels of the points, e.g. the elements of the particles, returned by the
+            queries. Default range(m).
+        :param float cellSize: edge of the cells. By default, there are about two points per cell.
+        """
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        m = len(self.positions)
+        self.elements = np.arange(m, dtype=np.int64) if elements is None else np.asarray(elements, dtype=np.int64)
+        self.lo = self.positions.min(axis=0) if m else np.zeros(3)
+        self.hi = self.positions.max(axis=0) if m else np.zeros(3)
+        if cellSize is None:
+            extent = self.hi - self.lo
+            extent = extent[extent > 0]
+            cellSize = (np.prod(extent) * 2 / m) ** (1 / len(extent)) if len(extent) else 1.0
+        self.cellSize = float(cellSize)
+        cells = np.floor((self.positions - self.lo) / self.cellSize).astype(np.int64)
+        self.shape = cells.max(axis=0) + 1 if m else np.ones(3, dtype=np.int64)
+        keys = np.ravel_multi_index(cells.T, self.shape) if m else np.empty(0, dtype=np.int64)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def _candidates(self, lo, hi):
+        """Indices of the points in the cells overlapping the box [lo, hi], a superset of the points in the box."""
+        clo = np.floor((np.asarray(lo, dtype=np.float64) - self.lo) / self.cellSize)
+        chi = np.floor((np.asarray(hi, dtype=np.float64) - self.lo) / self.cellSize)
+        if not len(self.keys) or np.any(chi < 0) or np.any(clo >= self.shape):
+            return np.empty(0, dtype=np.int64)
+        clo = np.maximum(clo, 0).astype(np.int64)
+        chi = np.minimum(chi, self.shape - 1).astype(np.int64)
+        cells = np.meshgrid(*[np.arange(a, b + 1) for a, b in zip(clo, chi)], indexing='ij')
+        keys = np.ravel_multi_index(cells, self.shape).ravel()
+        starts = np.searchsorted(self.keys, keys, side='left')
+        ends = np.searchsorted(self.keys, keys, side='right')
+        nonempty = ends > starts
+        if not np.any(nonempty):
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.order[s:e] for s, e in zip(starts[nonempty].tolist(), ends[nonempty].tolist())])
+
+    def box(self, lo, hi):
+        """The elements of the points in the box [lo, hi]."""
+        i = self._candidates(lo, hi)
+        x = self.positions[i]
+        return self.elements[i[np.all((x >= lo) & (x <= hi), axis=1)]]
+
+    def sphere(self, center, radius):
+        """The elements of the points within radius of center, and their distances to center."""
+        center = np.asarray(center, dtype=np.float64)
+        i = self._candidates(center - radius, center + radius)
+        d = np.linalg.norm(self.positions[i] - center, axis=1)
+        inside = d <= radius
+        return self.elements[i[inside]], d[inside]
+
+    def slab(self, p, n, halfWidth):
+        """The elements of the points within halfWidth of the plane through p with normal n (unit)."""
+        d = (self.positions - p) @ n
+        return self.elements[np.abs(d) <= halfWidth]
+
+    def nearest(self, center, k):
+        """The elements of the k points nearest to center (all points if there are fewer), and
+        their distances to center, by increasing distance.
+
+        The search radius starts at the distance of center to the bounding box plus a cell, and
+        is doubled until it contains k points.
+        """
+        k = min(k, len(self.positions))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        center = np.asarray(center, dtype=np.float64)
+        radius = np.linalg.norm(np.maximum(0, np.maximum(self.lo - center, center - self.hi))) + self.cellSize
+        while True:
+            elements, d = self.sphere(center, radius)
+            if len(elements) >= k:
+                break
+            radius *= 2
+        order = np.argsort(d, kind='stable')[:k]
+        return elements[order], d[order]
+
+
+def intersects(query, region, tolerance=1e-12):
+    """Test whether query may intersect region, a list of (p, n) pairs, the points and inward
+    normals of the BoundaryPlanes of a domain. An empty region is the whole space.
+
+    The query must have some point on the inner side of every plane. This is exact for slabs,
+    but may report an intersection for a query near a corner of a domain that it misses.
+    """
+    return all(query.reach(p, n) >= -tolerance for p, n in region)
+
+
+class Box:
+    """Query for the points in the axis aligned box [lo, hi]."""
+    def __init__(self, lo, hi):
+        self.lo = np.asarray(lo, dtype=np.float64)
+        self.hi = np.asarray(hi, dtype=np.float64)
+
+    def translated(self, shift):
+        return Box(self.lo + shift, self.hi + shift)
+
+    def reach(self, p, n):
+        """The maximum of (x - p).n over the points x of the query."""
+        return float(np.sum(np.maximum(n * self.lo, n * self.hi)) - np.dot(p, n))
+
+    def bound(self):
+        """The region of the points this query may return."""
+        return self
+
+    def search(self, index):
+        """Answer the query with the CellIndex index.
+
+        :return: (elements, distances). The distances are None for queries without a centre.
+        """
+        return index.box(self.lo, self.hi), None
+
+
+class Sphere:
+    """Query for the points within radius of center."""
+    def __init__(self, center, radius):
+        self.center = np.asarray(center, dtype=np.float64)
+        self.radius = float(radius)
+
+    def translated(self, shift):
+        return Sphere(self.center + shift, self.radius)
+
+    def reach(self, p, n):
+        return float(np.dot(self.center - p, n)) + self.radius
+
+    def bound(self):
+        return self
+
+    def search(self, index):
+        return index.sphere(self.center, self.radius)
+
+
+class Slab:
+    """Query for the points within halfWidth of the plane through p with normal n."""
+    def __init__(self, p, n, halfWidth):
+        self.p = np.asarray(p, dtype=np.float64)
+        n = np.asarray(n, dtype=np.float64)
+        self.n = n / np.sqrt(np.dot(n, n))
+        self.halfWidth = float(halfWidth)
+
+    def translated(self, shift):
+        return Slab(self.p + shift, self.n, self.halfWidth)
+
+    def reach(self, p, n):
+        # a slab is unbounded, unless it is parallel to the plane
+        if abs(abs(np.dot(self.n, n)) - 1) > 1e-12:
+            return np.inf
+        return float(np.dot(self.p - p, n)) + self.halfWidth
+
+    def bound(self):
+        return self
+
+    def search(self, index):
+        return index.slab(self.p, self.n, self.halfWidth), None
+
+
+class Nearest:
+    """Query for the k points nearest to center."""
+    def __init__(self, center, k):
+        self.center = np.asarray(center, dtype=np.float64)
+        self.k = int(k)
+
+    def translated(self, shift):
+        return Nearest(self.center + shift, self.k)
+
+    def reach(self, p, n):
+        return self.bound().reach(p, n)
+
+    def bound(self):
+        """Only the domains containing the centre are asked first, see Domain.query()."""
+        return Sphere(self.center, 0.0)
+
+    def search(self, index):
+        return index.nearest(self.center, self.k)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module mpitoy.regression
+==========================
+
+A submodule for detecting performance regressions, by comparing two runs of mpitoy.benchmark.
+
+Usage::
+
+    # compare two result files
+    python -m mpitoy.regression baseline.json current.json
+
+    # run the benchmarks of baseline.json again (same groups, scale and repeat) and compare
+    mpirun -np 4 python -m mpitoy.regression baseline.json --output current.json
+
+The exit code is 1 if any benchmark got significantly slower, or is missing from the current run,
+and 0 otherwise. A benchmark that is no longer run would otherwise hide its regressions; pass
+--allow-missing to accept missing benchmarks, e.g. after removing or renaming one.
+
+For every benchmark present in both runs, the ratio of the median times current/baseline is
+computed (> 1 is slower). The samples of a run scatter, so a ratio is only significant if it
+exceeds the noise. The relative noise of a run is estimated robustly from its samples as
+1.4826*MAD/median (MAD: median absolute deviation), which estimates the relative standard deviation
+for normally distributed samples, but is not affected by a single outlier. The tolerance is::
+
+    tolerance = max(threshold, nSigma * sqrt(noise_baseline**2 + noise_current**2))
+
+and a benchmark is
+
+* 'slower' if ratio > 1 + tolerance (a regression),
+* 'faster' if ratio < 1/(1 + tolerance),
+* 'unchanged' otherwise.
+
+Benchmarks in only one of the runs are reported as 'missing' or 'new'. Runs with a different
+number of ranks cannot be compared.
+"""
+
+import fnmatch
+
+import numpy as np
+
+
+MAD_TO_SIGMA = 1.4826
+
+
+def relativeNoise(samples):
+    """Robust estimate of the relative standard deviation of samples (1.4826*MAD/median).
+
+    :return: float, 0.0 for a single sample.
+    """
+    samples = np.asarray(samples, dtype=float)
+    median = np.median(samples)
+    if len(samples) < 2 or median <= 0:
+        return 0.0
+    return MAD_TO_SIGMA * float(np.median(np.abs(samples - median))) / median
+
+
+def compare(baseline, current, threshold=0.1, nSigma=3.0, patterns=None):
+    """Compare the benchmark results current with baseline (as returned by mpitoy.benchmark.run()).
+
+    :param float threshold: smallest relative change that is reported.
+    :param float nSigma: number of standard deviations of the noise a change must exceed.
+    :param patterns: list of fnmatch patterns selecting the benchmarks to compare, default all.
+    :return: list of dicts, one per benchmark, with keys 'name', 'status', 'ratio', 'tolerance',
+        'baseline' and 'current' (the median times, or None if missing).
+    :raises ValueError: if the runs used different numbers of ranks.
+    """
+    nb, nc = baseline['meta']['nRanks'], current['meta']['nRanks']
+    if nb != nc:
+        raise ValueError(f"Cannot compare runs with {nb} and {nc} ranks.")
+    b, c = baseline['benchmarks'], current['benchmarks']
+    names = list(b) + [name for name in c if not name in b]
+    if patterns:
+        names = [name for name in names if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+    rows = []
+    for name in names:
+        row = {'name': name, 'ratio': None, 'tolerance': None, 'baseline': None, 'current': None}
+        if name in b:
+            row['baseline'] = float(np.median(b[name]['seconds']))
+        if name in c:
+            row['current'] = float(np.median(c[name]['seconds']))
+        if not name in c:
+            row['status'] = 'missing'
+        elif not name in b:
+            row['status'] = 'new'
+        else:
+            ratio = row['current'] / row['baseline'] if row['baseline'] > 0 else float('inf')
+            noise = np.hypot(relativeNoise(b[name]['seconds']), relativeNoise(c[name]['seconds']))
+            tolerance = max(threshold, nSigma * noise)
+            if ratio > 1 + tolerance:
+                row['status'] = 'slower'
+            elif ratio < 1 / (1 + tolerance):
+                row['status'] = 'faster'
+            else:
+                row['status'] = 'unchanged'
+            row['ratio'] = ratio
+            row['tolerance'] = tolerance
+        rows.append(row)
+    return rows
+
+
+def regressions(rows):
+    """The rows of compare() of the benchmarks that got significantly slower."""
+    return [row for row in rows if row['status'] == 'slower']
+
+
+def failures(rows, allowMissing=False):
+    """The rows of compare() that fail the comparison: the benchmarks that got significantly
+    slower and, unless allowMissing, the benchmarks missing from the current run."""
+    failing = ('slower',) if allowMissing else ('slower', 'missing')
+    return [row for row in rows if row['status'] in failing]
+
+
+def formatComparison(rows):
+    """Format the rows of compare() as a table."""
+    def fmt(x, spec):
+        return format(x, spec) if x is not None else format('-', '>' + spec.split('.')[0])
+    lines = [f"{'benchmark':<48} {'baseline [s]':>12} {'current [s]':>12} {'ratio':>8} {'tolerance':>10}  status"]
+    for row in rows:
+        lines.append( f"{row['name']:<48} {fmt(row['baseline'], '12.6f')} {fmt(row['current'], '12.6f')}"
+                      f" {fmt(row['ratio'], '8.3f')} {fmt(row['tolerance'], '10.3f')}  {row['status']}" )
+    nSlower = len(regressions(rows))
+    nMissing = sum(row['status'] == 'missing' for row in rows)
+    lines.append(f"{nSlower} regression{'s' if nSlower != 1 else ''}, {nMissing} missing.")
+    return '\n'.join(lines)
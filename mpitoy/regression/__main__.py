@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare benchmark results::
+
+    python -m mpitoy.regression baseline.json current.json
+    mpirun -np 4 python -m mpitoy.regression baseline.json --output current.json
+"""
+
+import argparse
+import sys
+
+from mpi4py import MPI
+
+from mpitoy import benchmark
+from mpitoy.regression import compare, failures, formatComparison
+
+
+def main(argv=None):
+    """Return the exit code: 0 if there are no regressions, 1 if there are (or if benchmarks are
+    missing, unless --allow-missing), 2 on errors."""
+    parser = argparse.ArgumentParser( prog='python -m mpitoy.regression'
+                                    , description='Compare two runs of the mpitoy benchmarks.' )
+    parser.add_argument('baseline', help='JSON file with the baseline results')
+    parser.add_argument('current', nargs='?', help='JSON file with the current results. If omitted, '
+                        'the benchmarks of the baseline are run now, with its groups, scale and repeat (collective).')
+    parser.add_argument('-o', '--output', help='JSON file for the results of the benchmarks run now')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1, help='smallest relative change reported (default 0.1)')
+    parser.add_argument('--sigma', type=float, default=3.0, help='number of standard deviations of the noise a change must exceed (default 3)')
+    parser.add_argument('--allow-missing', action='store_true', help='do not fail if benchmarks of the baseline are missing from the current results')
+    parser.add_argument('-b', '--benchmarks', nargs='+', help='benchmarks to compare (fnmatch patterns), default all')
+    args = parser.parse_args(argv)
+
+    comm = MPI.COMM_WORLD
+    baseline = benchmark.load(args.baseline)
+    if args.current:
+        current = benchmark.load(args.current)
+    else:
+        settings = baseline['meta']
+        current = benchmark.run( comm, repeat=settings.get('repeat', 5), scale=settings.get('scale', 1.0)
+                               , groups=settings.get('groups') )
+        if args.output:
+            benchmark.save(current, args.output, comm)
+    code = 0
+    if comm.rank == 0:
+        try:
+            rows = compare(baseline, current, threshold=args.threshold, nSigma=args.sigma, patterns=args.benchmarks)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            code = 2
+        else:
+            print(formatComparison(rows))
+            code = 1 if failures(rows, allowMissing=args.allow_missing) else 0
+    return comm.bcast(code, root=0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,106 +8,451 @@ A submodule for ...
 
 """
 
-import matplotlib.pyplot as plt
 import numpy as np
 from copy import copy
+from mpi4py import MPI
 
+from mpitoy import memory
+from mpitoy.domaindecomposition import particlePositions
+from mpitoy.output import snapshot
+from mpitoy.particlecontainer import VectorArray
+from mpitoy.profiler import profiler
+
+
+_nColors = None # number of colours set by setColors()
+_colors = None  # colour table, computed on first use by colors()
 
-COLORS = None
 def setColors(n):
-    global COLORS
-    COLORS = plt.cm.rainbow(np.linspace(0, 1, n))
+    """Set the number of colours in the colour table indexed by particle id.
+
+    The table itself is only computed when it is used, see colors(). Without a table, the colours
+    are computed from the particle ids (see mpitoy.viz.idColors()), so calling setColors() is
+    optional.
+    """
+    global _nColors, _colors
+    _nColors = n
+    _colors = None
+
+def colors():
+    """The colour table indexed by particle id, or None if setColors() was not called.
+
+    Computing the table imports matplotlib (through mpitoy.viz).
+    """
+    global _colors
+    if _colors is None and _nColors is not None:
+        from mpitoy.viz import colorTable
+        _colors = colorTable(_nColors)
+    return _colors
+
+def __getattr__(name):
+    # COLORS used to be a module variable.
+    if name == 'COLORS':
+        return colors()
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+def _vectors(pc):
+    """The VectorArrays (r, v, a) of pc, or None if pc stores the components in scalar arrays."""
+    vectors = tuple(pc.arrays.get(name) for name in ('r', 'v', 'a'))
+    return vectors if all(isinstance(vector, VectorArray) for vector in vectors) else None
 
 def forward_euler(pc, dt=0.1, nTimesteps=1):
+    """Advance the particles of pc by nTimesteps timesteps (kick, then drift, as kick() and drift())."""
+    vectors = _vectors(pc)
+    if vectors is not None:
+        r, v, a = vectors
+        elements = np.flatnonzero(pc.alive)
+        for it in range(nTimesteps):
+            v.data[elements] += a.data[elements]*dt
+            r.data[elements] += v.data[elements]*dt
+        return
     for it in range(nTimesteps):
         for i in range(pc.capacity):
             if pc.alive[i]:
                 pc.vx[i] += pc.ax[i]*dt
                 pc.vy[i] += pc.ay[i]*dt
+                pc.vz[i] += pc.az[i]*dt
                 pc.rx[i] += pc.vx[i]*dt
                 pc.ry[i] += pc.vy[i]*dt
+                pc.rz[i] += pc.vz[i]*dt
+
+def kick(pc, elements, dt, a=None):
+    """Update the velocities of elements of pc: v += a*dt.
+
+    :param a: (len(elements),3) array of accelerations. If None, pc's acceleration arrays are used.
+    """
+    vectors = _vectors(pc)
+    if vectors is not None:
+        elements = np.asarray(elements, dtype=np.int64)
+        vectors[1].data[elements] += (vectors[2].data[elements] if a is None else a)*dt
+        return
+    for j, i in enumerate(elements):
+        if a is None:
+            pc.vx[i] += pc.ax[i]*dt
+            pc.vy[i] += pc.ay[i]*dt
+            pc.vz[i] += pc.az[i]*dt
+        else:
+            pc.vx[i] += a[j,0]*dt
+            pc.vy[i] += a[j,1]*dt
+            pc.vz[i] += a[j,2]*dt
+
+def drift(pc, elements, dt):
+    """Update the positions of elements of pc: r += v*dt."""
+    vectors = _vectors(pc)
+    if vectors is not None:
+        elements = np.asarray(elements, dtype=np.int64)
+        vectors[0].data[elements] += vectors[1].data[elements]*dt
+        return
+    for i in elements:
+        pc.rx[i] += pc.vx[i]*dt
+        pc.ry[i] += pc.vy[i]*dt
+        pc.rz[i] += pc.vz[i]*dt
 
 class Simulation:
-    def __init__(self, pc, domainBoundaries=None, name=''):
+    def __init__(self, pc, domainBoundaries=None, name='', comm=None):
+        """
+        :param pc: particle container
+        :param domainBoundaries: list of BoundaryPlanes of this rank, possibly including walls.
+        :param str name: name of the simulation
+        :param comm: MPI communicator. Only needed for adaptive timestepping on several ranks. If
+            None, setHaloExchange() takes the communicator of the domain.
+        """
         self.pcs = [pc]
         self.t = 0
         radius = pc.radius[0] # assuming all particles have the same radius
         self.domainBoundaries = domainBoundaries
         self.name = name
+        self.comm = comm
+        # parameters for adaptive timestepping, see stableTimestep()
+        self.dtFraction = 0.1   # maximum displacement per timestep as a fraction of the minimum radius (or the ghost skin)
+        self.ghostSkin = None   # if not None, the displacement is also limited to dtFraction*ghostSkin
+        self.dt = None          # the last timestep used
+        # halo exchange, see setHaloExchange()
+        self.domain = None
+        self.cutoff = None
+        self.displacement = 0.0 # upper bound for the displacement of the particles since the last rebuild of the halo
+        self.nRebuilds = 0
+        self.nRefreshes = 0
+        # multiple timestepping, see setMultipleTimestepping()
+        self.ratio = 1
+        self.exchangeLevels = ()
+        self.levels = {}        # level of each particle container, by name
+        self.forces = []        # list of (force, level) tuples
+        self.batchPlot = None   # (figure, axes, collection) reused by plotBatch()
+
+
+    def move(self,dt=0.1, nTimesteps=1, adaptive=False):
+        """Advance the simulation by nTimesteps timesteps.
+
+        :param float dt: the timestep, or, if adaptive, the maximum timestep.
+        :param bool adaptive: if True, the timestep is computed by stableTimestep() before every
+            timestep (this is a collective operation if self.comm is set).
+
+        If a domain was set with setHaloExchange(), the ghost particles are updated after every
+        timestep (this is a collective operation), see updateHalo().
+
+        The memory budget (see mpitoy.memory) is checked before the halo is rebuilt, or, without
+        halo exchange, here.
+        """
+        if self.domain is None:
+            memory.checkBudget(self.pcs)
+        walls = self.walls()
+        if not walls and not adaptive and self.domain is None and self.ratio == 1 and not self.forces:
+            with profiler.timer('forward_euler'):
+                for pc in self.pcs:
+                    forward_euler(pc, dt=dt, nTimesteps=nTimesteps)
+            self.t += nTimesteps*dt
+            self.dt = dt
+        else:
+            # the timestep, the walls and the halo exchange must be applied for every timestep
+            for it in range(nTimesteps):
+                dti = self.stableTimestep(dtMax=dt) if adaptive else dt
+                reflected = changed = False
+                if self.ratio > 1 or self.forces:
+                    with profiler.timer('multipleTimestep'):
+                        self.multipleTimestep(dti)
+                for pc in self.pcs:
+                    if not (self.ratio > 1 or self.forces):
+                        with profiler.timer('forward_euler'):
+                            forward_euler(pc, dt=dti)
+                    with profiler.timer('walls'):
+                        for wall in walls:
+                            affected = wall.applyWall(pc, dt=dti)
+                            if affected:
+                                if wall.kind == 'reflective':
+                                    reflected = True
+                                elif self.domain is not None and self.invalidatesHalo(pc, affected):
+                                    changed = True
+                self.t += dti
+                self.dt = dti
+                if self.domain is not None:
+                    with profiler.timer('updateHalo'):
+                        self.updateHalo(dti, reflected=reflected, changed=changed)
+
+
+    def setMultipleTimestepping(self, ratio, exchangeLevels=()):
+        """Integrate with multiple timesteps (r-RESPA-like).
+
+        Particles are assigned to levels, per particle container (setLevel()) or per particle (if the
+        particle container has a 'level' array). The timestep of level l is dt/ratio**l, so the
+        particles of level l are sub-cycled ratio**l times per timestep dt. Forces (see addForce())
+        are also assigned to levels. A force of level f is evaluated with the timestep of level
+        min(f,l) for the particles of level l. Hence, fast (stiff) forces are sub-cycled for the fast
+        particles, while slow particles evaluate all forces only once per timestep.
+
+        :param int ratio: sub-cycling ratio between successive levels.
+        :param exchangeLevels: levels > 0 after whose steps the positions of the ghost particles are
+            refreshed (only if a domain was set, see setHaloExchange()). The halo is always updated
+            after every timestep dt, as for level 0. All ranks must use the same levels.
+        """
+        self.ratio = ratio
+        self.exchangeLevels = tuple(exchangeLevels)
+
+    def setLevel(self, pc, level):
+        """Assign all particles in particle container pc to level."""
+        self.levels[pc.name] = level
+
+    def addForce(self, force, level=0):
+        """Add a force to be evaluated at level.
+
+        :param force: callable force(pc, elements) returning a (len(elements),3) array with the
+            accelerations of elements of pc.
+        """
+        self.forces.append((force, level))
+
+    def particleLevels(self, pc):
+        """Return an array with the level of every element of pc."""
+        if 'level' in pc.arrays:
+            return np.array(pc.level, dtype=int)
+        return np.full(pc.capacity, self.levels.get(pc.name, 0), dtype=int)
+
+    def multipleTimestep(self, dt):
+        """Perform a timestep dt with multiple timestepping, see setMultipleTimestepping().
+
+        The number of levels is reduced over all ranks, so this is a collective operation if
+        self.comm is set.
+        """
+        levels = []
+        for pc in self.pcs:
+            levels.append(np.where(np.array(pc.alive, dtype=bool), self.particleLevels(pc), -1))
+        nLevels = 1 + max([int(l.max()) for l in levels if len(l)], default=0)
+        if self.comm is not None and self.comm.size > 1:
+            nLevels = self.comm.allreduce(nLevels, op=MPI.MAX)
+        self._advanceLevel(0, dt, levels, nLevels)
+
+    def _advanceLevel(self, level, dt, levels, nLevels):
+        """Advance the particles of level and higher levels over dt (recursively)."""
+        for pc, l in zip(self.pcs, levels):
+            # kick with the accelerations stored in pc, with the particle's own timestep,
+            # and with the forces for which this is the level of evaluation
+            kick(pc, np.flatnonzero(l == level).tolist(), dt)
+            for force, f in self.forces:
+                elements = np.flatnonzero(((f == level) & (l >= level)) | ((f > level) & (l == level))).tolist()
+                if elements:
+                    kick(pc, elements, dt, a=force(pc, elements))
+            drift(pc, np.flatnonzero(l == level).tolist(), dt)
+        if level + 1 < nLevels:
+            for k in range(self.ratio):
+                self._advanceLevel(level + 1, dt / self.ratio, levels, nLevels)
+                if level + 1 in self.exchangeLevels and self.domain is not None:
+                    self.domain.refreshGhostPositions()
 
+    def setHaloExchange(self, domain, cutoff, skin):
+        """Let move() maintain the ghost particles of domain.
 
-    def move(self,dt=0.1, nTimesteps=1):
+        The ghost width is cutoff + skin, where cutoff is the interaction range. The particles
+        that left the domain are migrated and the ghost particles are rebuilt only when the
+        displacement since the last rebuild could violate correctness, i.e. when two particles
+        could have approached each other by more than the skin. Otherwise, only the positions of
+        the ghost particles are refreshed. This builds the ghost particles, and is a collective
+        operation.
+
+        The decisions to rebuild are reduced over the ranks of the domain's communicator, which
+        becomes self.comm if no communicator was given.
+
+        :param domain: a Domain object.
+        :param float cutoff: interaction range.
+        :param float skin: additional ghost width, also used to limit the timestep if adaptive
+            timestepping is used.
+        """
+        if self.comm is None:
+            self.comm = domain.comm
+        self.domain = domain
+        self.cutoff = cutoff
+        self.ghostSkin = skin
+        self.rebuildHalo()
+
+
+    def rebuildHalo(self):
+        """Migrate the particles that left the domain and rebuild the ghost particles (collective).
+
+        The ghosted elements are recomputed here, so this is where the particle containers can be
+        compacted if the memory budget is exceeded (see mpitoy.memory).
+        """
+        memory.checkBudget(self.pcs)
+        self.domain.exchange(ghostWidth=self.cutoff + self.ghostSkin)
+        self.displacement = 0.0
+        self.nRebuilds += 1
+
+
+    def updateHalo(self, dt, reflected=False, changed=False):
+        """Update the ghost particles after a timestep dt (collective).
+
+        The maximum displacement since the last rebuild is bounded by accumulating vmax*dt (reflection
+        at a wall can add twice that). The halo is rebuilt if twice the maximum displacement over
+        all ranks exceeds the skin, or if the particles added or removed on any rank invalidate
+        the ghost particles (see invalidatesHalo()). Otherwise only the positions of the ghost
+        particles are refreshed.
+
+        :param bool reflected: some particles were reflected by a wall during the timestep.
+        :param bool changed: particles were added or removed during the timestep, in a way that
+            invalidates the ghost particles.
+        """
+        self.displacement += (3 if reflected else 1) * self.maxSpeed() * dt
+        state = np.array([self.displacement, float(changed)])
+        if self.comm is not None and self.comm.size > 1:
+            self.comm.Allreduce(MPI.IN_PLACE, state, op=MPI.MAX)
+        if 2 * state[0] > self.ghostSkin or state[1]:
+            self.rebuildHalo()
+        else:
+            self.domain.refreshGhostPositions()
+            self.nRefreshes += 1
+
+
+    def invalidatesHalo(self, pc, elements):
+        """Whether adding or removing the particles elements of pc (e.g. at an absorbing or inflow
+        wall) requires the halo to be rebuilt (local).
+
+        This is the case if one of the elements is ghosted (the neighbour would receive the
+        position of a removed particle, or of a new particle reusing the element), or if an added
+        particle is within the ghost width of a neighbour plane, or outside the domain. Particles
+        added or removed far from the neighbours leave the halo valid.
+        """
+        added = [i for i in elements if pc.alive[i]]
+        positions = particlePositions(pc, added)
+        ghostWidth = self.cutoff + self.ghostSkin
+        for bp in self.domain.neighbourPlanes:
+            ghosted = bp.ghostElements.get(pc.name)
+            if ghosted and not set(ghosted).isdisjoint(elements):
+                return True
+            if added and np.any((positions - bp.p) @ bp.n < ghostWidth):
+                return True
+        return False
+
+
+    def maxSpeed(self):
+        """The maximum speed of the particles on this rank."""
+        vmax = 0.0
         for pc in self.pcs:
-            forward_euler(pc, dt=dt, nTimesteps=nTimesteps)
-        self.t += nTimesteps*dt
+            alive = np.array(pc.alive, dtype=bool)
+            if alive.any():
+                v2 = np.array(pc.vx)**2 + np.array(pc.vy)**2 + np.array(pc.vz)**2
+                vmax = max(vmax, np.sqrt(v2[alive].max()))
+        return vmax
 
 
-    def plot(self, show=False, save=False, xbound=None, ybound=None):
-        plt.close() # close previous figure if any.
+    def stableTimestep(self, dtMax=None):
+        """Compute the largest timestep for which no particle moves more than self.dtFraction times
+        the minimum radius, or, if self.ghostSkin is set, self.dtFraction times the ghost skin,
+        whichever is smaller.
 
-        fig, ax = plt.subplots()
-        ax.set_aspect(1.0)
-        if xbound:
-            ax.set_xbound(*xbound)
-        if ybound:
-            ax.set_ybound(*ybound)
+        The maximum velocity and acceleration and the minimum radius are reduced over all ranks
+        of self.comm in a single Allreduce. Hence, all ranks get the same timestep and this is a
+        collective operation.
 
+        For forward Euler, the displacement in a timestep dt is bounded by (vmax + amax*dt)*dt.
+        With a ghost skin, a ghost width of interaction range + ghostSkin is therefore safe for
+        at least 1/dtFraction timesteps.
+
+        :param float dtMax: upper bound for the timestep (also used if nothing moves).
+        :return: float
+        """
+        extrema = np.array([0.0, 0.0, -np.inf]) # vmax, amax, -rmin
         for pc in self.pcs:
-            for i in range(pc.capacity):
-                if pc.alive[i]:
-                    id = pc.id[i]
-                    circle = plt.Circle((pc.rx[i], pc.ry[i]), pc.radius[i], color=COLORS[id])
-                    ax.add_patch(circle)
+            alive = np.array(pc.alive, dtype=bool)
+            if alive.any():
+                v2 = np.array(pc.vx)**2 + np.array(pc.vy)**2 + np.array(pc.vz)**2
+                a2 = np.array(pc.ax)**2 + np.array(pc.ay)**2 + np.array(pc.az)**2
+                extrema = np.maximum(extrema, [ np.sqrt(v2[alive].max())
+                                              , np.sqrt(a2[alive].max())
+                                              , -np.array(pc.radius)[alive].min() ])
+        if self.comm is not None and self.comm.size > 1:
+            self.comm.Allreduce(MPI.IN_PLACE, extrema, op=MPI.MAX)
+        vmax, amax, rmin = extrema[0], extrema[1], -extrema[2]
+
+        length = rmin if self.ghostSkin is None else min(rmin, self.ghostSkin)
+        length *= self.dtFraction
+        if vmax == 0 and amax == 0 or not np.isfinite(length):
+            dt = np.inf
+        else:
+            # largest dt for which (vmax + amax*dt)*dt <= length
+            dt = 2 * length / (vmax + np.sqrt(vmax**2 + 4 * amax * length))
+        if dtMax is not None:
+            dt = min(dt, dtMax)
+        return float(dt)
+
+    def walls(self):
+        """Return the BoundaryPlanes in self.domainBoundaries that are walls."""
+        if not self.domainBoundaries:
+            return []
+        return [bp for bp in self.domainBoundaries if bp.isWall]
+
+
+    def memoryReport(self):
+        """Memory report of the particle containers and their ghost containers, see
+        mpitoy.memory.memoryReport() (collective if self.comm is set).
+        """
+        pcs = list(self.pcs)
+        if self.domain is not None:
+            for bp in self.domain.neighbourPlanes:
+                pcs.extend(ghosts for ghosts in bp.ghostPCs.values() if ghosts is not None)
+        return memory.memoryReport(pcs, comm=MPI.COMM_SELF if self.comm is None else self.comm)
+
+    def plot(self, show=False, save=False, xbound=None, ybound=None, pipeline=None, batch=False):
+        """Plot the particles.
+
+        matplotlib is only imported (through mpitoy.viz) when this method is called.
+
+        :param pipeline: if an OutputPipeline is provided and the plot is only saved (not shown),
+            a snapshot is handed to the pipeline, and the figure is rendered and saved in the
+            background.
+        :param bool batch: if True, all particles are drawn as a single EllipseCollection, and the
+            figure is reused by subsequent calls, only updating the positions, radii and colours
+            of the particles. Otherwise, every particle is drawn as a separate patch in a new figure.
+        """
+        from mpitoy import viz
         title = copy(self.name)
         if title:
             title = self.name + ', '
         title += f't={round(self.t,2)}'
-        plt.title(title)
+
+        if pipeline is not None and save and not show:
+            if self.name:
+                print(f'Saving figure to {title}.png.')
+                snap = snapshot(self, arrays=('id', 'rx', 'ry', 'radius'))
+                pipeline.submit(viz.savePlot, snap, title+'.png', colors(), xbound, ybound, title)
+            return
+
+        if batch:
+            fig, ax = viz.plotBatch(self, xbound=xbound, ybound=ybound)
+        else:
+            fig, ax = viz.plotPatches(self, xbound=xbound, ybound=ybound)
+        ax.set_title(title)
 
         if show:
-            plt.show()
+            viz.show()
 
         if save and self.name:
             print(f'Saving figure to {title}.png.')
-            plt.savefig(title+'.png')
-
-
-    # def movie_init(self):
-    #     return []
-    #
-    #
-    # def movie_update(self,frame):
-    #     print(f'Simulation.movie_update {frame=}, t={self.t}')
-    #     for i in range(self.n):
-    #         self.circles[i].center = self.pc.x[:, i]
-    #     self.move(self.nTimestepsPerFrame)
-    #     return []
-    #
-    #
-    # def movie(self,nTimesteps=10, nTimestepsPerFrame=1):
-    #     self.nTimestepsPerFrame = nTimestepsPerFrame
-    #
-    #     self.fig, self.ax = plt.subplots()
-    #     self.ax.set_aspect(1.0)
-    #     self.ax.set_xbound(*self.xbound)
-    #     self.ax.set_ybound(*self.ybound)
-    #
-    #     self.circles = []
-    #     for pc in self.pcs:
-    #         for i in range(pc.n):
-    #             circle = plt.Circle(pc.x[:, i], pc.radius, color=COLORS[pc.id[i]])
-    #             self.ax.add_patch(circle)
-    #             self.circles.append(circle)
-    #
-    #     print(f"Simulation.movie:{nTimesteps=}")
-    #     self.animation = FuncAnimation( self.fig
-    #         , self.movie_update
-    #         , frames=nTimesteps
-    #         , init_func=self.movie_init
-    #         , blit=True
-    #         , repeat=False
-    #         )
-    #     plt.show()
+            fig.savefig(title+'.png')
+
+
+    def plotBatch(self, xbound=None, ybound=None):
+        """Draw all particles as a single EllipseCollection, see mpitoy.viz.plotBatch().
+
+        :return: the figure and the axes.
+        """
+        from mpitoy import viz
+        return viz.plotBatch(self, xbound=xbound, ybound=ybound)
 
 
     # def findGhostParticles(self, xBound, ghostWidth):
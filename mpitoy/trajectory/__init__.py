@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module mpitoy.trajectory
+==========================
+
+A submodule for streaming trajectory output.
+
+A trajectory consists of two files:
+
+* the data file, to which the frames are appended. A frame stores, for every selected array,
+  the values of all live particles as one contiguous block. If 'id' is written, the particles
+  of a frame are sorted by id.
+* the index file (data file name + '.idx'), a json file with the arrays and their dtypes, and
+  for every frame its time, number of particles and offset in the data file.
+
+Frames are buffered in memory and the buffer is written by the background thread of an
+OutputPipeline, so that the timestep loop does not wait for the disk. The reader maps the data
+file with numpy.memmap, so that any frame, or the history of any particle, can be sliced without
+loading the whole file.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from mpitoy.output import OutputPipeline
+
+
+def indexFilename(filename):
+    return filename + '.idx'
+
+
+class TrajectoryWriter:
+    """Append frames of a Simulation to a trajectory file."""
+    def __init__(self, filename, arrays=('id', 'rx', 'ry', 'rz'), velocities=False, bufferSize=1 << 22, pipeline=None):
+        """
+        :param str filename: name of the data file (overwritten if it exists).
+        :param arrays: names of the particle arrays to write.
+        :param bool velocities: if True, also write 'vx', 'vy' and 'vz'.
+        :param int bufferSize: number of bytes buffered before they are handed to the writer thread.
+        :param pipeline: OutputPipeline with a background thread (the default creates one). Its
+            policy must be 'block', as dropping chunks would corrupt the trajectory.
+        """
+        self.filename = filename
+        self.arrays = tuple(arrays) + (('vx', 'vy', 'vz') if velocities else ())
+        self.dtypes = None # determined by the first frame
+        self.bufferSize = bufferSize
+        self.frames = []   # the index: time, number of particles and offset of every frame
+        self.offset = 0    # offset of the next frame in the data file
+        self.buffer = []
+        self.buffered = 0
+        self.file = open(filename, 'wb')
+        self.ownsPipeline = pipeline is None
+        self.pipeline = OutputPipeline(policy='block') if pipeline is None else pipeline
+        if self.pipeline.policy != 'block':
+            raise ValueError("TrajectoryWriter requires an OutputPipeline with policy 'block'.")
+
+    def write(self, sim):
+        """Append a frame with the live particles of all particle containers of Simulation sim.
+
+        The frame is copied, so the simulation can proceed immediately.
+        """
+        pcs = sim.pcs
+        if self.dtypes is None:
+            self.dtypes = [pcs[0].array(name).dtype() for name in self.arrays]
+        columns = []
+        for name, dtype in zip(self.arrays, self.dtypes):
+            block = []
+            for pc in pcs:
+                array = pc.array(name)
+                block.extend(array[i] for i in range(pc.capacity) if pc.alive[i])
+            columns.append(np.array(block, dtype=dtype))
+        n = len(columns[0]) if columns else 0
+        if 'id' in self.arrays:
+            # frames are sorted by id, so that the reader can look up particles with a binary search
+            order = np.argsort(columns[self.arrays.index('id')], kind='stable')
+            columns = [column[order] for column in columns]
+        blocks = [column.tobytes() for column in columns]
+        self.frames.append({'t': float(sim.t), 'n': n, 'offset': self.offset})
+        for block in blocks:
+            self.buffer.append(block)
+            self.buffered += len(block)
+            self.offset += len(block)
+        if self.buffered >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered frames to the writer thread."""
+        if self.buffer:
+            self.pipeline.submit(self._write, b''.join(self.buffer), self._index())
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+        """Write the remaining frames and the index, and wait for the writer thread to finish."""
+        try:
+            self.flush()
+            if self.ownsPipeline:
+                self.pipeline.close()
+            else:
+                self.pipeline.join()
+        finally:
+            self.file.close()
+        self._writeIndex(self._index())
+
+    def _index(self):
+        return { 'arrays': [[name, dtype.str] for name, dtype in zip(self.arrays, self.dtypes or [])]
+               , 'sortedById': 'id' in self.arrays
+               , 'frames': list(self.frames) }
+
+    def _writeIndex(self, index):
+        tmp = indexFilename(self.filename) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, indexFilename(self.filename)) # the index on disk is always complete
+
+    def _write(self, chunk, index):
+        """Write a chunk and update the index on disk (executed by the writer thread)."""
+        self.file.write(chunk)
+        self.file.flush()
+        self._writeIndex(index)
+
+
+class TrajectoryReader:
+    """Read a trajectory file written by TrajectoryWriter."""
+    def __init__(self, filename):
+        self.filename = filename
+        with open(indexFilename(filename)) as f:
+            index = json.load(f)
+        self.arrays = [name for name, dtype in index['arrays']]
+        self.dtypes = [np.dtype(dtype) for name, dtype in index['arrays']]
+        self.frames = index['frames']
+        self.sortedById = index.get('sortedById', False)
+        if os.path.getsize(filename):
+            self.data = np.memmap(filename, dtype=np.uint8, mode='r')
+        else:
+            self.data = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def time(self, k):
+        return self.frames[k]['t']
+
+    def frame(self, k):
+        """Return a dict with the arrays of frame k (views of the memory map, nothing is loaded)."""
+        n = self.frames[k]['n']
+        offset = self.frames[k]['offset']
+        arrays = {}
+        for name, dtype in zip(self.arrays, self.dtypes):
+            arrays[name] = np.frombuffer(self.data, dtype=dtype, count=n, offset=offset)
+            offset += n * dtype.itemsize
+        return arrays
+
+    def history(self, id, name):
+        """Return the times and the values of array name of the particle with id id.
+
+        Frames in which the particle does not exist have value nan. Only the id block of every frame
+        is accessed, with a binary search, as the frames are sorted by id. The cost is
+        O(nFrames * log(nParticles)), and only a few pages of every frame are read from disk.
+        """
+        t = np.array([frame['t'] for frame in self.frames])
+        values = np.full(len(self.frames), np.nan)
+        iid = self.arrays.index('id')
+        iname = self.arrays.index(name)
+        for k, frame in enumerate(self.frames):
+            n = frame['n']
+            offsets = frame['offset'] + n * np.cumsum([0] + [dtype.itemsize for dtype in self.dtypes])
+            ids = np.frombuffer(self.data, dtype=self.dtypes[iid], count=n, offset=int(offsets[iid]))
+            if self.sortedById:
+                j = np.searchsorted(ids, id)
+                found = j < n and ids[j] == id
+            else:
+                # trajectories written by older versions are not sorted
+                hits = np.flatnonzero(ids == id)
+                found = len(hits) > 0
+                j = hits[0] if found else 0
+            if found:
+                dtype = self.dtypes[iname]
+                values[k] = np.frombuffer(self.data, dtype=dtype, count=1, offset=int(offsets[iname]) + int(j) * dtype.itemsize)[0]
+        return t, values
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+Module mpitoy.viz
+==========================
+
+A submodule for the visualization of simulations.
+
+This is the only module of mpitoy that imports matplotlib. It is imported lazily, i.e. only by the
+methods and functions that actually plot (e.g. Simulation.plot()), so that compute ranks that never
+plot do not pay for importing matplotlib.
+"""
+
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.image
+from matplotlib.animation import FuncAnimation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import EllipseCollection
+from matplotlib.figure import Figure
+
+
+def colorTable(n):
+    """A table of n colours, indexed by particle id."""
+    return matplotlib.colormaps['rainbow'](np.linspace(0, 1, n))
+
+
+GOLDEN = (np.sqrt(5.0) - 1.0) / 2.0
+
+
+def idColors(ids, table=None):
+    """The colours of the particles with ids ids.
+
+    If a colour table is given (see mpitoy.simulation.setColors()), and all ids are within its
+    range, the ids index the table. Otherwise the colour is computed from the id itself (a
+    multiplicative hash with the golden ratio), so that no table sized by the total number of
+    particles is needed, and neighbouring ids have clearly different colours.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if table is not None and (len(ids) == 0 or (ids.min() >= 0 and ids.max() < len(table))):
+        return table[ids]
+    return matplotlib.colormaps['rainbow'](np.modf(ids * GOLDEN)[0] % 1.0)
+
+
+def _table():
+    import mpitoy.simulation
+    return mpitoy.simulation.colors()
+
+
+def show():
+    plt.show()
+
+
+def plotPatches(sim, xbound=None, ybound=None):
+    """Draw every particle of Simulation sim as a separate patch in a new pyplot figure.
+
+    :return: the figure and the axes.
+    """
+    plt.close() # close previous figure if any.
+
+    fig, ax = plt.subplots()
+    ax.set_aspect(1.0)
+    if xbound:
+        ax.set_xbound(*xbound)
+    if ybound:
+        ax.set_ybound(*ybound)
+
+    table = _table()
+    for pc in sim.pcs:
+        for i in range(pc.capacity):
+            if pc.alive[i]:
+                id = pc.id[i]
+                circle = plt.Circle((pc.rx[i], pc.ry[i]), pc.radius[i], color=idColors([id], table)[0])
+                ax.add_patch(circle)
+    return fig, ax
+
+
+def plotBatch(sim, xbound=None, ybound=None):
+    """Draw all particles of Simulation sim as a single EllipseCollection.
+
+    The figure, axes and collection are created by the first call, and stored in sim.batchPlot.
+    Subsequent calls reuse them, and only update the offsets, sizes and colours of the collection.
+
+    :return: the figure and the axes.
+    """
+    xy, radius, ids = [], [], []
+    for pc in sim.pcs:
+        alive = np.array(pc.alive, dtype=bool)
+        xy.append(np.stack([np.array(pc.rx, dtype=float)[alive], np.array(pc.ry, dtype=float)[alive]], axis=-1))
+        radius.append(np.array(pc.radius, dtype=float)[alive])
+        ids.append(np.array(pc.id, dtype=np.int64)[alive])
+    xy = np.concatenate(xy)
+    diameter = 2 * np.concatenate(radius)
+    colors = idColors(np.concatenate(ids), _table())
+
+    if sim.batchPlot is None or not plt.fignum_exists(sim.batchPlot[0].number):
+        fig, ax = plt.subplots()
+        ax.set_aspect(1.0)
+        collection = EllipseCollection( diameter, diameter, np.zeros_like(diameter), units='xy'
+                                      , offsets=xy, offset_transform=ax.transData, facecolors=colors )
+        ax.add_collection(collection)
+        sim.batchPlot = (fig, ax, collection)
+    else:
+        fig, ax, collection = sim.batchPlot
+        collection.set_offsets(xy)
+        collection.set_widths(diameter)
+        collection.set_heights(diameter)
+        collection.set_angles(np.zeros_like(diameter))
+        collection.set_facecolors(colors)
+    if xbound:
+        ax.set_xbound(*xbound)
+    if ybound:
+        ax.set_ybound(*ybound)
+    return fig, ax
+
+
+def savePlot(snap, filename, colors=None, xbound=None, ybound=None, title='', planes=None):
+    """Writer rendering a snapshot as a png file.
+
+    This uses matplotlib's object oriented interface with the Agg canvas, rather than pyplot,
+    so that it can be executed in a background thread.
+
+    :param snap: a snapshot, see mpitoy.output.snapshot(). It must contain the arrays 'rx', 'ry' and 'radius'.
+    :param colors: colour table indexed by particle id (e.g. mpitoy.simulation.colors()), see idColors().
+    :param planes: list of (point, normal) pairs of planes, drawn as lines in the xy-plane.
+    """
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_aspect(1.0)
+    if xbound:
+        ax.set_xbound(*xbound)
+    if ybound:
+        ax.set_ybound(*ybound)
+    pcs = list(snap['pcs'].values())
+    if pcs:
+        xy = np.concatenate([np.stack([arrays['rx'], arrays['ry']], axis=-1) for arrays in pcs])
+        diameter = 2 * np.concatenate([arrays['radius'] for arrays in pcs])
+        facecolors = idColors(np.concatenate([arrays['id'] for arrays in pcs]), colors)
+        ax.add_collection(EllipseCollection( diameter, diameter, np.zeros_like(diameter), units='xy'
+                                           , offsets=xy, offset_transform=ax.transData, facecolors=facecolors ))
+    for p, n in planes or []:
+        # the trace of the plane in the xy-plane is perpendicular to n
+        ax.axline((p[0], p[1]), (p[0] - n[1], p[1] + n[0]), color='k', linewidth=0.5, linestyle='--')
+    ax.set_title(title)
+    fig.savefig(filename)
+
+
+def makeMovie(frames, filename, fps=10):
+    """Assemble a list of png files into an animation, using FuncAnimation.
+
+    Works with the Agg backend. Files ending in '.gif' are written with Pillow, other formats with
+    ffmpeg, which must be installed.
+    """
+    first = matplotlib.image.imread(frames[0])
+    height, width = first.shape[:2]
+    fig = Figure(figsize=(width / 100, height / 100), dpi=100)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    image = ax.imshow(first)
+
+    def update(k):
+        image.set_data(matplotlib.image.imread(frames[k]))
+        return [image]
+
+    animation = FuncAnimation(fig, update, frames=len(frames), blit=False, repeat=False)
+    animation.save(filename, writer='pillow' if filename.endswith('.gif') else 'ffmpeg', fps=fps, dpi=100)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.insert(0,'.')
+
+"""Tests for sub-module mpitoy.benchmark."""
+
+import json
+
+from mpi4py import MPI
+
+from mpitoy.benchmark import run, load, formatResults
+from mpitoy.benchmark.__main__ import main
+
+
+def test_run():
+    results = run(MPI.COMM_SELF, repeat=2, scale=0.01)
+    assert results['meta']['nRanks'] == 1
+    benchmarks = results['benchmarks']
+    assert {entry['group'] for entry in benchmarks.values()} == {'particlecontainer', 'forward_euler', 'classify', 'simulation'}
+    assert 'particlecontainer.clone[n=10]' in benchmarks
+    assert 'simulation.strong[nTotal=32]' in benchmarks
+    for entry in benchmarks.values():
+        assert len(entry['seconds']) == 2
+        assert entry['work'] > 0
+    # pcsendrecv requires a partner rank
+    assert not any(name.startswith('pcsendrecv') for name in benchmarks)
+    assert 'forward_euler[n=10]' in formatResults(results)
+
+
+def test_groups():
+    results = run(MPI.COMM_SELF, repeat=1, scale=0.01, groups=['forward*'])
+    assert list(results['benchmarks']) == ['forward_euler[n=10]', 'forward_euler[n=100]']
+
+
+def test_save_load(tmp_path):
+    filename = tmp_path / 'results.json'
+    main(['--output', str(filename), '--repeat', '1', '--scale', '0.01', '--groups', 'classify'])
+    results = load(filename)
+    assert results['meta']['nRanks'] == MPI.COMM_WORLD.size
+    assert json.loads(json.dumps(results)) == results
+    assert 'classify.leaving[n=10]' in results['benchmarks']
+
+
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_run
+
+    print("__main__ running", the_test_you_want_to_debug)
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
+
+# eof
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.insert(0,'.')
+
+"""Tests for sub-module mpitoy.checkpoint."""
+
+from mpi4py import MPI
+import numpy as np
+import pytest
+
+from mpitoy import Spheres
+from mpitoy.simulation import Simulation
+from mpitoy.checkpoint import writeCheckpoint, readCheckpoint, readHeader
+
+
+def test_recordDtype():
+    spheres = Spheres(2)
+    dtype = spheres.recordDtype()
+    assert dtype.names == tuple(spheres.arrays.keys())
+    assert dtype['id'] == np.int64
+    assert dtype['rx'] == np.float64
+
+
+def test_write_read(tmp_path):
+    filename = str(tmp_path / 'checkpoint.bin')
+    spheres = Spheres(5, name='spheres_cp')
+    spheres.kill(2)
+    sim = Simulation(spheres)
+    sim.move(dt=0.5)
+    writeCheckpoint(filename, sim, comm=MPI.COMM_SELF)
+
+    header, dataStart = readHeader(filename, comm=MPI.COMM_SELF)
+    assert header['t'] == 0.5
+    assert header['containers'][0]['count'] == 4
+
+    restored = Spheres(0, name='spheres_cp')
+    sim2 = Simulation(restored)
+    readCheckpoint(filename, sim2, comm=MPI.COMM_SELF)
+    assert sim2.t == 0.5
+    assert restored.size == 4
+    assert [restored.id[i] for i in range(4)] == [0, 1, 3, 4]
+    assert [restored.rx[i] for i in range(4)] == [spheres.rx[i] for i in (0, 1, 3, 4)]
+    assert type(restored.id[0]) is int
+
+
+def test_integer_default(tmp_path):
+    spheres = Spheres(2, name='spheres_cp_int')
+    spheres.addArray('mass', 1)
+    spheres.mass[0] = 1.5
+    with pytest.raises(ValueError):
+        writeCheckpoint(str(tmp_path / 'int.bin'), Simulation(spheres, comm=MPI.COMM_SELF), comm=MPI.COMM_SELF)
+
+
+def test_write_read_vectors(tmp_path):
+    """VectorArrays are stored as fields with a shape."""
+    filename = str(tmp_path / 'vectors.bin')
+    spheres = Spheres(5, name='spheres_cp_vectors', vectors=True)
+    spheres.kill(1)
+    writeCheckpoint(filename, Simulation(spheres, comm=MPI.COMM_SELF), comm=MPI.COMM_SELF)
+    restored = Spheres(0, name='spheres_cp_vectors', vectors=True)
+    readCheckpoint(filename, Simulation(restored, comm=MPI.COMM_SELF), comm=MPI.COMM_SELF)
+    assert restored.size == 4
+    assert restored.r.data[:4].tolist() == spheres.r.data[[0, 2, 3, 4]].tolist()
+
+
+def test_not_a_checkpoint(tmp_path):
+    filename = str(tmp_path / 'garbage.bin')
+    with open(filename, 'wb') as f:
+        f.write(b'0123456789abcdef')
+    with pytest.raises(RuntimeError):
+        readHeader(filename, comm=MPI.COMM_SELF)
+
+
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_write_read
+
+    print("__main__ running", the_test_you_want_to_debug)
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
+
+# eof
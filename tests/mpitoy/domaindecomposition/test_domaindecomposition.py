@@ -4,8 +4,10 @@ import sys
 sys.path.insert(0,'.')
 """Tests for sub-module mpitoy.domainboundary."""
 import pytest
-from mpitoy.domaindecomposition import BoundaryPlane, ParallelSlabs, TagComposer, TagStore
-from mpitoy.simulation import setColors, Simulation
+from types import SimpleNamespace
+import numpy as np
+from mpitoy.domaindecomposition import BoundaryPlane, ParallelSlabs, MESSAGE_KINDS, messageTag
+from mpitoy.simulation import setColors, Simulation, forward_euler
 from mpitoy import Spheres
 
 def test_plane():
@@ -20,6 +22,94 @@ def test_ParallelSlabs():
     assert boundaries.size == 2
 
 
+def test_ParallelSlabs_periodic():
+    slabs = ParallelSlabs(points=[[5, 0, 0], [10, 0, 0], [15, 0, 0]], n=[1, 0, 0], period=15)
+    comm = SimpleNamespace(size=3)
+
+    comm.rank = 0
+    bps = slabs.decompose(comm)
+    assert [bp.nbRank for bp in bps] == [1, 2]
+    assert bps[0].shift is None
+    assert np.all(bps[1].p == [0, 0, 0])
+    assert np.all(bps[1].shift == [15, 0, 0])
+    assert bps[1].distance([-0.5, 0, 0]) < 0
+
+    comm.rank = 2
+    bps = slabs.decompose(comm)
+    assert [bp.nbRank for bp in bps] == [1, 0]
+    assert np.all(bps[1].p == [15, 0, 0])
+    assert np.all(bps[1].shift == [-15, 0, 0])
+    assert bps[1].distance([15.5, 0, 0]) < 0
+
+    # decomposing twice must not alter the planes
+    comm.rank = 1
+    assert [bp.distance([7, 0, 0]) > 0 for bp in slabs.decompose(comm)] == [True, True]
+    assert [bp.distance([7, 0, 0]) > 0 for bp in slabs.decompose(comm)] == [True, True]
+
+
+def test_applyShift():
+    spheres = Spheres(2)
+    bp = BoundaryPlane(p=[0, 0, 0], n=[1, 0, 0])
+    bp.shift = np.array([10., 0, 0])
+    bp.applyShift(spheres)
+    assert spheres.rx[0] == 10.5
+    assert spheres.rx[1] == 11.5
+
+
+def test_reflective_wall():
+    spheres = Spheres(2)
+    for i in range(2):
+        spheres.vx[i] = -1.0
+    spheres.rx[0] = 0.3
+    wall = BoundaryPlane(p=[0, 0, 0], n=[1, 0, 0], kind='reflective')
+    assert wall.isWall
+    reflected = wall.applyWall(spheres)
+    assert reflected == [0]
+    assert spheres.rx[0] == pytest.approx(0.7)
+    assert spheres.vx[0] == 1.0
+    assert spheres.vx[1] == -1.0
+
+
+def test_absorbing_wall():
+    spheres = Spheres(3)
+    spheres.rx[1] = -0.1
+    wall = BoundaryPlane(p=[0, 0, 0], n=[1, 0, 0], kind='absorbing')
+    assert wall.applyWall(spheres) == [1]
+    assert spheres.size == 2
+    assert not spheres.alive[1]
+
+
+def test_inflow_wall():
+    spheres = Spheres(0)
+    wall = BoundaryPlane(p=[0, 0, 0], n=[1, 0, 0], kind='inflow', rate=3, velocity=[1, 0, 0], id0=100)
+    assert wall.applyWall(spheres, dt=0.5) == [0]
+    assert wall.applyWall(spheres, dt=0.5) == [1, 2]
+    assert spheres.size == 3
+    assert [spheres.id[i] for i in range(3)] == [100, 101, 102]
+    assert spheres.rx[0] == 0.5
+    assert spheres.vx[0] == 1.0
+    # particles injected in the same timestep do not overlap
+    assert spheres.rx[1:3] == [0.5, 1.5]
+    with pytest.raises(ValueError):
+        BoundaryPlane(p=[0, 0, 0], n=[1, 0, 0], kind='inflow', rate=3)
+
+
+def test_ParallelSlabs_walls():
+    lower = BoundaryPlane(p=[0, 0, 0], n=[1, 0, 0], kind='reflective')
+    upper = BoundaryPlane(p=[10, 0, 0], n=[1, 0, 0], kind='absorbing')
+    slabs = ParallelSlabs(points=[[5, 0, 0]], n=[1, 0, 0], lowerWall=lower, upperWall=upper)
+    comm = SimpleNamespace(size=2, rank=0)
+    bps = slabs.decompose(comm)
+    assert [bp.kind for bp in bps] == [None, 'reflective']
+    assert bps[1].distance([1, 0, 0]) > 0
+    comm.rank = 1
+    bps = slabs.decompose(comm)
+    assert [bp.kind for bp in bps] == [None, 'absorbing']
+    assert bps[1].distance([9, 0, 0]) > 0
+    with pytest.raises(ValueError):
+        ParallelSlabs(points=[[5, 0, 0]], n=[1, 0, 0], period=10, lowerWall=lower)
+
+
 def test_findLeavingParticles():
     spheres = Spheres(2)
     bp = BoundaryPlane(p=[1,0,0],n=[-1,0,0])
@@ -32,51 +122,61 @@ def test_findGhostParticles():
     toBeGhosted = bp.findGhostParticles(spheres,ghostWidth=01.0)
     assert toBeGhosted == [4]
 
-def test_tagcomposer():
-    tagger = TagComposer(digits=[2,2,2,2])
-
-    args = [1,2,3,4]
-    tag = tagger(*args)
-    expected = 1020304
-    assert tag == expected
-    decomposed = tagger.decompose(tag)
-    assert decomposed == args
-
-    args = [10,20,30,40]
-    tag = tagger(*args)
-    expected = 10203040
-    assert tag == expected
-    decomposed = tagger.decompose(tag)
-    assert decomposed == args
-
-    args = [100,20,30,40]
-    tag = tagger(*args)
-    expected = 100203040
-    assert tag == expected
-    decomposed = tagger.decompose(tag)
-    assert decomposed == args
-
-    with pytest.raises(ValueError):
-        tag = tagger(100, 200, 30, 40)
-
-
-def test_tagstore():
-    tagstore = TagStore()
-    spheres = Spheres(5)
-    rx = spheres.rx
-    ry = spheres.ry
-
-    tag = tagstore.getTag(2)
-    assert tag == 1
-
-    tag = tagstore.getTag(4)
-    assert tag == 5
+def test_messageTag():
+    tags = {messageTag(f'spheres{i}', kind, direction) for i in range(100) for kind in MESSAGE_KINDS for direction in (0, 1)}
+    assert max(tags) < 2**15 and min(tags) >= 0
+    # deterministic
+    assert messageTag('spheres', 'ghosts', 0) == messageTag('spheres', 'ghosts', 0)
+    assert len({messageTag('spheres', kind, direction) for kind in MESSAGE_KINDS for direction in (0, 1)}) == 2 * len(MESSAGE_KINDS)
+
+
+def test_send_recv_tag():
+    """The send tag of a plane is the receive tag of the neighbour's plane, whatever the ranks."""
+    lower = BoundaryPlane(p=[5,0,0], n=[1,0,0])
+    upper = BoundaryPlane(p=[5,0,0], n=[-1,0,0])
+    lower.myRank, lower.nbRank = 5000, 4999
+    upper.myRank, upper.nbRank = 4999, 5000
+    assert (lower.direction, upper.direction) == (0, 1)
+    assert lower.send_tag('leaving', 'spheres') == upper.recv_tag('leaving', 'spheres')
+    assert upper.send_tag('leaving', 'spheres') == lower.recv_tag('leaving', 'spheres')
+    assert lower.send_tag('leaving', 'spheres') != lower.recv_tag('leaving', 'spheres')
+    assert BoundaryPlane(p=[0,5,0], n=[0,-1,1]).direction == 1
+
+def test_vector_spheres():
+    """Classification, shifts and timesteps give the same results with VectorArrays."""
+    scalar, vector = Spheres(5, name='scalar'), Spheres(5, name='vector', vectors=True)
+    bp = BoundaryPlane(p=[5,0,0], n=[-1,0,0])
+    elements, d = bp.distances(vector)
+    assert elements.tolist() == [0, 1, 2, 3, 4] and d.tolist() == [4.5, 3.5, 2.5, 1.5, 0.5]
+    for pc in (scalar, vector):
+        pc.vx[4] = 10.0
+        forward_euler(pc, dt=0.1, nTimesteps=2)
+    assert np.allclose(vector.r.data[:5], np.array([scalar.rx, scalar.ry, scalar.rz], dtype=float).T[:5])
+    assert bp.findLeavingParticles(vector) == bp.findLeavingParticles(scalar) == [4]
+    assert bp.findGhostParticles(vector, ghostWidth=1.5) == bp.findGhostParticles(scalar, ghostWidth=1.5) == [3]
+    bp.shift = np.array([10., 0, 0])
+    bp.applyShift(vector)
+    assert vector.rx[0] == pytest.approx(10.52)
+
+
+def test_packParticles():
+    """Particles are packed as shifted records, or in a clone if they cannot be represented as records."""
+    spheres = Spheres(4, name='spheres_pack')
+    bp = BoundaryPlane(p=[0, 0, 0], n=[1, 0, 0])
+    bp.shift = np.array([10., 0, 0])
+    packed = bp.packParticles(spheres, [1, 2], move=True)
+    assert isinstance(packed, np.ndarray) and packed['rx'].tolist() == [11.5, 12.5]
+    assert spheres.size == 2 and spheres.rx[1] == 1.5
+    bp.unpackParticles(packed, spheres)
+    assert spheres.size == 4 and sorted(bp.packedIds(packed)) == [1, 2]
+    spheres.addArray('label', 'a')
+    spheres.label[0] = 'long label'
+    packed = bp.packParticles(spheres, [0])
+    assert not isinstance(packed, np.ndarray) and packed.label[0] == 'long label' and packed.rx[0] == 10.5
 
-    tag = tagstore.getTag(1)
-    assert tag == 6
 
 if __name__ == "__main__":
-    the_test_you_want_to_debug = test_tagstore
+    the_test_you_want_to_debug = test_send_recv_tag
 
     print("__main__ running", the_test_you_want_to_debug)
     the_test_you_want_to_debug()
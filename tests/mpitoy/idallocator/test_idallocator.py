@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.insert(0,'.')
+
+"""Tests for sub-module mpitoy.idallocator."""
+
+import numpy as np
+from mpi4py import MPI
+
+from mpitoy import Spheres
+from mpitoy.domaindecomposition import BoundaryPlane
+from mpitoy.idallocator import IdAllocator
+
+
+def test_allocate():
+    allocator = IdAllocator(comm=MPI.COMM_SELF, next=10)
+    ids = allocator.allocate(3)
+    assert ids.dtype == np.int64
+    assert ids.tolist() == [10, 11, 12]
+    assert allocator.allocateLocal(2).tolist() == [13, 14]
+    # ids drawn locally are skipped
+    assert allocator.allocate(2).tolist() == [15, 16]
+    assert allocator.allocate(0).tolist() == []
+    assert allocator.next == 17
+
+
+def test_maxId():
+    spheres = Spheres(4, name='spheres_maxid', id0=5)
+    spheres.kill(3)
+    allocator = IdAllocator(comm=MPI.COMM_SELF, next=IdAllocator.maxId([spheres], MPI.COMM_SELF) + 1)
+    assert allocator.allocate(1).tolist() == [8]
+    assert IdAllocator.maxId([Spheres(0, name='spheres_none')], MPI.COMM_SELF) == -1
+
+
+def test_large_ids():
+    allocator = IdAllocator(comm=MPI.COMM_SELF, next=2**40)
+    spheres = Spheres(3, name='spheres_ids', allocator=allocator)
+    assert spheres.id[:3] == [2**40, 2**40 + 1, 2**40 + 2]
+
+
+def test_inflow_allocator():
+    allocator = IdAllocator(comm=MPI.COMM_SELF)
+    spheres = Spheres(2, name='spheres_inflow_ids', allocator=allocator)
+    wall = BoundaryPlane(p=[0, 0, 0], n=[1, 0, 0], kind='inflow', rate=2, allocator=allocator)
+    added = wall.applyWall(spheres, dt=1.0)
+    assert [spheres.id[i] for i in added] == [2, 3]
+
+
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_allocate
+
+    print("__main__ running", the_test_you_want_to_debug)
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
+
+# eof
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.insert(0,'.')
+
+"""Tests for sub-module mpitoy.memory."""
+
+import pytest
+from mpi4py import MPI
+
+from mpitoy import Spheres, memory
+from mpitoy.simulation import Simulation
+
+
+def test_memoryReport():
+    a = Spheres(30, name='spheres_report')
+    b = Spheres(10, name='ghosts_report')
+    c = Spheres(10, name='ghosts_report')
+    report = memory.memoryReport([a, b, c], comm=MPI.COMM_SELF)
+    assert set(report['containers']) == {'spheres_report', 'ghosts_report'}
+    ghosts = report['containers']['ghosts_report']
+    assert ghosts['size']['sum'] == 20
+    assert ghosts['capacity']['max'] == b.capacity + c.capacity
+    assert report['arrays']['spheres_report.rx']['reserved']['min'] == a.capacity * a.rx.itemsize()
+    assert report['total']['reserved']['sum'] == memory.reservedBytes([a, b, c])
+    assert 'spheres_report' in memory.formatReport(report)
+
+
+def test_budget():
+    spheres = Spheres(100, name='spheres_budget')
+    spheres.kill(list(range(90)))
+    compactions = []
+    budget = memory.MemoryBudget(memory.reservedBytes([spheres]) // 2, callback=lambda pcs, before, after: compactions.append((before, after)))
+    assert budget([spheres])
+    assert spheres.capacity == 10
+    assert compactions[0][1] < compactions[0][0]
+    assert not budget([spheres])
+    assert budget.nCompactions == 1
+
+
+def test_simulation_budget():
+    spheres = Spheres(100, name='spheres_sim_budget')
+    spheres.kill(list(range(50)))
+    sim = Simulation(spheres)
+    memory.setBudget(memory.reservedBytes([spheres]) - 1)
+    try:
+        sim.move(dt=0.1)
+    finally:
+        memory.setBudget(None)
+    assert spheres.capacity == 50
+    assert spheres.rx[:50] == pytest.approx([(1 + 2 * i) * 0.5 + 0.01 for i in range(50, 100)])
+    report = sim.memoryReport()
+    assert report['containers']['spheres_sim_budget']['liveFraction']['max'] == 1.0
+    assert report['containers']['spheres_sim_budget']['peakCapacity']['max'] >= 100
+
+
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_budget
+
+    print("__main__ running", the_test_you_want_to_debug)
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
+
+# eof
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.insert(0,'.')
+
+"""Tests for sub-module mpitoy.output."""
+
+import os
+import threading
+
+import pytest
+
+from mpitoy import Spheres
+from mpitoy.simulation import Simulation, setColors
+from mpitoy.output import OutputPipeline, snapshot, FrameWriter
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpi4py import MPI
+
+
+def test_snapshot():
+    spheres = Spheres(3, name='spheres_snap')
+    spheres.kill(1)
+    sim = Simulation(spheres)
+    snap = snapshot(sim, arrays=('id', 'rx'))
+    arrays = snap['pcs']['spheres_snap']
+    assert arrays['id'].tolist() == [0, 2]
+    assert arrays['rx'].tolist() == [0.5, 2.5]
+    # it is a copy
+    spheres.rx[0] = 10.0
+    assert arrays['rx'][0] == 0.5
+
+
+def test_pipeline_block():
+    written = []
+    pipeline = OutputPipeline(maxsize=2)
+    for k in range(5):
+        assert pipeline.submit(written.append, k)
+    pipeline.close()
+    assert written == [0, 1, 2, 3, 4]
+    assert pipeline.nWritten == 5
+
+
+def test_pipeline_drop():
+    release = threading.Event()
+    written = []
+    pipeline = OutputPipeline(maxsize=1, policy='drop')
+    pipeline.submit(release.wait)  # occupies the worker
+    results = [pipeline.submit(written.append, k) for k in range(3)]
+    release.set()
+    pipeline.close()
+    assert pipeline.nDropped >= 1
+    assert results.count(False) == pipeline.nDropped
+    assert len(written) == 3 - pipeline.nDropped
+
+
+def test_pipeline_error():
+    def fail():
+        raise OSError('disk full')
+    written = []
+    pipeline = OutputPipeline(maxsize=1)
+    pipeline.submit(fail)
+    with pytest.raises(RuntimeError):
+        pipeline.join()
+    # the worker is still alive and drains the queue, so nothing blocks
+    with pytest.raises(RuntimeError):
+        pipeline.submit(written.append, 1)
+    with pytest.raises(RuntimeError):
+        pipeline.close()
+    assert written == []
+    assert not pipeline.worker.is_alive()
+
+
+def test_policy():
+    with pytest.raises(ValueError):
+        OutputPipeline(policy='hurry')
+
+
+def test_plot_pipeline(tmp_path):
+    setColors(5)
+    spheres = Spheres(5, name='spheres_plot')
+    sim = Simulation(spheres, name=str(tmp_path / 'pipeline'))
+    pipeline = OutputPipeline()
+    sim.plot(xbound=(0, 10), ybound=(0, 1), save=True, pipeline=pipeline)
+    pipeline.close()
+    assert os.path.exists(str(tmp_path / 'pipeline') + ', t=0.png')
+
+
+def test_frameWriter(tmp_path):
+    setColors(5)
+    spheres = Spheres(5, name='spheres_frames')
+    sim = Simulation(spheres, name='frames')
+    planes = ParallelSlabs([[5, 0, 0]], n=[1, 0, 0]).decompose(MPI.COMM_SELF)
+    frames = FrameWriter(str(tmp_path / 'frames'), comm=MPI.COMM_SELF, boundaryPlanes=planes, xbound=(0, 10), ybound=(0, 1))
+    records = frames.gather(sim, root=0)
+    assert records['id'].tolist() == [0, 1, 2, 3, 4]
+    assert records['rx'].tolist() == [0.5, 1.5, 2.5, 3.5, 4.5]
+    for k in range(3):
+        frames.write(sim)
+        sim.move(dt=1)
+    frames.close()
+    assert sorted(os.listdir(tmp_path / 'frames')) == ['frame_00000.png', 'frame_00001.png', 'frame_00002.png']
+    frames.movie(str(tmp_path / 'frames.gif'), fps=2)
+    assert os.path.getsize(tmp_path / 'frames.gif') > 0
+
+
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_pipeline_drop
+
+    print("__main__ running", the_test_you_want_to_debug)
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
+
+# eof
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.insert(0,'.')
+
+"""Tests for sub-module mpitoy.packing."""
+
+import numpy as np
+import pytest
+
+from mpitoy import Spheres
+from mpitoy.domaindecomposition import BoundaryPlane
+from mpitoy.packing import cubicLattice, hexagonalLattice, randomPacking, addSpheres, inside
+
+
+def minDistance(positions):
+    d = np.linalg.norm(positions[:, None, :] - positions[None, :, :], axis=-1)
+    d[np.diag_indices(len(positions))] = np.inf
+    return d.min()
+
+
+def test_cubicLattice():
+    positions, ids = cubicLattice(1.0, [0, 0, 0], [3, 2, 1])
+    assert len(positions) == 6
+    assert sorted(ids.tolist()) == list(range(6))
+    assert positions.min() == 0.5
+    assert minDistance(positions) == pytest.approx(1.0)
+
+
+def test_hexagonalLattice():
+    r = 0.5
+    positions, ids = hexagonalLattice(r, [0, 0, 0], [5, 5, 5])
+    assert len(np.unique(ids)) == len(ids)
+    assert minDistance(positions) == pytest.approx(2 * r)
+    assert np.all(positions - r >= -1e-9) and np.all(positions + r <= 5 + 1e-9)
+    # denser than the simple cubic lattice
+    positions, ids = hexagonalLattice(r, [0, 0, 0], [10, 10, 10])
+    assert len(positions) > 1.2 * len(cubicLattice(2 * r, [0, 0, 0], [10, 10, 10])[0])
+
+
+def test_randomPacking():
+    r = 0.5
+    positions, ids = randomPacking(r, [0, 0, 0], [10, 10, 2.5], fraction=0.8, seed=3)
+    assert 0 < len(positions) < 8 * 8 * 2 # cells of size 2.5*r
+    assert minDistance(positions) >= 2 * r
+    again, _ = randomPacking(r, [0, 0, 0], [10, 10, 2.5], fraction=0.8, seed=3)
+    assert np.array_equal(positions, again)
+    with pytest.raises(ValueError):
+        randomPacking(r, [0, 0, 0], [10, 10, 10], spacing=0.5)
+
+
+def test_restricted():
+    # two domains sharing the plane x=2, the lattice points on it belong to the upper domain.
+    lower = [BoundaryPlane([2, 0, 0], [-1, 0, 0])]
+    upper = [BoundaryPlane([2, 0, 0], [1, 0, 0])]
+    full, ids = cubicLattice(1.0, [-0.5, 0, 0], [4.5, 1, 1])
+    p0, ids0 = cubicLattice(1.0, [-0.5, 0, 0], [4.5, 1, 1], boundaryPlanes=lower)
+    p1, ids1 = cubicLattice(1.0, [-0.5, 0, 0], [4.5, 1, 1], boundaryPlanes=upper)
+    assert p0[:, 0].tolist() == [0, 1]
+    assert p1[:, 0].tolist() == [2, 3, 4]
+    assert sorted(ids0.tolist() + ids1.tolist()) == sorted(ids.tolist())
+    assert inside(p1, upper).all() and not inside(p1, lower).any()
+
+
+def test_randomPacking_restricted():
+    # a plane that does not coincide with the cell boundaries: displaced spheres must end up on
+    # the correct side.
+    lower = [BoundaryPlane([5.2, 0, 0], [-1, 0, 0])]
+    upper = [BoundaryPlane([5.2, 0, 0], [1, 0, 0])]
+    box = ([0, 0, 0], [10, 10, 2.5])
+    full, ids = randomPacking(0.5, *box, spacing=2.0, seed=1)
+    p0, ids0 = randomPacking(0.5, *box, spacing=2.0, seed=1, boundaryPlanes=lower)
+    p1, ids1 = randomPacking(0.5, *box, spacing=2.0, seed=1, boundaryPlanes=upper)
+    assert inside(p0, lower).all() and inside(p1, upper).all()
+    assert sorted(ids0.tolist() + ids1.tolist()) == sorted(ids.tolist())
+    # some spheres were displaced across the plane, from their cell's domain into the other one
+    cellCentre = lambda ids: (ids // 5 + 0.5) * 2.0 # 5x5x1 cells of size 2
+    assert np.any(cellCentre(ids0) < 5.2) and np.any(cellCentre(ids1) < 5.2)
+
+
+def test_addSpheres():
+    spheres = Spheres(0, name='spheres_packing')
+    positions, ids = cubicLattice(1.0, [0, 0, 0], [4, 4, 1])
+    elements = addSpheres(spheres, positions, ids, radius=0.5, velocity=[1, 0, 0])
+    assert spheres.size == 16 and spheres.capacity >= 16
+    assert elements.tolist() == list(range(16))
+    assert spheres.rx[:16] == positions[:, 0].tolist()
+    assert spheres.id[:16] == ids.tolist()
+    assert spheres.vx[:16] == 16 * [1.0]
+    assert isinstance(spheres.rx[0], float)
+
+
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_restricted
+
+    print("__main__ running", the_test_you_want_to_debug)
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
+
+# eof
@@ -5,8 +5,12 @@ sys.path.insert(0,'.')
 
 """Tests for mpitoy package."""
 
-from mpitoy.particlecontainer import ParticleContainer,ParticleArray
-from mpitoy import Spheres
+import pickle
+
+import numpy as np
+
+from mpitoy.particlecontainer import ParticleContainer,ParticleArray, VectorArray, ComponentArray, PACKED_MESSAGE_MIN
+from mpitoy import Spheres, MIXED_PRECISION
 
 import pytest
 
@@ -227,6 +231,195 @@ def test_tag():
         if tag != tags[i]:
             assert False
 
+
+def test_addElements():
+    pc = ParticleContainer(name='pc_bulk')
+    ParticleArray(pc, name='x', defaultValue=0.0)
+    for j in range(4):
+        pc.addElement()
+    pc.kill([1, 2])
+    elements = pc.addElements(12)
+    # free elements first, in the same order as addElement(), then contiguous new elements
+    assert elements.tolist() == [2, 1] + list(range(4, 14))
+    assert pc.size == 14
+    assert pc.capacity >= 14
+    assert not pc.free
+    assert all(pc.alive[i] for i in range(14))
+    pc.x.assign(elements, 1.5)
+    assert [pc.x[i] for i in elements] == 12 * [1.5]
+    assert pc.x[0] == pc.x[3] == 0.0
+    pc.x.assign(elements[2:], range(12, 22))
+    assert pc.x[4:14] == list(range(12, 22))
+    assert pc.addElement() == 14
+
+
+def test_idIndex():
+    spheres = Spheres(5, name='spheres_index', id0=10)
+    with pytest.raises(RuntimeError):
+        spheres.lookup(10)
+    spheres.indexIds()
+    assert spheres.lookup(12) == 2
+    assert spheres.lookup([14, 10, 99]).tolist() == [4, 0, -1]
+    spheres.kill(2)
+    assert spheres.lookup(12) == -1
+    i = spheres.addElement()
+    spheres.id[i] = 20
+    assert spheres.lookup(20) == i == 2
+    spheres.id[0] = 30 # renumbering
+    assert spheres.lookup([10, 30]).tolist() == [-1, 0]
+    # clone(move=True) removes the moved particles from the index, copyto() adds them
+    moved = spheres.clone(elements=[3, 4], move=True)
+    assert spheres.lookup([13, 14]).tolist() == [-1, -1]
+    other = Spheres(0, name='spheres_index_other')
+    other.indexIds()
+    moved.copyto(other)
+    assert other.lookup([13, 14]).tolist() == [0, 1]
+    # bulk additions
+    elements = other.addElements(3)
+    other.id.assign(elements, [40, 41, 42])
+    assert other.lookup([42, 40]).tolist() == [4, 2]
+
+def test_compact():
+    spheres = Spheres(50, name='spheres_compact', id0=100)
+    spheres.indexIds()
+    spheres.kill(list(range(0, 50, 2)))
+    assert spheres.peakCapacity == spheres.capacity >= 50
+    moved = spheres.compact()
+    assert spheres.size == 25 and spheres.capacity == 25
+    assert spheres.peakCapacity >= 50
+    assert not spheres.free
+    assert all(spheres.alive[:25])
+    assert spheres.id[:25] == list(range(101, 150, 2))
+    assert moved[1] == 0 and moved[49] == 24 and moved[0] == -1
+    assert spheres.lookup(149) == 24
+    assert all(len(array) == 25 for array in spheres.arrays.values())
+    assert spheres.addElement() == 25
+
+
+def test_memory():
+    spheres = Spheres(20, name='spheres_memory')
+    spheres.kill(list(range(10)))
+    memory = spheres.memory()
+    assert memory['size'] == 10
+    assert memory['liveFraction'] == pytest.approx(10 / spheres.capacity)
+    assert memory['arrays']['rx']['reserved'] == spheres.capacity * spheres.rx.itemsize()
+    assert memory['arrays']['alive']['used'] == 10 * 8
+    assert memory['reserved'] == sum(a['reserved'] for a in memory['arrays'].values())
+    assert memory['used'] < memory['reserved']
+
+
+def test_precision():
+    """A declared precision is stored in numpy arrays, only in the vector layout."""
+    spheres = Spheres(5, name='spheres_mixed', precision=MIXED_PRECISION, vectors=True)
+    assert isinstance(spheres.radius, VectorArray) and spheres.radius.shape == ()
+    assert spheres.radius.data.dtype == np.float32 and spheres.radius.itemsize() == 4
+    assert spheres.v.dtype() == np.float32 and spheres.r.dtype() == np.float64
+    assert spheres.vx[0] == float(np.float32(0.1)) != 0.1
+    spheres.radius[1] = 1 / 3
+    assert spheres.radius[1] == np.float32(1 / 3)
+    assert np.asarray(spheres.radius).tolist()[:2] == [0.5, float(np.float32(1 / 3))]
+    assert spheres.recordDtype()['radius'] == np.float32
+    clone = spheres.clone(elements='all')
+    assert clone.radius.data.dtype == np.float32 and clone.radius.shape == ()
+    with pytest.raises(ValueError):
+        Spheres(5, name='spheres_mixed_lists', precision=MIXED_PRECISION)
+
+
+def test_pickle():
+    """Small arrays are pickled as lists, large float arrays as numpy arrays."""
+    small = Spheres(2, name='spheres_small')
+    spheres = Spheres(PACKED_MESSAGE_MIN, name='spheres_pickle')
+    assert isinstance(small.rx.packMessage([0, 1]), list)
+    assert isinstance(spheres.id.packMessage(range(PACKED_MESSAGE_MIN)), list)
+    assert isinstance(spheres.rx.packMessage(range(PACKED_MESSAGE_MIN)), np.ndarray)
+    assert len(pickle.dumps(spheres.rx.packMessage(range(PACKED_MESSAGE_MIN)))) < len(pickle.dumps(list(spheres.rx)))
+    for pc in (small, spheres):
+        unpickled = pickle.loads(pickle.dumps(pc))
+        for name, array in pc.arrays.items():
+            assert type(unpickled.arrays[name]) is type(array)
+            assert unpickled.arrays[name] == array
+            assert unpickled.arrays[name].pc is unpickled
+        assert unpickled.alive == pc.alive
+        assert type(unpickled.rx[1]) is float and type(unpickled.id[1]) is int
+    # values that do not fit the dtype are pickled as objects
+    pa = ParticleArray(unpickled, name='misc', defaultValue=0.0)
+    pa[2] = 'a'
+    assert pa.pack([1, 2]) == [0.0, 'a']
+    assert pickle.loads(pickle.dumps(unpickled)).misc[2] == 'a'
+
+
+def test_vector_array():
+    """VectorArrays store the elements in a (capacity,3) block, and grow, compact and clone as scalar arrays."""
+    pc = ParticleContainer(name='pc_vector')
+    r = VectorArray(pc, 'r', defaultValue=(0.0, 1.0, 2.0), components=('rx', 'ry', 'rz'))
+    assert pc.r is r and pc.arrays['r'] is r
+    assert isinstance(pc.rx, ComponentArray) and not 'rx' in pc.arrays and pc.array('rx') is pc.rx
+    assert r.data.shape == (10, 3) and r.dtype() == np.float64
+    elements = pc.addElements(12)
+    assert r.data.shape == (pc.capacity, 3)
+    assert r[11].tolist() == [0.0, 1.0, 2.0]
+    r.assign(elements, np.arange(36.0).reshape(12, 3))
+    assert r[1].tolist() == [3.0, 4.0, 5.0]
+    # the components are views
+    assert pc.rx[1] == 3.0 and type(pc.rx[1]) is float
+    pc.rx[1] += 0.5
+    assert r.data[1, 0] == 3.5
+    pc.ry[0:2] = [7.0, 8.0]
+    assert r.data[:2, 1].tolist() == [7.0, 8.0]
+    assert np.asarray(pc.rz)[:3].tolist() == [2.0, 5.0, 8.0]
+    assert pc.recordDtype()['r'].shape == (3,)
+    assert r.pack([2, 0]).tolist() == [[6.0, 7.0, 8.0], [0.0, 7.0, 2.0]]
+    pc.kill([0, 1], reset=True)
+    assert r[1].tolist() == [0.0, 1.0, 2.0]
+    moved = pc.compact()
+    assert r.data.shape == (10, 3) and r[0].tolist() == [6.0, 7.0, 8.0] and moved[2] == 0
+    assert pc.memory()['arrays']['r']['reserved'] == 10 * 24
+    clone = pc.clone(elements=[0, 1])
+    assert isinstance(clone.r, VectorArray) and clone.rx[1] == 9.0 and clone.r.components == ('rx', 'ry', 'rz')
+    unpickled = pickle.loads(pickle.dumps(clone))
+    assert unpickled.rx.pc is unpickled and unpickled.r[1].tolist() == [9.0, 10.0, 11.0]
+    with pytest.raises(RuntimeError):
+        ParticleArray(pc, name='rx')
+    with pytest.raises(ValueError):
+        VectorArray(pc, 'q', components=('qx', 'qy'))
+    pc.removeArray('r')
+    assert not hasattr(pc, 'rx') and not pc.components
+
+
+def test_vector_spheres():
+    """Spheres with VectorArrays behave as Spheres with scalar arrays."""
+    scalar = Spheres(10, name='spheres_scalar')
+    vector = Spheres(10, name='spheres_vector', vectors=True, precision=MIXED_PRECISION)
+    assert vector.v.dtype() == np.float32 and vector.r.dtype() == np.float64
+    for name in ('rx', 'ry', 'rz', 'vz', 'ax'):
+        assert list(vector.array(name)) == list(scalar.array(name))
+    assert vector.vx[0] == float(np.float32(0.1))
+
+
+def test_records():
+    """Records gather all arrays of a set of particles, and scatter them into another container."""
+    spheres = Spheres(5, name='spheres_records', precision=MIXED_PRECISION, vectors=True)
+    spheres.vx[3] = 1 / 3
+    records = spheres.packRecords([3, 1])
+    assert records.dtype == spheres.recordDtype()
+    assert records['id'].tolist() == [3, 1]
+    assert records['r'].tolist() == [[3.5, 0.5, 0.5], [1.5, 0.5, 0.5]]
+    assert records['v'].dtype == np.float32
+    other = spheres.clone(name='spheres_records_other')
+    other.addElement()
+    elements = other.unpackRecords(records)
+    assert elements.tolist() == [1, 2] and other.size == 3
+    assert [other.id[i] for i in elements] == [3, 1]
+    assert other.vx[1] == float(np.float32(1 / 3))
+    assert type(other.id[1]) is int
+    # values that do not fit the dtype of their array
+    ParticleArray(spheres, name='mass', defaultValue=1)
+    spheres.mass[3] = 1.5
+    spheres.packRecords([1])
+    with pytest.raises(ValueError):
+        spheres.packRecords([3])
+
+
 if __name__ == "__main__":
     the_test_you_want_to_debug = test_tag
 
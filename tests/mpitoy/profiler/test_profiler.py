@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.insert(0,'.')
+
+"""Tests for sub-module mpitoy.profiler."""
+
+import time
+
+from mpi4py import MPI
+
+from mpitoy import Spheres
+from mpitoy.simulation import Simulation
+from mpitoy.profiler import Profiler, profiler
+
+
+def test_disabled():
+    p = Profiler()
+    with p.timer('phase'):
+        pass
+    p.count('messages', nbytes=10)
+    p.countObject('messages', [1, 2, 3])
+    assert p.times == {} and p.counters == {}
+
+
+def test_timers_counters():
+    p = Profiler(enabled=True)
+    for k in range(3):
+        with p.timer('sleep'):
+            time.sleep(0.01)
+    p.count('msg', nbytes=100)
+    p.countObject('msg', [1, 2, 3])
+    assert p.times['sleep'][0] >= 0.03
+    assert p.times['sleep'][1] == 3
+    assert p.counters['msg'][0] == 2 and p.counters['msg'][1] > 100
+
+    report = p.report(MPI.COMM_SELF)
+    assert report['times']['sleep']['calls']['max'] == 3
+    seconds = report['times']['sleep']['seconds']
+    assert seconds['min'] == seconds['mean'] == seconds['max']
+    assert report['counters']['msg']['messages']['sum'] == 2
+    assert 'sleep' in Profiler.formatReport(report)
+
+
+def test_instrumented():
+    profiler.reset()
+    profiler.enable()
+    try:
+        sim = Simulation(Spheres(5, name='spheres_profiled'))
+        sim.move(dt=0.1, nTimesteps=3)
+        profiler.tick(MPI.COMM_SELF, every=1)
+    finally:
+        profiler.disable()
+    assert profiler.times['forward_euler'][1] == 1
+    assert profiler.nTicks == 1
+    profiler.reset()
+
+
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_timers_counters
+
+    print("__main__ running", the_test_you_want_to_debug)
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
+
+# eof
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.insert(0,'.')
+
+"""Tests for sub-module mpitoy.query."""
+
+import numpy as np
+import pytest
+from mpi4py import MPI
+
+from mpitoy import Spheres
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.packing import addSpheres
+from mpitoy.query import CellIndex, Box, Sphere, Slab, Nearest, intersects
+
+
+def randomPoints():
+    return np.random.default_rng(1).uniform(0, 10, size=(500, 3))
+
+
+def test_box():
+    points = randomPoints()
+    index = CellIndex(points)
+    lo, hi = np.array([2., 3., 4.]), np.array([5., 5., 9.])
+    expected = np.flatnonzero(np.all((points >= lo) & (points <= hi), axis=1))
+    assert sorted(index.box(lo, hi).tolist()) == expected.tolist()
+    assert len(index.box([20, 20, 20], [30, 30, 30])) == 0
+    assert sorted(index.box([-np.inf] * 3, [np.inf] * 3).tolist()) == list(range(500))
+
+
+def test_sphere():
+    points = randomPoints()
+    index = CellIndex(points, elements=np.arange(500) + 1000, cellSize=0.7)
+    center = np.array([5., 5., 5.])
+    d = np.linalg.norm(points - center, axis=1)
+    elements, distances = index.sphere(center, 2.0)
+    assert sorted(elements.tolist()) == (np.flatnonzero(d <= 2.0) + 1000).tolist()
+    assert np.allclose(distances, d[elements - 1000])
+
+
+def test_slab():
+    points = randomPoints()
+    index = CellIndex(points)
+    d = points @ np.array([1., 1., 0.]) / np.sqrt(2) - np.sqrt(2) * 5
+    assert sorted(index.slab([5, 5, 0], np.array([1., 1., 0.]) / np.sqrt(2), 0.5).tolist()) == np.flatnonzero(np.abs(d) <= 0.5).tolist()
+
+
+def test_nearest():
+    points = randomPoints()
+    index = CellIndex(points)
+    for center in ([5, 5, 5], [-20, 3, 3]):
+        d = np.linalg.norm(points - center, axis=1)
+        elements, distances = index.nearest(center, 7)
+        assert elements.tolist() == np.argsort(d, kind='stable')[:7].tolist()
+        assert np.all(np.diff(distances) >= 0)
+    assert len(index.nearest([5, 5, 5], 1000)[0]) == 500
+    assert len(CellIndex(np.empty((0, 3))).nearest([0, 0, 0], 3)[0]) == 0
+
+
+def test_intersects():
+    region = [(np.array([5., 0, 0]), np.array([1., 0, 0])), (np.array([10., 0, 0]), np.array([-1., 0, 0]))]
+    assert intersects(Box([0, 0, 0], [5, 1, 1]), region)
+    assert not intersects(Box([0, 0, 0], [4.9, 1, 1]), region)
+    assert intersects(Sphere([4, 0, 0], 1.0), region) and not intersects(Sphere([4, 0, 0], 0.5), region)
+    assert intersects(Slab([0, 0, 0], [0, 1, 0], 0.1), region)
+    assert not intersects(Slab([2, 0, 0], [-1, 0, 0], 1.0), region)
+    assert intersects(Nearest([7, 0, 0], 3), region) and not intersects(Nearest([11, 0, 0], 3), region)
+    assert intersects(Box([100, 0, 0], [101, 0, 0]), [])
+
+
+def test_domain_query():
+    """On a single rank, the queries are answered locally."""
+    spheres = Spheres(10, name='spheres_query', vectors=True)
+    domain = ParallelSlabs(points=[], n=[1, 0, 0]).constructDomain(MPI.COMM_SELF, [spheres])
+    result = domain.queryBox(spheres, [2, 0, 0], [6, 1, 1], arrays=['id'])
+    assert sorted(result['records']['id'].tolist()) == [2, 3, 4, 5] and result['distances'] is None
+    result = domain.queryNearest(spheres, [4.2, 0.5, 0.5], 3)
+    assert result['records']['id'].tolist() == [4, 3, 5]
+    assert result['distances'] == pytest.approx([0.3, 0.7, 1.3])
+    assert result['ranks'].tolist() == [0, 0, 0]
+    assert domain.querySphere(spheres) is None
+
+
+def test_domain_query_periodic():
+    """The nearest particle may be found through another image of the centre on the same rank."""
+    spheres = Spheres(0, name='spheres_query_periodic')
+    addSpheres(spheres, [[0.2, 0.5, 0.5], [8.0, 0.5, 0.5]], ids=[1, 2], radius=0.5)
+    domain = ParallelSlabs(points=[[10, 0, 0]], n=[1, 0, 0], period=10).constructDomain(MPI.COMM_SELF, [spheres])
+    result = domain.queryNearest(spheres, [9.9, 0.5, 0.5], 1)
+    assert result['records']['id'].tolist() == [1]
+    assert result['distances'] == pytest.approx([0.3])
+    # a particle found through both images is returned once
+    result = domain.queryNearest(spheres, [9.9, 0.5, 0.5], 3)
+    assert result['records']['id'].tolist() == [1, 2]
+    assert result['distances'] == pytest.approx([0.3, 1.9])
+
+
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_domain_query
+
+    print("__main__ running", the_test_you_want_to_debug)
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
+
+# eof
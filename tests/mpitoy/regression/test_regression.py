@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.insert(0,'.')
+
+"""Tests for sub-module mpitoy.regression."""
+
+import pytest
+
+from mpitoy import benchmark
+from mpitoy.regression import relativeNoise, compare, regressions, failures, formatComparison
+from mpitoy.regression.__main__ import main
+
+
+def results(nRanks=1, **benchmarks):
+    return { 'meta': {'nRanks': nRanks}
+           , 'benchmarks': {name: {'group': name, 'params': {}, 'work': 1, 'unit': 'particles', 'seconds': seconds}
+                            for name, seconds in benchmarks.items()}
+           }
+
+
+def test_relativeNoise():
+    assert relativeNoise([1.0]) == 0.0
+    assert relativeNoise([1.0, 1.0, 1.0]) == 0.0
+    # a single outlier does not affect the estimate
+    assert relativeNoise([1.0, 1.0, 1.0, 1.0, 100.0]) == 0.0
+    assert relativeNoise([0.9, 1.0, 1.1]) == pytest.approx(0.14826)
+
+
+def test_compare():
+    baseline = results(a=[1.0, 1.01, 0.99], b=[1.0, 1.01, 0.99], c=[1.0, 1.01, 0.99], d=[1.0])
+    current = results(a=[2.0, 2.02, 1.98], b=[1.05, 1.04, 1.06], c=[0.5, 0.51, 0.49], e=[1.0])
+    rows = {row['name']: row for row in compare(baseline, current)}
+    assert rows['a']['status'] == 'slower'
+    assert rows['a']['ratio'] == pytest.approx(2.0)
+    assert rows['b']['status'] == 'unchanged'
+    assert rows['c']['status'] == 'faster'
+    assert rows['d']['status'] == 'missing'
+    assert rows['e']['status'] == 'new'
+    assert [row['name'] for row in regressions(rows.values())] == ['a']
+    assert [row['name'] for row in failures(rows.values())] == ['a', 'd']
+    assert [row['name'] for row in failures(rows.values(), allowMissing=True)] == ['a']
+    assert '1 regression, 1 missing.' in formatComparison(list(rows.values()))
+    assert [row['name'] for row in compare(baseline, current, patterns=['[bc]'])] == ['b', 'c']
+
+
+def test_compare_noise():
+    """A change within the noise of the samples is not a regression."""
+    baseline = results(a=[1.0, 0.7, 1.3, 1.0, 0.8])
+    current = results(a=[1.3, 1.0, 1.6, 1.2, 1.5])
+    row = compare(baseline, current)[0]
+    assert row['ratio'] == pytest.approx(1.3)
+    assert row['tolerance'] > 0.3
+    assert row['status'] == 'unchanged'
+    assert compare(baseline, current, nSigma=0.0)[0]['status'] == 'slower'
+
+
+def test_compare_nRanks():
+    with pytest.raises(ValueError):
+        compare(results(nRanks=1, a=[1.0]), results(nRanks=2, a=[1.0]))
+
+
+def test_main(tmp_path):
+    files = {}
+    for label, seconds in (('baseline', [1.0, 1.0]), ('same', [1.0, 1.0]), ('slow', [2.0, 2.0])):
+        files[label] = str(tmp_path / f'{label}.json')
+        benchmark.save(results(a=seconds), files[label])
+    assert main([files['baseline'], files['same']]) == 0
+    assert main([files['baseline'], files['slow']]) == 1
+    # a benchmark missing from the current results fails, unless allowed
+    files['missing'] = str(tmp_path / 'missing.json')
+    benchmark.save(results(b=[1.0, 1.0]), files['missing'])
+    assert main([files['baseline'], files['missing']]) == 1
+    assert main([files['baseline'], files['missing'], '--allow-missing']) == 0
+    benchmark.save(results(nRanks=3, a=[1.0]), files['baseline'])
+    assert main([files['baseline'], files['same']]) == 2
+
+
+def test_main_run(tmp_path):
+    """Without a second file, the benchmarks of the baseline are run again."""
+    baseline = str(tmp_path / 'baseline.json')
+    current = str(tmp_path / 'current.json')
+    benchmark.save(benchmark.run(repeat=2, scale=0.01, groups=['forward_euler']), baseline)
+    assert main([baseline, '--output', current, '--threshold', '100']) == 0
+    assert list(benchmark.load(current)['benchmarks']) == ['forward_euler[n=10]', 'forward_euler[n=100]']
+
+
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_compare
+
+    print("__main__ running", the_test_you_want_to_debug)
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
+
+# eof
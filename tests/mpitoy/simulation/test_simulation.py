@@ -28,6 +28,68 @@ def test_move():
     assert sim.t == dt*nTimesteps
 
 
+def test_move_walls():
+    from mpitoy.domaindecomposition import BoundaryPlane
+    pc = Spheres(2)
+    pc.vx[0] = -1.0
+    walls = [ BoundaryPlane(p=[0, 0, 0], n=[1, 0, 0], kind='reflective')
+            , BoundaryPlane(p=[1.51, 0, 0], n=[-1, 0, 0], kind='absorbing') ]
+    sim = Simulation(pc, domainBoundaries=walls)
+    sim.move(dt=0.1, nTimesteps=2)
+    assert pc.vx[0] == 1.0
+    assert pc.size == 1
+
+
+def test_stableTimestep():
+    pc = Spheres(2)
+    sim = Simulation(pc)
+    # 0.1 * radius / vmax
+    assert sim.stableTimestep() == pytest.approx(0.5)
+    assert sim.stableTimestep(dtMax=0.2) == 0.2
+    sim.ghostSkin = 0.1
+    assert sim.stableTimestep() == pytest.approx(0.1)
+    sim.ghostSkin = None
+    pc.ax[1] = 1.0
+    dt = sim.stableTimestep()
+    assert (0.1 + 1.0 * dt) * dt == pytest.approx(0.05)
+
+
+def test_move_adaptive():
+    pc = Spheres(1)
+    sim = Simulation(pc)
+    rx0 = pc.rx[0]
+    sim.move(dt=1.0, nTimesteps=4, adaptive=True)
+    assert sim.dt == pytest.approx(0.5)
+    assert sim.t == pytest.approx(2.0)
+    assert pc.rx[0] == pytest.approx(rx0 + 0.2)
+
+
+def test_multipleTimestep():
+    pc0 = Spheres(2, name='slow')
+    pc1 = Spheres(2, name='fast')
+    for pc in (pc0, pc1):
+        pc.ax[0] = 1.0
+    sim = Simulation(pc0)
+    sim.pcs.append(pc1)
+    sim.setMultipleTimestepping(ratio=4)
+    sim.setLevel(pc1, 1)
+    evaluations = {'slow': 0, 'fast': 0}
+    def force(pc, elements):
+        evaluations[pc.name] += 1
+        return np.zeros((len(elements), 3))
+    sim.addForce(force, level=1)
+    sim.move(dt=0.1, nTimesteps=2)
+    assert sim.t == pytest.approx(0.2)
+    # the fast force is evaluated every sub-cycle for the fast particles only
+    assert evaluations == {'slow': 2, 'fast': 8}
+    # level 0 is forward euler with dt, level 1 with dt/4
+    assert pc0.vx[0] == pytest.approx(0.3)
+    assert pc0.rx[0] == pytest.approx(0.5 + 0.2*0.1 + 0.3*0.1)
+    assert pc1.vx[0] == pytest.approx(0.3)
+    assert pc1.rx[0] == pytest.approx(0.5 + sum(0.1 + 0.025*k for k in range(1, 9)) * 0.025)
+    assert pc1.rx[1] == pytest.approx(1.5 + 0.02)
+
+
 def test_plot():
     n = 5
     pc = Spheres(n)
@@ -45,6 +107,42 @@ def test_plot_twice():
     sim.plot(save=True)
 
 
+def test_integrators_consistent():
+    # the single and the multiple timestepping paths integrate all three dimensions
+    sims = []
+    for k in range(2):
+        pc = Spheres(3, name=f'spheres_consistent{k}')
+        for i in range(3):
+            pc.vz[i] = 0.2
+            pc.az[i] = -1.0
+            pc.ay[i] = 0.5
+        sim = Simulation(pc)
+        if k:
+            sim.setMultipleTimestepping(1)
+            sim.addForce(lambda pc, elements: np.zeros((len(elements), 3)))
+        sim.move(dt=0.1, nTimesteps=5)
+        sims.append(pc)
+    for name in ('rx', 'ry', 'rz', 'vx', 'vy', 'vz'):
+        assert sims[0].arrays[name][:3] == pytest.approx(sims[1].arrays[name][:3])
+    assert sims[0].rz[0] != 0.5
+
+
+def test_plot_batch():
+    n = 5
+    pc = Spheres(n)
+    sim = Simulation(pc, name='test_plot_batch')
+    sim.plot(xbound=(0,10), ybound=(0,1), batch=True)
+    fig, ax, collection = sim.batchPlot
+    assert len(collection.get_offsets()) == n
+    pc.kill(0)
+    sim.move(dt=1)
+    sim.plot(batch=True, save=True)
+    # the figure is reused
+    assert sim.batchPlot[0] is fig
+    assert len(collection.get_offsets()) == n - 1
+    assert collection.get_offsets()[0][0] == pytest.approx(1.6)
+
+
 def test_plot_show():
     n = 5
     pc = Spheres(n)
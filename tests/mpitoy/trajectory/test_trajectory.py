@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.insert(0,'.')
+
+"""Tests for sub-module mpitoy.trajectory."""
+
+import numpy as np
+import pytest
+
+from mpitoy import Spheres
+from mpitoy.simulation import Simulation
+from mpitoy.trajectory import TrajectoryWriter, TrajectoryReader
+
+
+def test_write_read(tmp_path):
+    filename = str(tmp_path / 'trajectory.bin')
+    spheres = Spheres(5, name='spheres_traj')
+    sim = Simulation(spheres)
+    writer = TrajectoryWriter(filename, velocities=True, bufferSize=100)
+    for it in range(4):
+        writer.write(sim)
+        sim.move(dt=1.0)
+        if it == 1:
+            spheres.kill(2)
+    writer.close()
+
+    reader = TrajectoryReader(filename)
+    assert len(reader) == 4
+    assert reader.time(3) == 3.0
+    assert reader.arrays == ['id', 'rx', 'ry', 'rz', 'vx', 'vy', 'vz']
+    frame = reader.frame(0)
+    assert frame['id'].tolist() == [0, 1, 2, 3, 4]
+    assert frame['rx'].tolist() == [0.5, 1.5, 2.5, 3.5, 4.5]
+    frame = reader.frame(3)
+    assert frame['id'].tolist() == [0, 1, 3, 4]
+    assert frame['vx'][0] == 0.1
+
+    t, rx = reader.history(2, 'rx')
+    assert t.tolist() == [0, 1, 2, 3]
+    assert rx[:2] == pytest.approx([2.5, 2.6])
+    assert np.isnan(rx[2:]).all()
+
+
+def test_history_sorted(tmp_path):
+    filename = str(tmp_path / 'sorted.bin')
+    spheres = Spheres(4, name='spheres_traj_sorted')
+    sim = Simulation(spheres)
+    writer = TrajectoryWriter(filename)
+    writer.write(sim)
+    # reuse element 0 for a particle with a larger id
+    spheres.kill(0)
+    i = spheres.addElement()
+    spheres.id[i] = 10
+    spheres.rx[i] = -1.0
+    spheres.id[3] = 1
+    spheres.id[1] = 3
+    writer.write(sim)
+    writer.close()
+
+    reader = TrajectoryReader(filename)
+    assert reader.sortedById
+    assert reader.frame(1)['id'].tolist() == [1, 2, 3, 10]
+    assert reader.frame(1)['rx'].tolist() == [3.5, 2.5, 1.5, -1.0]
+    t, rx = reader.history(10, 'rx')
+    assert np.isnan(rx[0]) and rx[1] == -1.0
+    t, rx = reader.history(7, 'rx')
+    assert np.isnan(rx).all()
+
+
+def test_empty(tmp_path):
+    filename = str(tmp_path / 'empty.bin')
+    TrajectoryWriter(filename).close()
+    assert len(TrajectoryReader(filename)) == 0
+
+
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_write_read
+
+    print("__main__ running", the_test_you_want_to_debug)
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
+
+# eof
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.insert(0,'.')
+
+"""Tests for sub-module mpitoy.viz."""
+
+import subprocess
+
+import numpy as np
+
+from mpitoy.simulation import setColors, colors
+
+
+def test_no_matplotlib_on_import():
+    # importing the compute modules must not import matplotlib
+    code = ( "import sys; import mpitoy, mpitoy.simulation, mpitoy.output, mpitoy.trajectory, mpitoy.checkpoint; "
+             "from mpitoy.simulation import setColors; setColors(5); "
+             "assert not [m for m in sys.modules if m.startswith('matplotlib')]" )
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_colors():
+    setColors(4)
+    table = colors()
+    assert table.shape == (4, 4)
+    assert colors() is table # computed once
+    import mpitoy.simulation
+    assert mpitoy.simulation.COLORS is table
+
+
+def test_idColors():
+    from mpitoy.viz import idColors
+    hashed = idColors([0, 1, 2**40])
+    assert hashed.shape == (3, 4)
+    assert not np.allclose(hashed[0], hashed[1])
+    # a table is used when all ids are in its range
+    table = np.arange(8.0).reshape(2, 4)
+    assert idColors([1, 0], table).tolist() == [table[1].tolist(), table[0].tolist()]
+    assert idColors([0, 5], table).shape == (2, 4)
+
+
+if __name__ == "__main__":
+    the_test_you_want_to_debug = test_no_matplotlib_on_import
+
+    print("__main__ running", the_test_you_want_to_debug)
+    the_test_you_want_to_debug()
+    print('-*# finished #*-')
+
+# eof
@@ -0,0 +1,30 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.simulation import Simulation
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """All ranks must use the same timestep, limited by the fastest particle of all ranks."""
+    spheres = Spheres(3)
+    spheres.vx[1] = 0.1 * (comm.rank + 1)
+    sim = Simulation(spheres, comm=comm)
+    dt = sim.stableTimestep()
+    mprint(f'{dt=}')
+    assert dt == pytest.approx(0.1 * 0.5 / (0.1 * comm.size))
+    sim.move(dt=1.0, nTimesteps=2, adaptive=True)
+    t = comm.allgather(sim.t)
+    assert t == comm.size * [t[0]]
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
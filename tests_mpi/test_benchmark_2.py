@@ -0,0 +1,26 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.benchmark import run
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """The parallel benchmarks run, and all ranks obtain the same results."""
+    results = run(comm, repeat=2, scale=0.02, groups=['pcsendrecv', 'simulation'])
+    benchmarks = results['benchmarks']
+    assert benchmarks['pcsendrecv[halo=20]']['bytes'] > 0
+    assert 'simulation.weak[nPerRank=16]' in benchmarks
+    assert results['meta']['nRanks'] == comm.size
+    assert comm.allgather(benchmarks) == comm.size * [benchmarks]
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
@@ -0,0 +1,83 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+def ids(pc):
+    return sorted(pc.id[i] for i in range(pc.capacity) if pc.alive[i])
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """Channels of several containers, set up in a single exchange."""
+    assert comm.size == 2
+    slabs = ParallelSlabs(points=[[5, 0, 0]], n=[1, 0, 0])
+    spheres = Spheres(5, name='spheres_channels', id0=5 * comm.rank)
+    others = Spheres(3, name='others_channels', id0=100 + 3 * comm.rank)
+    domain = slabs.constructDomain(comm, [spheres, others])
+    # rank 0 sends 2 spheres, rank 1 sends 1
+    domain.addChannel(spheres, [[3, 4] if comm.rank == 0 else [0]])
+    domain.addChannel(others, [[0]], arrays=['id', 'rx'])
+    channels = domain.setupChannels()
+    assert len(channels) == 2 and len(channels[0]) == 1
+    # the receiving elements are allocated by the setup
+    assert spheres.size == (6 if comm.rank == 0 else 7)
+    for pcChannels in channels:
+        for channel in pcChannels:
+            channel()
+    if comm.rank == 0:
+        assert ids(spheres) == [0, 1, 2, 3, 4, 5]
+        assert ids(others) == [100, 101, 102, 103]
+    else:
+        assert ids(spheres) == [3, 4, 5, 6, 7, 8, 9]
+        assert ids(others) == [100, 103, 104, 105]
+    assert len(channels[1][0].asrs) == 2
+    domain.free()
+
+
+@pytest.mark.mpi(min_size=2)
+def test_periodic():
+    """Two ranks sharing two planes: the channels are paired by plane."""
+    assert comm.size == 2
+    slabs = ParallelSlabs(points=[[5, 0, 0], [10, 0, 0]], n=[1, 0, 0], period=10)
+    spheres = Spheres(5, name='spheres_channels_periodic', id0=5 * comm.rank)
+    domain = slabs.constructDomain(comm, [spheres])
+    # every rank sends element 0 across its first plane, element 4 across the second one
+    domain.addChannel(spheres, [[0], [4]], arrays=['id'])
+    channels = domain.setupChannels()
+    for channel in channels[0]:
+        channel()
+    # the first planes of both ranks are at x=5, the second ones are the wrap plane
+    received = [channel.elements_recv for channel in channels[0]]
+    got = [[spheres.id[i] for i in elements] for elements in received]
+    other = 5 * (1 - comm.rank)
+    assert got == [[other + 0], [other + 4]]
+    domain.free()
+
+
+@pytest.mark.mpi(min_size=2)
+def test_mismatch():
+    """Channels that do not match between neighbours raise on both ranks, instead of deadlocking."""
+    assert comm.size == 2
+    slabs = ParallelSlabs(points=[[5, 0, 0]], n=[1, 0, 0])
+    spheres = Spheres(5, name='spheres_channels_mismatch')
+    domain = slabs.constructDomain(comm, [spheres])
+    domain.addChannel(spheres, [[0]], arrays=['id'] if comm.rank == 0 else ['id', 'rx'])
+    with pytest.raises(RuntimeError):
+        domain.setupChannels()
+    domain.free()
+
+
+if __name__ == "__main__":
+    test()
+    test_periodic()
+    test_mismatch()
+    mprint('-*# finished #*-')
@@ -0,0 +1,75 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.simulation import Simulation
+from mpitoy.checkpoint import writeCheckpoint, readCheckpoint, readHeader
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """Write a checkpoint on 2 ranks, restart on 2 ranks and on 1 rank."""
+    assert comm.size == 2
+    filename = 'test_checkpoint_2.bin'
+    slabs = ParallelSlabs(points=[[5, 0, 0]], n=[1, 0, 0])
+    n = 5
+    spheres = Spheres(n, name='spheres_cp', id0=n * comm.rank)
+    for i in range(n):
+        spheres.rx[i] += 5 * comm.rank
+    if comm.rank == 1:
+        spheres.kill(0)
+    sim = Simulation(spheres, domainBoundaries=slabs.decompose(comm), comm=comm)
+    sim.t = 1.5
+    writeCheckpoint(filename, sim, comm=comm)
+
+    # restart with the same number of ranks, particles must return to their owner
+    restored = Spheres(0, name='spheres_cp')
+    sim2 = Simulation(restored, comm=comm)
+    header = readCheckpoint(filename, sim2, comm=comm, decomposition=slabs)
+    assert sim2.t == 1.5
+    assert len(header['boundaryPlanes']) == 2
+    ids = sorted(restored.id[i] for i in range(restored.capacity) if restored.alive[i])
+    assert ids == ([0, 1, 2, 3, 4] if comm.rank == 0 else [6, 7, 8, 9])
+
+    # restart on a single rank
+    single = comm.Split(color=comm.rank, key=0)
+    if comm.rank == 0:
+        restored = Spheres(0, name='spheres_cp')
+        sim3 = Simulation(restored, comm=single)
+        readCheckpoint(filename, sim3, comm=single, decomposition=slabs)
+        ids = sorted(restored.id[i] for i in range(restored.capacity) if restored.alive[i])
+        assert ids == [0, 1, 2, 3, 4, 6, 7, 8, 9]
+    single.Free()
+    comm.Barrier()
+    if comm.rank == 0:
+        MPI.File.Delete(filename)
+
+
+@pytest.mark.mpi(min_size=2)
+def test_bad_header():
+    """All ranks raise, not only rank 0."""
+    filename = 'test_checkpoint_bad_2.bin'
+    if comm.rank == 0:
+        with open(filename, 'wb') as f:
+            f.write(b'not a checkpoint')
+    comm.Barrier()
+    with pytest.raises(RuntimeError):
+        readHeader(filename, comm)
+    with pytest.raises(RuntimeError):
+        readHeader('does_not_exist.bin', comm)
+    comm.Barrier()
+    if comm.rank == 0:
+        MPI.File.Delete(filename)
+
+
+if __name__ == "__main__":
+    test()
+    test_bad_header()
+    mprint('-*# finished #*-')
@@ -0,0 +1,52 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.simulation import Simulation
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+@pytest.mark.parametrize('exchangeMode,sync', [('p2p', 'fence'), ('rma', 'fence'), ('rma', 'pscw')])
+def test(exchangeMode, sync):
+    """Refresh the positions of the ghost particles with two-sided and one-sided communication."""
+    assert comm.size == 2
+    n = 5
+    spheres = Spheres(n, name=f'spheres_{exchangeMode}_{sync}', id0=n * comm.rank)
+    for i in range(n):
+        spheres.rx[i] += 5 * comm.rank
+
+    slabs = ParallelSlabs(points=[[5, 0, 0]], n=[1, 0, 0])
+    domain = slabs.constructDomain(comm, [spheres], exchangeMode=exchangeMode, sync=sync)
+    if exchangeMode == 'rma':
+        # the windows are sized by exchange(), not by a refresh
+        with pytest.raises(RuntimeError):
+            domain.refreshGhostPositions()
+    domain.exchange(ghostWidth=1.0)
+    windows = {name: window.win for name, window in domain.ghostWindows.items()}
+    bp = domain.boundaryPlanes[0]
+    ghosts = bp.ghostPCs[spheres.name]
+    assert ghosts.size == 1
+    expected_id = 5 if comm.rank == 0 else 4
+    assert ghosts.id[0] == expected_id
+
+    sim = Simulation(spheres)
+    for it in range(3):
+        sim.move(dt=0.2)
+        domain.refreshGhostPositions()
+        expected_rx = (5.5 if comm.rank == 0 else 4.5) + 0.1 * 0.2 * (it + 1)
+        mprint(f'{exchangeMode=}, {ghosts.rx[0]=}, {expected_rx=}')
+        assert ghosts.rx[0] == pytest.approx(expected_rx)
+    assert all(domain.ghostWindows[name].win is win for name, win in windows.items())
+    domain.free()
+
+
+if __name__ == "__main__":
+    test('rma', 'fence')
+    mprint('-*# finished #*-')
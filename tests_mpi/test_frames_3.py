@@ -0,0 +1,57 @@
+import os
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.simulation import setColors, Simulation
+from mpitoy.output import FrameWriter
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=3)
+def test():
+    """Every rank owns a slab with 5 particles, the frames show all 15 particles."""
+    n = 5
+    N = n * comm.size
+    setColors(N)
+    slabs = ParallelSlabs([[n * (r + 1), 0, 0] for r in range(comm.size - 1)], n=[1, 0, 0])
+    spheres = Spheres(n, name='spheres_frames', id0=n * comm.rank)
+    for i in range(n):
+        spheres.rx[i] += n * comm.rank
+    sim = Simulation(spheres, name='frames', domainBoundaries=slabs.decompose(comm), comm=comm)
+
+    directory = 'test_frames_3'
+    frames = FrameWriter(directory, comm=comm, nWriters=2, boundaryPlanes=sim.domainBoundaries, xbound=(0, N), ybound=(0, 1))
+    assert frames.writers == [0, 1]
+    assert len(frames.planes) == comm.size - 1
+
+    records = frames.gather(sim, root=2)
+    if comm.rank == 2:
+        assert sorted(records['id'].tolist()) == list(range(N))
+    else:
+        assert records is None
+
+    for k in range(4):
+        frames.write(sim)
+        sim.move(dt=0.4)
+    frames.close()
+    if comm.rank == 0:
+        assert sorted(os.listdir(directory)) == [f'frame_{k:05d}.png' for k in range(4)]
+    frames.movie(directory + '.gif', fps=2)
+    if comm.rank == 0:
+        assert os.path.getsize(directory + '.gif') > 0
+        for k in range(4):
+            os.remove(frames.frameFilename(k))
+        os.rmdir(directory)
+        os.remove(directory + '.gif')
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
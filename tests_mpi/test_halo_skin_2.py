@@ -0,0 +1,52 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.simulation import Simulation
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """The halo is only rebuilt when the displacement exceeds half the skin."""
+    assert comm.size == 2
+    n = 5
+    spheres = Spheres(n, name='spheres_skin', id0=n * comm.rank)
+    for i in range(n):
+        spheres.rx[i] += 5 * comm.rank
+    slabs = ParallelSlabs(points=[[5, 0, 0]], n=[1, 0, 0])
+    domain = slabs.constructDomain(comm, [spheres])
+    sim = Simulation(spheres, comm=comm)
+    cutoff, skin = 1.0, 0.5
+    sim.setHaloExchange(domain, cutoff=cutoff, skin=skin)
+    assert sim.nRebuilds == 1
+
+    # vx = 0.1, so the displacement is 0.05 per timestep, and the halo is rebuilt every 6 timesteps
+    sim.move(dt=0.5, nTimesteps=12)
+    assert sim.nRebuilds == 3
+    assert sim.nRefreshes == 10
+
+    # the ghost particles must be at the position of their owner, and contain all particles within cutoff
+    owned = {}
+    for positions in comm.allgather({spheres.id[i]: spheres.rx[i] for i in range(spheres.capacity) if spheres.alive[i]}):
+        owned.update(positions)
+    bp = domain.boundaryPlanes[0]
+    ghosts = bp.ghostPCs[spheres.name]
+    ghost_rx = {ghosts.id[i]: ghosts.rx[i] for i in range(ghosts.capacity) if ghosts.alive[i]}
+    for id, rx in ghost_rx.items():
+        assert rx == pytest.approx(owned[id])
+    mine = [spheres.id[i] for i in range(spheres.capacity) if spheres.alive[i]]
+    for id, rx in owned.items():
+        if not id in mine and abs(rx - 5) < cutoff:
+            assert id in ghost_rx
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
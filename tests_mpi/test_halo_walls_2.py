@@ -0,0 +1,57 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.domaindecomposition import ParallelSlabs, BoundaryPlane
+from mpitoy.simulation import Simulation
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+def test_comm_from_domain():
+    """Without comm, the simulation reduces the rebuild decisions over the domain's communicator."""
+    assert comm.size == 2
+    spheres = Spheres(5, name='spheres_halo_comm', id0=5 * comm.rank)
+    for i in range(5):
+        spheres.rx[i] += 5 * comm.rank
+        spheres.vx[i] = 0.01 if comm.rank == 0 else 0.1 # only rank 1 needs frequent rebuilds
+    domain = ParallelSlabs(points=[[5, 0, 0]], n=[1, 0, 0]).constructDomain(comm, [spheres])
+    sim = Simulation(spheres)
+    sim.setHaloExchange(domain, cutoff=1.0, skin=0.5)
+    assert sim.comm is domain.comm
+    sim.move(dt=0.5, nTimesteps=12)
+    assert comm.allgather(sim.nRebuilds) == [3, 3]
+    domain.free()
+
+
+@pytest.mark.mpi(min_size=2)
+def test_inflow():
+    """Particles injected far from the neighbours do not force a rebuild of the halo."""
+    assert comm.size == 2
+    inflow = BoundaryPlane(p=[0, 0, 0], n=[1, 0, 0], kind='inflow', rate=10, velocity=[0.1, 0, 0], id0=1000)
+    slabs = ParallelSlabs(points=[[5, 0, 0]], n=[1, 0, 0], lowerWall=inflow)
+    spheres = Spheres(5, name='spheres_halo_inflow', id0=5 * comm.rank)
+    for i in range(5):
+        spheres.rx[i] += 5 * comm.rank
+    domain = slabs.constructDomain(comm, [spheres])
+    sim = Simulation(spheres, domainBoundaries=domain.boundaryPlanes, comm=comm)
+    sim.setHaloExchange(domain, cutoff=1.0, skin=0.5)
+    sim.move(dt=0.1, nTimesteps=10) # one particle injected per timestep on rank 0
+    assert spheres.size == (15 if comm.rank == 0 else 5)
+    assert sim.nRebuilds == 1 and sim.nRefreshes == 10
+    # a particle injected within the ghost width of the neighbour plane does
+    for wall in domain.walls:
+        wall.positions = lambda k: [[4.5, 0.5, 0.5]] * k
+    sim.move(dt=0.1)
+    assert sim.nRebuilds == 2
+    domain.free()
+
+
+if __name__ == "__main__":
+    test_inflow()
+    mprint('-*# finished #*-')
@@ -0,0 +1,40 @@
+import sys
+sys.path.insert(0,'.')
+
+import numpy as np
+
+from mpitoy.idallocator import IdAllocator
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=3)
+def test():
+    """Collective and local allocations on all ranks never produce the same id twice."""
+    allocator = IdAllocator(comm=comm)
+    n = comm.rank + 1 # different counts on every rank
+    spheres = Spheres(n, name='spheres_ids', allocator=allocator)
+    ids = [np.array(spheres.id[:n], dtype=np.int64)]
+    # ranks are contiguous and in rank order
+    assert ids[0][0] == comm.rank * (comm.rank + 1) // 2
+
+    # mid-run injection by some of the ranks only
+    if comm.rank != 1:
+        ids.append(allocator.allocateLocal(2 * comm.rank + 1))
+    ids.append(allocator.allocate(2))
+    ids.append(allocator.allocateLocal(1))
+
+    allIds = np.concatenate(comm.allgather(np.concatenate(ids)))
+    assert len(np.unique(allIds)) == len(allIds)
+    assert allIds.dtype == np.int64
+    assert comm.allgather(int(allocator.next)) == comm.size * [int(allocator.next)]
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
@@ -0,0 +1,31 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """The id index follows the particles that migrate to the neighbouring domain."""
+    slabs = ParallelSlabs([[4, 0, 0]], n=[1, 0, 0])
+    planes = slabs.decompose(comm)
+    spheres = Spheres(5 if comm.rank == 0 else 0, name='spheres_idindex')
+    spheres.indexIds()
+    for bp in planes:
+        bp.findLeavingParticles(spheres, comm=comm)
+    if comm.rank == 0:
+        assert spheres.lookup([0, 3, 4]).tolist() == [0, 3, -1]
+    else:
+        assert spheres.lookup([4, 0]).tolist() == [0, -1]
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
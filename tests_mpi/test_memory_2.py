@@ -0,0 +1,69 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.simulation import Simulation
+from mpitoy import Spheres, memory
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+def alive(pc):
+    return {pc.id[i]: pc.rx[i] for i in range(pc.capacity) if pc.alive[i]}
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """A rank that sent away a burst of particles is compacted when the halo is rebuilt."""
+    assert comm.size == 2
+    n = 100 if comm.rank == 0 else 5
+    spheres = Spheres(n, name='spheres_burst', id0=1000 * comm.rank)
+    for i in range(n):
+        spheres.rx[i] = 0.5 + i % 4 + 5 * comm.rank
+    slabs = ParallelSlabs(points=[[5, 0, 0]], n=[1, 0, 0])
+    domain = slabs.constructDomain(comm, [spheres])
+    sim = Simulation(spheres, comm=comm)
+    sim.setHaloExchange(domain, cutoff=1.0, skin=0.6)
+    if comm.rank == 0:
+        # the burst leaves
+        for i in range(10, n):
+            spheres.rx[i] += 5
+    sim.rebuildHalo()
+    report = sim.memoryReport()
+    entry = report['containers']['spheres_burst']
+    assert entry['size']['sum'] == 105
+    assert entry['size']['min'] == 10
+    assert entry['liveFraction']['min'] < 0.2
+    assert report['total']['reserved']['sum'] >= report['total']['used']['sum']
+
+    before = {}
+    for positions in comm.allgather(alive(spheres)):
+        before.update(positions)
+    limit = memory.reservedBytes([spheres]) - 1 if comm.rank == 0 else 10**9
+    memory.setBudget(limit)
+    try:
+        sim.rebuildHalo()
+    finally:
+        memory.setBudget(None)
+    after = {}
+    for positions in comm.allgather(alive(spheres)):
+        after.update(positions)
+    assert after == before
+    if comm.rank == 0:
+        assert spheres.capacity == 10
+        assert spheres.peakCapacity >= 100
+    # the ghost particles are at the position of their owner
+    ghosts = domain.boundaryPlanes[0].ghostPCs[spheres.name]
+    assert ghosts.size > 0
+    for id, rx in alive(ghosts).items():
+        assert rx == pytest.approx(after[id])
+    domain.free()
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
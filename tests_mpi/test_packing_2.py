@@ -0,0 +1,43 @@
+import sys
+sys.path.insert(0,'.')
+
+import numpy as np
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.packing import cubicLattice, randomPacking, addSpheres
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """Every rank generates only its own slab, together they make up the serial packing."""
+    lower, upper = [0, 0, 0], [10, 5, 5]
+    # the planes do not coincide with lattice planes or cell boundaries
+    slabs = ParallelSlabs([[10 * (r + 1) / comm.size + 0.3, 0, 0] for r in range(comm.size - 1)], n=[1, 0, 0])
+    planes = slabs.decompose(comm)
+
+    for generate in ( lambda bps: cubicLattice(1.0, lower, upper, boundaryPlanes=bps)
+                    , lambda bps: randomPacking(0.5, lower, upper, fraction=0.5, seed=7, boundaryPlanes=bps) ):
+        positions, ids = generate(planes)
+        assert np.all(slabs.ownerRank(positions, comm.size) == comm.rank)
+        allIds = np.concatenate(comm.allgather(ids))
+        allPositions = np.concatenate(comm.allgather(positions))
+        serialPositions, serialIds = generate(None)
+        order, serialOrder = np.argsort(allIds), np.argsort(serialIds)
+        assert np.array_equal(allIds[order], serialIds[serialOrder])
+        assert np.array_equal(allPositions[order], serialPositions[serialOrder])
+
+    spheres = Spheres(0, name='spheres_packing')
+    addSpheres(spheres, positions, ids, radius=0.5)
+    assert comm.allreduce(spheres.size) == len(serialIds)
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
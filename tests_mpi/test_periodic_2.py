@@ -0,0 +1,51 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """Particles and ghosts crossing the wrap plane of a periodic decomposition."""
+    assert comm.size == 2
+    # rank 0 = [0,5], rank 1 = [5,10], wrap plane at 10
+    slabs = ParallelSlabs(points=[[5, 0, 0], [10, 0, 0]], n=[1, 0, 0], period=10)
+    spheres = Spheres(5, id0=5 * comm.rank)
+    for i in range(5):
+        spheres.rx[i] += 5 * comm.rank
+    if comm.rank == 1:
+        spheres.rx[3] = 9.7  # close to the wrap plane
+        spheres.rx[4] = 10.2 # crossed the wrap plane
+    domain = slabs.constructDomain(comm, [spheres])
+    domain.exchange(ghostWidth=1.0)
+
+    ids = sorted(spheres.id[i] for i in range(spheres.capacity) if spheres.alive[i])
+    if comm.rank == 0:
+        assert ids == [0, 1, 2, 3, 4, 9]
+        i = [i for i in range(spheres.capacity) if spheres.alive[i] and spheres.id[i] == 9][0]
+        assert spheres.rx[i] == pytest.approx(0.2)
+        # ghosts across the wrap plane come from rank 1, shifted down
+        ghosts = domain.boundaryPlanes[1].ghostPCs[spheres.name]
+        assert ghosts.size == 1 and ghosts.id[0] == 8
+        assert ghosts.rx[0] == pytest.approx(-0.3)
+    else:
+        assert ids == [5, 6, 7, 8]
+        ghosts = domain.boundaryPlanes[1].ghostPCs[spheres.name]
+        assert sorted(ghosts.id[i] for i in range(ghosts.size)) == [0, 9]
+        assert sorted(ghosts.rx[i] for i in range(ghosts.size)) == pytest.approx([10.2, 10.5])
+
+    domain.refreshGhostPositions()
+    if comm.rank == 0:
+        assert domain.boundaryPlanes[1].ghostPCs[spheres.name].rx[0] == pytest.approx(-0.3)
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
@@ -0,0 +1,54 @@
+import sys
+sys.path.insert(0,'.')
+
+import numpy as np
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.profiler import profiler
+from mpitoy import Spheres, MIXED_PRECISION
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+def exchangedBytes(precision):
+    profiler.reset()
+    profiler.enable()
+    try:
+        spheres = Spheres(200, name='spheres_precision', id0=200 * comm.rank, precision=precision, vectors=True)
+        for i in range(200):
+            spheres.rx[i] = 0.025 * i + 5 * comm.rank
+            spheres.vx[i] = 1 / 3
+        domain = ParallelSlabs(points=[[5, 0, 0]], n=[1, 0, 0]).constructDomain(comm, [spheres])
+        domain.exchange(ghostWidth=2.0)
+        domain.addChannel(spheres, [[0, 1, 2]], arrays=['vx'])
+        channel = domain.setupChannels()[0][0]
+        channel()
+        domain.free()
+    finally:
+        profiler.disable()
+    report = profiler.report(comm)
+    profiler.reset()
+    return spheres, channel, domain, report['counters']['ghosts:spheres_precision:0->1']['bytes']['sum']
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """Mixed precision containers keep their precision across ranks, and the messages shrink."""
+    assert comm.size == 2
+    spheres, channel, domain, mixedBytes = exchangedBytes(MIXED_PRECISION)
+    ghosts = domain.boundaryPlanes[0].ghostPCs['spheres_precision']
+    assert ghosts.v.dtype() == np.float32 and ghosts.radius.dtype() == np.float32
+    assert ghosts.vx[0] == float(np.float32(1 / 3))
+    assert ghosts.rx.dtype() == np.float64
+    assert [spheres.vx[i] for i in channel.elements_recv] == 3 * [float(np.float32(1 / 3))]
+    doubleBytes = exchangedBytes(None)[3]
+    assert mixedBytes < 0.85 * doubleBytes
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
@@ -0,0 +1,41 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.profiler import profiler
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """Messages are counted per boundary plane and container, and reduced over the ranks."""
+    profiler.reset()
+    profiler.enable()
+    try:
+        slabs = ParallelSlabs([[4, 0, 0]], n=[1, 0, 0])
+        planes = slabs.decompose(comm)
+        spheres = Spheres(5 if comm.rank == 0 else 0, name='spheres_profiled')
+        for bp in planes:
+            bp.findLeavingParticles(spheres, comm=comm)
+        report = profiler.report(comm)
+    finally:
+        profiler.disable()
+    assert report['times']['wait']['calls']['min'] == 1
+    # pickling is timed apart from the communication
+    assert report['times']['pack']['calls']['min'] >= 1
+    assert report['times']['unpack']['calls']['min'] >= 1
+    counters = report['counters']
+    assert counters['leaving:spheres_profiled:0->1']['messages']['sum'] == 1
+    assert counters['leaving:spheres_profiled:1->0']['bytes']['max'] > 0
+    profiler.reset()
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
@@ -0,0 +1,37 @@
+import sys
+sys.path.insert(0,'.')
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.packing import addSpheres
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+def test_nearest_image():
+    """In the slabs [0,8) and [8,10) with period 10, the particle nearest to 7.9 is the image of
+    the particle at 0.1 across the wrap plane, on the rank that owns the centre."""
+    assert comm.size == 2
+    slabs = ParallelSlabs(points=[[8, 0, 0], [10, 0, 0]], n=[1, 0, 0], period=10)
+    spheres = Spheres(0, name='spheres_query_image')
+    if comm.rank == 0:
+        addSpheres(spheres, [[0.1, 0.5, 0.5], [4.0, 0.5, 0.5]], ids=[1, 2], radius=0.5)
+    domain = slabs.constructDomain(comm, [spheres])
+    result = domain.queryNearest(spheres, [7.9, 0.5, 0.5], 1) if comm.rank == 0 else domain.queryNearest(spheres)
+    if comm.rank == 0:
+        assert result['records']['id'].tolist() == [1]
+        assert result['distances'] == pytest.approx([2.2])
+        assert result['ranks'].tolist() == [0]
+    else:
+        assert result is None
+    domain.free()
+
+
+if __name__ == "__main__":
+    test_nearest_image()
+    mprint('-*# finished #*-')
@@ -0,0 +1,93 @@
+import sys
+sys.path.insert(0,'.')
+
+import numpy as np
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.packing import cubicLattice, addSpheres
+from mpitoy.profiler import profiler
+from mpitoy.query import Box, Sphere, Slab, Nearest
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+def lattice(name, period=None):
+    """A 9x3x3 lattice with spacing 1 in slabs [0,3), [3,6), [6,9) along x."""
+    slabs = ParallelSlabs(points=[[3, 0, 0], [6, 0, 0]] + ([[9, 0, 0]] if period else []), n=[1, 0, 0], period=period)
+    spheres = Spheres(0, name=name)
+    positions, ids = cubicLattice(1.0, [0, 0, 0], [9, 3, 3], boundaryPlanes=slabs.decompose(comm))
+    addSpheres(spheres, positions, ids=ids, radius=0.5)
+    allPositions, allIds = cubicLattice(1.0, [0, 0, 0], [9, 3, 3])
+    return slabs.constructDomain(comm, [spheres]), spheres, allPositions, allIds
+
+
+@pytest.mark.mpi(min_size=3)
+def test():
+    """Queries from every rank match a brute force search over all particles."""
+    assert comm.size == 3
+    domain, spheres, positions, ids = lattice('spheres_query')
+    center = np.array([2.5 + comm.rank, 1.0, 1.0])
+    queries = [ Box([2.1, 0, 0], [6.5, 1, 1]), Sphere(center, 1.2), Slab([0, 0, 1], [0, 0, 1], 0.5)
+              , Slab([4.5, 0, 0], [1, 0, 0], 1.0), Nearest(center, 5), Nearest([20, 1, 1], 2) ]
+    box, sphere, slabz, slabx, nearest, far = domain.query(spheres, queries, arrays=['id', 'rx'])
+
+    def inBox(lo, hi):
+        return ids[np.all((positions >= lo) & (positions <= hi), axis=1)]
+    assert sorted(box['records']['id'].tolist()) == sorted(inBox([2.1, 0, 0], [6.5, 1, 1]).tolist())
+    assert set(box['ranks'].tolist()) == {0, 1, 2} and box['records'].dtype.names == ('id', 'rx')
+    d = np.linalg.norm(positions - center, axis=1)
+    assert sorted(sphere['records']['id'].tolist()) == sorted(ids[d <= 1.2].tolist())
+    assert np.all(np.diff(sphere['distances']) >= 0)
+    assert sorted(slabz['records']['id'].tolist()) == sorted(ids[np.abs(positions[:, 2] - 1) <= 0.5].tolist())
+    assert sorted(slabx['records']['id'].tolist()) == sorted(ids[np.abs(positions[:, 0] - 4.5) <= 1.0].tolist())
+    assert nearest['distances'].tolist() == pytest.approx(np.sort(d)[:5].tolist())
+    dFar = np.linalg.norm(positions - [20, 1, 1], axis=1)
+    assert far['distances'].tolist() == pytest.approx(np.sort(dFar)[:2].tolist())
+    domain.free()
+
+
+@pytest.mark.mpi(min_size=3)
+def test_contacted():
+    """A query is only sent to the ranks whose slab it intersects."""
+    assert comm.size == 3
+    domain, spheres, positions, ids = lattice('spheres_query_contacted')
+    profiler.reset()
+    profiler.enable()
+    try:
+        result = domain.querySphere(spheres, [0.5, 1, 1], 1.0) if comm.rank == 2 else domain.querySphere(spheres)
+        report = profiler.report(comm)
+    finally:
+        profiler.disable()
+        profiler.reset()
+    counters = report['counters']
+    assert counters['query:spheres_query_contacted:2->0']['messages']['sum'] == 1
+    assert counters['query:spheres_query_contacted:0->2']['messages']['sum'] == 1
+    assert not 'query:spheres_query_contacted:2->1' in counters
+    if comm.rank == 2:
+        assert result['ranks'].tolist() == 4 * [0]
+    else:
+        assert result is None
+    domain.free()
+
+
+@pytest.mark.mpi(min_size=3)
+def test_periodic():
+    """Queries across the wrap plane find the periodic images, with the distance to the nearest image."""
+    assert comm.size == 3
+    domain, spheres, positions, ids = lattice('spheres_query_periodic', period=9)
+    result = domain.queryNearest(spheres, [0.1, 0.5, 0.5], 4)
+    assert result['distances'].tolist() == pytest.approx([0.4, 0.6, np.sqrt(1.16), np.sqrt(1.16)])
+    assert result['records']['rx'][1] == 8.5 and result['ranks'][1] == 2
+    result = domain.queryBox(spheres, [-1.5, 0, 0], [0.5, 0.5, 0.5])
+    assert sorted(result['records']['rx'].tolist()) == [0.5, 7.5, 8.5]
+    domain.free()
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
@@ -0,0 +1,37 @@
+import sys
+sys.path.insert(0,'.')
+
+import os
+import tempfile
+
+from mpitoy import benchmark
+from mpitoy.regression.__main__ import main
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+def test():
+    """Running the benchmarks of a baseline again under mpirun; all ranks obtain the exit code."""
+    directory = comm.bcast(tempfile.mkdtemp() if comm.rank == 0 else None, root=0)
+    baseline = os.path.join(directory, 'baseline.json')
+    benchmark.save(benchmark.run(comm, repeat=2, scale=0.01, groups=['pcsendrecv']), baseline, comm)
+    comm.Barrier()
+    assert main([baseline, '--threshold', '100']) == 0
+    # a baseline that was much faster
+    if comm.rank == 0:
+        results = benchmark.load(baseline)
+        for entry in results['benchmarks'].values():
+            entry['seconds'] = [1e-9 * s for s in entry['seconds']]
+        benchmark.save(results, baseline, comm)
+    comm.Barrier()
+    assert main([baseline]) == 1
+
+
+if __name__ == "__main__":
+    test()
+    mprint('-*# finished #*-')
@@ -0,0 +1,56 @@
+import sys
+sys.path.insert(0,'.')
+
+import numpy as np
+
+from mpitoy.domaindecomposition import ParallelSlabs
+from mpitoy.particlecontainer import VectorArray
+from mpitoy import Spheres
+from mpitoy.mprint import mprint
+
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+
+import pytest
+
+
+@pytest.mark.mpi(min_size=2)
+@pytest.mark.parametrize('exchangeMode', ['p2p', 'rma'])
+def test(exchangeMode):
+    """Spheres with VectorArrays cross the wrap plane of a periodic decomposition, and are ghosted."""
+    assert comm.size == 2
+    slabs = ParallelSlabs(points=[[5, 0, 0], [10, 0, 0]], n=[1, 0, 0], period=10)
+    spheres = Spheres(5, name=f'spheres_vectors_{exchangeMode}', id0=5 * comm.rank, vectors=True)
+    spheres.r.data[:5, 0] += 5 * comm.rank
+    if comm.rank == 1:
+        spheres.rx[3] = 9.7  # close to the wrap plane
+        spheres.rx[4] = 10.2 # crossed the wrap plane
+    domain = slabs.constructDomain(comm, [spheres], exchangeMode=exchangeMode)
+    domain.exchange(ghostWidth=1.0)
+
+    ghosts = domain.boundaryPlanes[1].ghostPCs[spheres.name]
+    assert isinstance(ghosts.r, VectorArray)
+    if comm.rank == 0:
+        i = spheres.lookup(9) if spheres.idIndex else [i for i in range(spheres.capacity) if spheres.alive[i] and spheres.id[i] == 9][0]
+        assert spheres.r[i].tolist() == pytest.approx([0.2, 0.5, 0.5])
+        assert ghosts.size == 1 and ghosts.r[0].tolist() == pytest.approx([-0.3, 0.5, 0.5])
+    else:
+        assert sorted(ghosts.rx[i] for i in range(ghosts.size)) == pytest.approx([10.2, 10.5])
+
+    # move the ghosted particles, and refresh the ghost positions
+    spheres.r.data[np.flatnonzero(spheres.alive), 1] += 1.0
+    domain.refreshGhostPositions()
+    assert [ghosts.ry[i] for i in range(ghosts.size)] == pytest.approx(ghosts.size * [1.5])
+
+    # a component is sent as a scalar array
+    domain.addChannel(spheres, [[0], []], arrays=['vx'])
+    channel = domain.setupChannels()[0][0]
+    spheres.vx[0] = 1.0 + comm.rank
+    channel()
+    assert [spheres.vx[i] for i in channel.elements_recv] == [2.0 - comm.rank]
+    domain.free()
+
+
+if __name__ == "__main__":
+    test('p2p')
+    mprint('-*# finished #*-')